@@ -7,6 +7,8 @@ sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
 from src.core import interface
 import config as conf
 
+interface.init()
+
 # if len(sys.argv) == 2:
 #     interface.tractor(int(sys.argv[1]))
 
@@ -16,6 +18,12 @@ import config as conf
 # def tractor_brick(bricknum):
 #     # make the thing
 bricknum = int(sys.argv[1])
+
+# With a last brick too, run the whole range through one shared pool
+if len(sys.argv) == 3:
+    interface.farm_bricks(range(bricknum, int(sys.argv[2])+1), stages=('make_models', 'force_models'))
+    sys.exit()
+
 interface.make_models(bricknum)
 
 # force it
@@ -8,9 +8,19 @@ CONSOLE_LOGGING_LEVEL = 'DEBUG'																# VERBOSE console level ('INFO',
 LOGFILE_LOGGING_LEVEL = None																	# VERBOSE logfile level (same options, but can also be None)
 PLOT = 0																		# Plot level (0 to 3)
 NTHREADS = 8															# Number of threads to run on (0 is serial)
+SHARED_BRICK_MEMORY = False												# Workers read the brick from read-only memmaps in INTERIM_DIR and only receive blob ids
+CHECKPOINT_BLOBS = False												# Finished blobs are appended to INTERIM_DIR, so an interrupted brick resumes where it stopped
+BLOB_TIMING = True														# Stage timings, optimizer steps and peak memory of each blob go to CATALOG_DIR as B{id}_{stage}_TIMING.cat
+BLOB_DISPATCH = 'cost'													# Order blobs go to the pool: 'cost' (largest first, by box pixels x sources x bands) or 'id'
+FARM_BRICKS_IN_FLIGHT = 2												# Bricks driven at once by farm_bricks, whose blobs all share one NTHREADS pool
+BRICK_NTHREADS = 0														# Processes cutting bricks from memory-mapped mosaics (0 keeps the in-memory serial path)
+BRICK_MEMORY_LIMIT = 4000												# Cap (MB) on the brick cut-outs held at once by the BRICK_NTHREADS processes
+EFFAREA_NTHREADS = 0													# Processes estimating effective areas from the interim segmentation maps (0 is serial)
 OVERWRITE = True																				# Overwrite existing files without warning?
 USE_CERES = False
 OUTPUT = True
+CATALOG_CHUNK_SIZE = 10000												# Rows converted at a time when catalogs are written or filled in place
+PREALLOCATE_BAND_COLUMNS = False										# The first band inserted into a brick catalog also reserves (zeroed) columns for the other BANDS, so later ones are filled in place
 
 ##### FILE LOCATION #####
 WORKING_DIR = '/Users/jweaver/Projects/Current/Farmer_GalSim/'
@@ -77,6 +87,8 @@ PRFMAP_PIXEL_SCALE_ORIG = 0.150
 PRFMAP_FORCE_SIZE = 0
 PRFMAP_MASKRAD = 25/2.
 PSF_RADIUS = 0 #80.5 #px
+PSF_CACHE_SIZE = 512																			# Preprocessed PSFs kept per process, keyed by band and node (0 turns it off)
+PRF_STORE_SIZE = 2048																			# PRF images kept per process once read and resampled, keyed by band and node (0 turns it off)
 PSFVAR_NSNAP = 9 	
 
 PSFGRID = [	]
@@ -138,6 +150,8 @@ USE_SEP_INITIAL_FLUX = True
 
 ##### DECISION TREE #####																			# Use BIC instead of Chi2 in decision tree
 DECISION_TREE = 1
+EARLY_EXIT = False														# Settle sources right after the PointSource fit when no later model could overturn it
+EARLY_EXIT_CHISQ_FLOOR = 0.8											# Lowest reduced chi2 any later model is assumed to reach (anything less over-fits the noise)
 	
 ### OPTION 1		
 PS_SG_THRESH1 = 0.3																	# Threshold which PS-models must beat to avoid tree progression
@@ -158,6 +172,7 @@ FREEZE_FORCED_POSITION = True
 USE_FORCE_POSITION_PRIOR = True
 FORCE_POSITION_PRIOR_SIG = 0.3 * 0.15 # arcsec   #'AUTO'
 FREEZE_FORCED_SHAPE = True
+FORCE_LINEAR_SOLVE = True																		# With frozen positions and shapes, solve the fluxes in one weighted least-squares step
 USE_FORCE_SHAPE_PRIOR = False
 FORCE_REFF_PRIOR_SIG = 0 #arcsec
 # FORCE_EE_PRIOR_SIG = 0 #arcsec
@@ -228,6 +243,9 @@ MAKE_RESIDUAL_IMAGE = True																	# If True, a residual image will be m
 RESIDUAL_CHISQ_REJECTION = 1E31
 RESIDUAL_NEGFLUX_REJECTION = True  
 RESIDUAL_AB_REJECTION = None 																		# Otherwise set to None
+MODEL_TILE_SIZE = 0																				# Model images are rendered in tiles this wide (px), each with its local PSF (0 renders the brick at once)
+MODEL_TILE_NTHREADS = 0																			# Processes rendering the model image tiles (0 is serial)
 
 SPARSE_SIZE = 1000																				# Threshold of square pixel area above which SPARSE_THRESH Will be applied.
-SPARSE_THRESH = 0.85																			# If number of maksed pixels in a blob exceeds this value, it will be skipped
\ No newline at end of file
+SPARSE_THRESH = 0.85																			# If number of maksed pixels in a blob exceeds this value, it will be skipped
+BLOB_DENSITY_LIMIT = 0																			# Blobs with more sources per px2 than this are skipped (0 turns it off)
\ No newline at end of file
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Benchmark of blob construction (Brick.make_blob) against the number of blobs in a brick.
+
+The blob index (Brick.index_blobs) is built once per brick, after which each blob only
+touches its own bounding box (Brick.get_blob_slice). The brick keeps the same size while
+the number of blobs grows, and the time to look up and build a blob is compared with
+that of the sparsest brick: it should stay flat.
+
+Usage (from the repository root):
+    python -m src.benchmarks.blob_index [n_sample]
+
+Known Issues
+------------
+None
+
+
+"""
+
+import sys
+import time
+import numpy as np
+
+from .synthetic import make_synthetic_brick
+
+
+def time_make_blob(brick, blob_ids):
+    """ Mean wall time (s) to build each blob, excluding the one-off index """
+    brick.index_blobs()
+    tstart = time.time()
+    for blob_id in blob_ids:
+        brick.make_blob(blob_id)
+    return (time.time() - tstart) / len(blob_ids)
+
+
+def time_blob_slice(brick, blob_ids):
+    """ Mean wall time (s) to look up each blob in the index, checked against the blobmap """
+    brick.index_blobs()
+    tstart = time.time()
+    slices = [brick.get_blob_slice(blob_id) for blob_id in blob_ids]
+    t_slice = (time.time() - tstart) / len(blob_ids)
+    for blob_id, (blob_slice, npix) in zip(blob_ids, slices):
+        assert np.sum(brick.blobmap[blob_slice] == blob_id) == npix == np.sum(brick.blobmap == blob_id), f'Blob #{blob_id} is not in its slice!'
+    return t_slice
+
+
+def run(n_blobs_list=(100, 400, 1600, 6400), n_sample=200, shape=(2200, 2200)):
+
+    print(f'Brick of {shape[1]}x{shape[0]}px; timing {n_sample} blobs per setting.')
+    print(f'{"N_BLOBS":>8} {"INDEX [ms]":>11} {"SLICE [us]":>11} {"MAKE_BLOB [ms]":>15} {"vs FIRST":>9}')
+    results = []
+    for n_blobs in n_blobs_list:
+        brick = make_synthetic_brick(n_blobs=n_blobs, shape=shape)
+        blob_ids = np.linspace(1, n_blobs, min(n_sample, n_blobs)).astype(int)
+
+        tstart = time.time()
+        brick.index_blobs()
+        t_index = time.time() - tstart
+
+        t_slice = time_blob_slice(brick, blob_ids)
+        t_blob = time_make_blob(brick, blob_ids)
+        results.append((n_blobs, t_index, t_slice, t_blob))
+        print(f'{n_blobs:8d} {1E3*t_index:11.3f} {1E6*t_slice:11.3f} {1E3*t_blob:15.3f} {t_blob / results[0][3]:8.2f}x')
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(n_sample=int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Benchmark of merging per-blob results back into the brick catalog (utils.merge_catalog).
+
+The catalog is indexed by source_id once and every column is scattered as a whole array,
+so the merge time should grow linearly with the number of sources. Bricks of 10k, 50k and
+100k sources are merged, and the time per source is compared with that of the smallest.
+Every merged row is checked against the blob output with match_rows.
+
+Usage (from the repository root):
+    python -m src.benchmarks.catalog_merge [n_sources ...]
+
+Known Issues
+------------
+None
+
+
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from astropy.table import Table, Column
+
+if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+from src.core.utils import match_rows, merge_catalog
+
+
+def make_catalogs(n_sources, n_cols=40, n_aper=5, seed=1234):
+    """ Brick catalog with empty result columns, plus the shuffled per-blob output to merge into it """
+    rng = np.random.RandomState(seed)
+    catalog = Table()
+    catalog['source_id'] = np.arange(1, n_sources+1)
+    catalog['blob_id'] = rng.randint(1, n_sources // 2 + 2, n_sources)
+    for i in np.arange(n_cols):
+        catalog.add_column(Column(length=n_sources, dtype=float, shape=(1,), name=f'COL{i}'))
+    catalog.add_column(Column(length=n_sources, dtype=float, shape=(n_aper,), name='FLUX_APER'))
+
+    output_cat = Table()
+    output_cat['source_id'] = rng.permutation(catalog['source_id'])
+    output_cat['blob_id'] = catalog['blob_id'][output_cat['source_id'] - 1]
+    for i in np.arange(n_cols):
+        output_cat[f'COL{i}'] = rng.standard_normal(n_sources)
+    output_cat['FLUX_APER'] = rng.standard_normal((n_sources, n_aper))
+
+    return catalog, output_cat
+
+
+def time_merge(catalog, output_cat):
+    tstart = time.time()
+    merge_catalog(catalog, output_cat)
+    return time.time() - tstart
+
+
+def check_merge(catalog, output_cat):
+    """ Every row of the output is where match_rows puts it, with all of its columns """
+    idx, found = match_rows(catalog['source_id'], output_cat['source_id'])
+    assert found.all(), 'Sources went missing!'
+    for colname in output_cat.colnames:
+        merged = np.reshape(catalog[colname][idx], np.shape(output_cat[colname]))
+        assert np.array_equal(merged, output_cat[colname]), f'{colname} was not merged!'
+
+
+def run(n_sources_list=(10000, 50000, 100000)):
+
+    print(f'{"N_SOURCES":>10} {"MERGE [s]":>10} {"PER SRC [us]":>13} {"vs FIRST":>9}')
+    results = []
+    for n_sources in n_sources_list:
+        catalog, output_cat = make_catalogs(n_sources)
+        t_merge = time_merge(catalog, output_cat)
+        check_merge(catalog, output_cat)
+        results.append((n_sources, t_merge))
+        per_source = t_merge / n_sources
+        print(f'{n_sources:10d} {t_merge:10.3f} {1E6*per_source:13.3f} {per_source * results[0][0] / results[0][1]:8.2f}x')
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run([int(arg) for arg in sys.argv[1:]])
+    else:
+        run()
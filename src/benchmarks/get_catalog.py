@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Micro-benchmark of writing the blob results into its catalog (Blob.get_catalog).
+
+A blob with many sources (a mix of point sources and exponential galaxies) and many bands is
+set up with made-up solutions, and its catalog is filled by Blob.get_catalog. Gathering the
+values of every source (Blob.catalog_row) is timed on its own, so that what is left is the
+cost of writing the columns. The filled catalog is checked against the gathered values.
+
+Usage (from the repository root):
+    python -m src.benchmarks.get_catalog [n_sources] [n_bands]
+
+Known Issues
+------------
+The config is changed before the pipeline is imported, so run it in its own process.
+
+
+"""
+
+import os
+import sys
+import time
+import logging
+import numpy as np
+from astropy.table import Table, Column
+
+if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+import config as conf
+
+
+def setup_config(n_bands):
+    """ Bands, zeropoints and flags must be set before src.core is imported """
+    bands = [f'band{i}' for i in range(n_bands)]
+    conf.BANDS = bands
+    conf.RAWBANDS = list(bands)
+    conf.MULTIBAND_ZPT = [23.9,] * n_bands
+    conf.FREEZE_FORCED_POSITION = False
+    conf.FREEZE_FORCED_SHAPE = False
+    return bands
+
+
+def make_blob(n_sources, bands, seed=1234):
+    """ Blob with a made-up forced solution for every source, and an empty catalog to write it into """
+    from tractor import PixPos, Fluxes, PointSource
+    from tractor.galaxy import ExpGalaxy
+    from tractor.ellipses import EllipseESoft
+    from src.core.blob import Blob
+
+    rng = np.random.RandomState(seed)
+    n_bands = len(bands)
+    blob = Blob.__new__(Blob)
+    blob.logger = logging.getLogger('farmer.benchmark')
+    blob.bands = bands
+    blob.n_bands = n_bands
+    blob.n_sources = n_sources
+    blob.images = np.zeros((n_bands, 100, 100))
+    blob.subvector = np.array([10, 10])
+    blob.mosaic_origin = np.array([0, 0])
+    blob.wcs = None
+    blob.n_converge = 5
+    blob.early_exit = np.zeros(n_sources, dtype=bool)
+    for attr in ('solution_chisq', 'solution_bic', 'norm', 'chi_mu', 'chi_sig', 'k2', 'seg_rawflux', 'chisq_nomodel'):
+        setattr(blob, attr, rng.uniform(0.5, 2, (n_sources, n_bands)))
+
+    catalog, variance = [], []
+    for i in range(n_sources):
+        pos = PixPos(*rng.uniform(5, 95, 2))
+        flux = Fluxes(**dict(zip(bands, rng.uniform(1, 100, n_bands))), order=bands)
+        if i % 2:
+            src = ExpGalaxy(pos, flux, EllipseESoft.fromRAbPhi(rng.uniform(1, 3), rng.uniform(0.3, 1), rng.uniform(0, 180)))
+        else:
+            src = PointSource(pos, flux)
+            src.name = 'PointSource'
+        var = src.copy()
+        var.setParams(rng.uniform(0.01, 0.1, src.numberOfParams()))
+        catalog.append(src)
+        variance.append(var)
+    blob.solution_catalog = catalog
+    blob.forced_variance = blob.parameter_variance = blob.position_variance = variance
+
+    # the columns are whatever the blob writes
+    colnames = []
+    for row, src in enumerate(catalog):
+        colnames += [colname for colname in blob.catalog_row(row, src, multiband_only=True) if colname not in colnames]
+    bcatalog = Table()
+    bcatalog['source_id'] = np.arange(1, n_sources+1)
+    bcatalog['x'] = rng.uniform(5, 95, n_sources)
+    bcatalog['y'] = rng.uniform(5, 95, n_sources)
+    for colname in colnames:
+        if colname.startswith('VALID_SOURCE'):
+            bcatalog.add_column(Column(np.zeros(n_sources, dtype=bool), name=colname))
+        elif colname not in bcatalog.colnames:
+            bcatalog.add_column(Column(np.zeros(n_sources), name=colname))
+    blob.bcatalog = bcatalog
+    return blob
+
+
+def time_gather(blob):
+    tstart = time.time()
+    rows = [blob.catalog_row(row, src, multiband_only=True) for row, src in enumerate(blob.solution_catalog)]
+    return time.time() - tstart, rows
+
+
+def time_columns(blob):
+    tstart = time.time()
+    blob.get_catalog(multiband_only=True)
+    return time.time() - tstart
+
+
+def check_catalog(blob, rows):
+    """ Every gathered value is in its cell """
+    for row, values in enumerate(rows):
+        for colname, value in values.items():
+            assert np.array_equal(np.ravel(blob.bcatalog[colname][row]), np.ravel(value)), f'{colname} of row {row} differs!'
+
+
+def run(n_sources=200, n_bands=10):
+    bands = setup_config(n_bands)
+    blob = make_blob(n_sources, bands)
+
+    t_gather, rows = time_gather(blob)
+    t_columns = time_columns(blob)
+    check_catalog(blob, rows)
+
+    n_cells = np.sum([len(values) for values in rows])
+    print(f'{n_sources} sources x {n_bands} bands ({n_cells} cells in {len(blob.bcatalog.colnames)} columns)')
+    print(f'{"GATHER [s]":>11} {"GET_CATALOG [s]":>16} {"WRITES [s]":>11} {"PER CELL [us]":>14}')
+    print(f'{t_gather:11.3f} {t_columns:16.3f} {t_columns - t_gather:11.3f} {1E6 * (t_columns - t_gather) / n_cells:14.3f}')
+    return t_gather, t_columns
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Synthetic mosaics for offline benchmarking of the full pipeline.
+
+A single detection mosaic and one mosaic per band are written to disk together with PSFs of
+the requested type (constant, PSFGRID or PRFMAP), and the config is pointed at them. Sources
+are placed in groups, so the group size sets how many sources end up sharing a blob.
+
+Nothing here imports the pipeline itself: the config must be set before src.core.interface
+(and with it mosaic, brick and blob) is imported, as many defaults are bound at import time.
+
+Known Issues
+------------
+Only one synthetic setup can be used per process, for the same reason.
+
+
+"""
+
+import os
+import sys
+import numpy as np
+from astropy.io import fits, ascii
+from astropy.table import Table
+from astropy.wcs import WCS
+
+if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+import config as conf
+
+PSF_TYPES = ('constant', 'psfgrid', 'prfmap')
+
+
+def make_wcs(width, height, ra=150.1, dec=2.2, pixel_scale=conf.PIXEL_SCALE):
+    """ Simple TAN projection centered on the image """
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crval = [ra, dec]
+    wcs.wcs.crpix = [width / 2., height / 2.]
+    wcs.wcs.cdelt = [-pixel_scale / 3600., pixel_scale / 3600.]
+    return wcs
+
+
+def gaussian_stamp(sigma, size=51):
+    """ Unit-sum circular Gaussian on an odd-sized grid """
+    rad = size // 2
+    yy, xx = np.mgrid[-rad:rad+1, -rad:rad+1]
+    stamp = np.exp(-0.5 * (xx**2 + yy**2) / sigma**2)
+    return stamp / stamp.sum()
+
+
+def render_gaussians(image, x, y, flux, sigma):
+    """ Adds circular Gaussians to the image in place, stamp by stamp. Sigma may be per source. """
+    height, width = image.shape
+    sigma = sigma * np.ones(len(x))
+    for sx, sy, sflux, ssig in zip(x, y, flux, sigma):
+        rad = int(np.ceil(4 * ssig))
+        ix, iy = int(sx), int(sy)
+        x0, x1 = max(ix - rad, 0), min(ix + rad + 1, width)
+        y0, y1 = max(iy - rad, 0), min(iy + rad + 1, height)
+        if (x1 <= x0) | (y1 <= y0):
+            continue
+        yy, xx = np.mgrid[y0:y1, x0:x1]
+        stamp = np.exp(-0.5 * ((xx - sx)**2 + (yy - sy)**2) / ssig**2)
+        image[y0:y1, x0:x1] += sflux / (2 * np.pi * ssig**2) * stamp
+    return image
+
+
+def make_sources(density=100., group_size=2, shape=(1200, 1200), border=conf.BRICK_BUFFER, group_radius=3.,
+                 pixel_scale=conf.PIXEL_SCALE, rng=None):
+    """ Source positions, fluxes and intrinsic sizes (pixels).
+
+    density is in sources per arcmin^2 over the area inside the border. Sources are drawn
+    in groups of group_size around a common centre, group_radius pixels across (1-sigma).
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    height, width = shape
+    area = (height - 2 * border) * (width - 2 * border) * (pixel_scale / 60.)**2
+    n_groups = max(int(np.round(density * area / group_size)), 1)
+    n_sources = n_groups * group_size
+
+    pad = border + 10
+    cx = rng.uniform(pad, width - pad, n_groups)
+    cy = rng.uniform(pad, height - pad, n_groups)
+
+    sources = Table()
+    sources['group'] = np.repeat(np.arange(n_groups), group_size)
+    sources['x'] = np.clip(np.repeat(cx, group_size) + group_radius * rng.standard_normal(n_sources), pad, width - pad)
+    sources['y'] = np.clip(np.repeat(cy, group_size) + group_radius * rng.standard_normal(n_sources), pad, height - pad)
+    sources['flux'] = 10**rng.uniform(1.5, 3.5, n_sources)
+    sources['size'] = rng.uniform(0., 2., n_sources) * (rng.uniform(size=n_sources) > 0.3) # ~30% point-like
+    return sources
+
+
+def write_psfex(path, stamp):
+    """ Writes a stamp as a constant (degree 0) PSFEx model """
+    ny, nx = stamp.shape
+    col = fits.Column(name='PSF_MASK', format=f'{stamp.size}E', dim=f'({nx}, {ny}, 1)',
+                      array=stamp[None, None, :, :].astype(np.float32))
+    hdu = fits.BinTableHDU.from_columns([col], name='PSF_DATA')
+    for key, value in (('LOADED', 1), ('ACCEPTED', 1), ('CHI2', 1.0),
+                       ('POLNAXIS', 2), ('POLGRP1', 1), ('POLNAME1', 'X_IMAGE'), ('POLZERO1', 0.), ('POLSCAL1', 1.),
+                       ('POLGRP2', 1), ('POLNAME2', 'Y_IMAGE'), ('POLZERO2', 0.), ('POLSCAL2', 1.),
+                       ('POLNGRP', 1), ('POLDEG1', 0), ('PSF_FWHM', 2.3548), ('PSF_SAMP', 1.0),
+                       ('PSFNAXIS', 3), ('PSFAXIS1', nx), ('PSFAXIS2', ny), ('PSFAXIS3', 1)):
+        hdu.header[key] = value
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(path, overwrite=True)
+
+
+def write_psfs(workdir, bands, psf_sigmas, wcs, shape, psf_type='constant', grid_step=200, rng=None):
+    """ Writes the PSFs for each band and points the config at them """
+    if psf_type not in PSF_TYPES:
+        raise ValueError(f'{psf_type} is not a known PSF type! ({PSF_TYPES})')
+    if rng is None:
+        rng = np.random.RandomState()
+    height, width = shape
+    gx, gy = np.meshgrid(np.arange(grid_step // 2, width, grid_step), np.arange(grid_step // 2, height, grid_step))
+    gx, gy = gx.flatten(), gy.flatten()
+    gra, gdec = wcs.all_pix2world(gx, gy, 0)
+
+    conf.PSF_DIR = os.path.join(workdir, 'psfmodels')
+    conf.CONSTANT_PSF, conf.PSFGRID, conf.PRFMAP_PSF = [], [], []
+    conf.PRFMAP_GRID_FILENAME, conf.PRFMAP_DIR = {}, {}
+    os.makedirs(conf.PSF_DIR, exist_ok=True)
+
+    for band, sigma in zip(bands, psf_sigmas):
+        if psf_type == 'constant':
+            fits.PrimaryHDU(gaussian_stamp(sigma).astype(np.float32)).writeto(os.path.join(conf.PSF_DIR, f'{band}.fits'), overwrite=True)
+            conf.CONSTANT_PSF.append(band)
+
+        elif psf_type == 'psfgrid':
+            # Slightly different PSF at each grid point, so every point is its own file
+            conf.PSFGRID_OUT_DIR = os.path.join(workdir, 'psfgrid')
+            outdir = os.path.join(conf.PSFGRID_OUT_DIR, f'{band}_OUT')
+            os.makedirs(outdir, exist_ok=True)
+            file_ids = np.array([f'{band}_{i:04d}' for i in np.arange(len(gx))])
+            for file_id in file_ids:
+                write_psfex(os.path.join(outdir, f'{file_id}.psf'), gaussian_stamp(sigma * rng.uniform(0.95, 1.05)))
+            ascii.write(Table([gra, gdec, file_ids], names=('RA', 'Dec', 'FILE_ID')),
+                        os.path.join(outdir, f'{band}_GRIDPT.dat'), overwrite=True)
+            conf.PSFGRID.append(band)
+
+        elif psf_type == 'prfmap':
+            outdir = os.path.join(workdir, 'prfmap', band)
+            os.makedirs(outdir, exist_ok=True)
+            prf_ids = np.arange(1, len(gx) + 1)
+            for prf_idx in prf_ids:
+                fits.PrimaryHDU(gaussian_stamp(sigma * rng.uniform(0.95, 1.05)).astype(np.float32)).writeto(
+                    os.path.join(outdir, f'{conf.PRFMAP_FILENAME}{prf_idx:06d}.fits'), overwrite=True)
+            path_grid = os.path.join(workdir, 'prfmap', f'{band}_grid.dat')
+            ascii.write(Table([prf_ids, gra, gdec], names=conf.PRFMAP_COLUMNS), path_grid, overwrite=True)
+            conf.PRFMAP_GRID_FILENAME[band] = path_grid
+            conf.PRFMAP_DIR[band] = outdir
+            conf.PRFMAP_PSF.append(band)
+
+    # Every grid point is within reach of a blob, and the stamps are already at the pixel scale
+    conf.PSFGRID_MAXSEP = conf.PRFMAP_MAXSEP = 2 * grid_step * conf.PIXEL_SCALE
+    conf.PRFMAP_PIXEL_SCALE_ORIG = conf.PIXEL_SCALE
+    conf.RMBACK_PSF = []
+    conf.PSF_RADIUS = 0
+
+
+def make_synthetic_mosaic(workdir, density=100., group_size=2, n_bands=2, psf_type='constant', size=1200,
+                          noise=1., psf_sigma=1.5, nthreads=0, seed=1234):
+    """ Writes the detection and multiband mosaics, PSFs and output directories under workdir,
+    and sets the config up to run a single brick over them. Returns the input source table. """
+    rng = np.random.RandomState(seed)
+    shape = (size, size)
+    wcs = make_wcs(size, size)
+    header = wcs.to_header()
+    bands = [f'SYN{i}' for i in np.arange(n_bands)]
+    psf_sigmas = psf_sigma * (1 + 0.1 * np.arange(n_bands))
+
+    # One brick covering the whole mosaic, less the buffer
+    conf.MOSAIC_WIDTH = conf.MOSAIC_HEIGHT = size
+    conf.BRICK_WIDTH = conf.BRICK_HEIGHT = size - 2 * conf.BRICK_BUFFER
+    if conf.BRICK_WIDTH <= 0:
+        raise ValueError(f'Mosaic of {size}px is too small for a {conf.BRICK_BUFFER}px brick buffer!')
+
+    for key in ('IMAGE_DIR', 'BRICK_DIR', 'INTERIM_DIR', 'PLOT_DIR', 'CATALOG_DIR', 'LOGGING_DIR'):
+        setattr(conf, key, os.path.join(workdir, key.split('_')[0].lower()))
+        os.makedirs(getattr(conf, key), exist_ok=True)
+
+    conf.IMAGE_EXT, conf.WEIGHT_EXT, conf.MASK_EXT = '', '_weight', '_mask'
+    conf.DETECTION_FILENAME = 'detectionEXT.fits'
+    conf.MULTIBAND_FILENAME = 'BANDEXT.fits'
+    conf.MASTER_MASK = None
+    conf.BANDS = bands
+    conf.RAWBANDS = list(bands)
+    conf.MULTIBAND_ZPT = [23.9,] * n_bands
+    conf.MODELING_ZPT = conf.DETECTION_ZPT = 23.9
+    # Model on a synthetic band rather than a separate modeling mosaic
+    conf.MODELING_BANDS = [bands[0],]
+
+    # Render the sky, band by band, with each band's own PSF width
+    sources = make_sources(density, group_size, shape, rng=rng)
+    detection = np.zeros(shape)
+    for band, sigma in zip(bands, psf_sigmas):
+        image = noise * rng.standard_normal(shape)
+        colour = rng.uniform(0.5, 1.5, len(sources))
+        render_gaussians(image, sources['x'], sources['y'], sources['flux'] * colour,
+                         np.sqrt(sigma**2 + sources['size']**2))
+        detection += image / n_bands
+        fits.PrimaryHDU(image.astype(np.float32), header=header).writeto(
+            os.path.join(conf.IMAGE_DIR, f'{band}.fits'), overwrite=True)
+        fits.PrimaryHDU(np.ones(shape, dtype=np.float32) / noise**2, header=header).writeto(
+            os.path.join(conf.IMAGE_DIR, f'{band}_weight.fits'), overwrite=True)
+
+    fits.PrimaryHDU(detection.astype(np.float32), header=header).writeto(
+        os.path.join(conf.IMAGE_DIR, 'detection.fits'), overwrite=True)
+    fits.PrimaryHDU(n_bands * np.ones(shape, dtype=np.float32) / noise**2, header=header).writeto(
+        os.path.join(conf.IMAGE_DIR, 'detection_weight.fits'), overwrite=True)
+
+    write_psfs(workdir, bands, psf_sigmas, wcs, shape, psf_type=psf_type, rng=rng)
+
+    # Quiet, serial-by-default, and no products beyond the catalog
+    conf.NTHREADS = nthreads
+    conf.OVERWRITE = True
+    conf.OUTPUT = True
+    conf.PLOT = -1
+    conf.NBLOBS = 0
+    conf.CONSOLE_LOGGING_LEVEL = 'WARNING'
+    conf.LOGFILE_LOGGING_LEVEL = None
+    conf.SAVE_BACKGROUND = False
+    conf.USE_STARCATALOG = False
+    conf.MAKE_MODEL_IMAGE = False
+    conf.MAKE_RESIDUAL_IMAGE = False
+    conf.DO_APPHOT = True
+    conf.DO_SEPHOT = True
+
+    return sources
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+End-to-end benchmark of a single brick on synthetic mosaics, fully offline.
+
+Each stage is timed on its own: make_bricks (detection and multiband), detect_sources
+(with Brick.cleanup), make_models and force_models. Within the blob stages, every blob
+and every follow-up photometry call (aperture, SEP, residual) is timed too, and reported
+as latency percentiles. Results can be saved as JSON and compared against a baseline.
+
+This is also the benchmark of the order in which blobs go to the pool (BLOB_DISPATCH). The
+same brick is run once with --blob-dispatch id (blob id order) and saved, then once with
+--blob-dispatch cost (most expensive blobs first, see Brick.blob_costs) and compared against
+it, as in the last two examples below. The make_models and force_models wall times are
+those of the whole brick, so a few large blobs starting late show up there directly.
+Use more than one thread, or the order makes no difference.
+
+Usage (from the repository root):
+    python -m src.benchmarks.pipeline --density 100 --group-size 2 --bands 2 --psf constant --save baseline.json
+    python -m src.benchmarks.pipeline --density 100 --group-size 2 --bands 2 --psf constant --compare baseline.json
+    python -m src.benchmarks.pipeline --nthreads 8 --blob-dispatch id --save by_id.json
+    python -m src.benchmarks.pipeline --nthreads 8 --blob-dispatch cost --compare by_id.json
+
+Known Issues
+------------
+The config is set up before the pipeline is imported, so only one setup can be run per process.
+
+
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from .mosaics import make_synthetic_mosaic, PSF_TYPES
+from .profiling import TimingLog, patch_function, patch_method, peak_rss, summarize
+
+import config as conf
+
+# Per-blob calls that are timed individually, as (class name, method)
+BLOB_METHODS = (('Brick', 'cleanup'),
+                ('Blob', 'stage_images'),
+                ('Blob', 'tractor_phot'),
+                ('Blob', 'forced_phot'),
+                ('Blob', 'aperture_phot'),
+                ('Blob', 'sep_phot'),
+                ('Blob', 'residual_phot'))
+
+
+def run(density=100., group_size=2, n_bands=2, psf_type='constant', size=1200, nthreads=0, seed=1234,
+        workdir=None, keep=False, brick_nthreads=0, blob_dispatch='cost'):
+    """ Runs every stage over one synthetic brick and returns the timings """
+
+    cleanup_workdir = (workdir is None) & (not keep)
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='farmer_bench_')
+
+    tstart = time.time()
+    sources = make_synthetic_mosaic(workdir, density=density, group_size=group_size, n_bands=n_bands,
+                                    psf_type=psf_type, size=size, nthreads=nthreads, seed=seed)
+    t_setup = time.time() - tstart
+    conf.BRICK_NTHREADS = brick_nthreads
+    conf.BLOB_DISPATCH = blob_dispatch
+
+    # Only now can the pipeline be imported
+    from src.core import interface
+    # The synthetic bands are set already, so only the logging is started (no band translation)
+    interface.start_logging()
+    from src.core.brick import Brick
+    from src.core.blob import Blob
+    classes = {'Brick': Brick, 'Blob': Blob}
+
+    log = TimingLog(os.path.join(workdir, 'timing'))
+    patch_function(interface, 'runblob', 'runblob', log)
+    for cls, name in BLOB_METHODS:
+        patch_method(classes[cls], name, f'{cls}.{name}', log)
+
+    stages = (('make_bricks', lambda: interface.make_bricks(image_type=conf.DETECTION_NICKNAME)),
+              ('make_bricks', lambda: interface.make_bricks(image_type=conf.MULTIBAND_NICKNAME, make_new_bricks=True)),
+              ('detect_sources', lambda: interface.detect_sources(1)),
+              ('make_models', lambda: interface.make_models(1)),
+              ('force_models', lambda: interface.force_models(1, band=conf.BANDS)))
+
+    wall = {}
+    tstart_all = time.time()
+    for stage, func in stages:
+        log.set_context(stage)
+        tstart = time.time()
+        func()
+        wall[stage] = wall.get(stage, 0) + time.time() - tstart
+    t_total = time.time() - tstart_all
+
+    rss_self, rss_children = peak_rss()
+    results = {'params': {'density': density, 'group_size': group_size, 'n_bands': n_bands, 'psf_type': psf_type,
+                          'size': size, 'nthreads': nthreads, 'brick_nthreads': brick_nthreads, 'blob_dispatch': blob_dispatch, 'seed': seed, 'n_sources': len(sources)},
+               'setup': t_setup,
+               'wall': wall,
+               'total': t_total,
+               'peak_rss_mb': rss_self,
+               'peak_rss_children_mb': rss_children,
+               'calls': {f'{context}:{stage}': summarize(durations) for (context, stage), durations in sorted(log.read().items())}}
+
+    if cleanup_workdir:
+        shutil.rmtree(workdir)
+    else:
+        print(f'Benchmark products kept in {workdir}')
+
+    return results
+
+
+def report(results, baseline=None):
+    """ Prints the stage and per-call tables, with the ratio to a baseline if given """
+
+    def ratio(new, old):
+        return f'{new/old:7.2f}x' if (old is not None) and (old > 0) else f'{"--":>8}'
+
+    params = results['params']
+    print(f'\n{params["n_sources"]} sources, {params["n_bands"]} bands, {params["psf_type"]} PSF, '
+          f'{params["size"]}px mosaic, NTHREADS = {params["nthreads"]} (setup {results["setup"]:3.3f}s)')
+
+    print(f'\n{"STAGE":<20} {"WALL [s]":>10} {"vs BASE":>8}')
+    for stage, value in list(results['wall'].items()) + [('TOTAL', results['total'])]:
+        old = None
+        if baseline is not None:
+            old = baseline['total'] if stage == 'TOTAL' else baseline['wall'].get(stage)
+        print(f'{stage:<20} {value:10.3f} {ratio(value, old)}')
+
+    print(f'\n{"CALL":<36} {"N":>6} {"TOTAL [s]":>10} {"P50 [ms]":>9} {"P90 [ms]":>9} {"P99 [ms]":>9} {"MAX [ms]":>9} {"P50 vs BASE":>12}')
+    for key, stats in results['calls'].items():
+        old = None
+        if (baseline is not None) and (key in baseline['calls']):
+            old = baseline['calls'][key]['p50']
+        print(f'{key:<36} {stats["n"]:6d} {stats["total"]:10.3f} {1E3*stats["p50"]:9.2f} {1E3*stats["p90"]:9.2f} '
+              f'{1E3*stats["p99"]:9.2f} {1E3*stats["max"]:9.2f} {ratio(stats["p50"], old):>12}')
+
+    print(f'\nPeak RSS: {results["peak_rss_mb"]:.1f} MB (largest worker: {results["peak_rss_children_mb"]:.1f} MB)')
+    if baseline is not None:
+        print(f'Baseline peak RSS: {baseline["peak_rss_mb"]:.1f} MB (largest worker: {baseline["peak_rss_children_mb"]:.1f} MB)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of one brick on synthetic mosaics.')
+    parser.add_argument('--density', type=float, default=100., help='sources per arcmin^2')
+    parser.add_argument('--group-size', type=int, default=2, help='sources per group (sets the blob size)')
+    parser.add_argument('--bands', type=int, default=2, help='number of multiband images')
+    parser.add_argument('--psf', choices=PSF_TYPES, default='constant', help='PSF type')
+    parser.add_argument('--size', type=int, default=1200, help='mosaic width and height (pixels)')
+    parser.add_argument('--nthreads', type=int, default=0, help='NTHREADS for the blob pools')
+    parser.add_argument('--brick-nthreads', type=int, default=0, help='BRICK_NTHREADS for make_bricks (0 is the in-memory serial path)')
+    parser.add_argument('--blob-dispatch', choices=('cost', 'id'), default='cost', help='BLOB_DISPATCH, the order blobs go to the pool')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--workdir', default=None, help='keep the products here (default: temporary, removed)')
+    parser.add_argument('--save', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='compare against results saved with --save')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    results = run(density=args.density, group_size=args.group_size, n_bands=args.bands, psf_type=args.psf,
+                  size=args.size, nthreads=args.nthreads, seed=args.seed, workdir=args.workdir,
+                  brick_nthreads=args.brick_nthreads, blob_dispatch=args.blob_dispatch)
+    report(results, baseline)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.save}')
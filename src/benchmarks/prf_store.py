@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Benchmark of reading PRFs for a brick with many blobs (PRFStore).
+
+A grid of PRF nodes is written to a temporary directory as FITS files, at a coarser pixel
+scale than the images so that each has to be resampled. Every blob of the brick takes its
+nearest node, so most nodes serve many blobs. Each blob then gets its PRF either as
+make_model_image_prfmap used to, opening the FITS file and resampling it every time, or
+from a PRFStore. Both are masked and normalized the same way, and are checked to be equal.
+
+Usage (from the repository root):
+    python -m src.benchmarks.prf_store [n_blobs] [n_nodes]
+
+Known Issues
+------------
+The config is changed before the pipeline is imported, so run it in its own process.
+
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from astropy.io import fits
+from scipy.ndimage import zoom
+
+if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+import config as conf
+
+BAND = 'prfband'
+
+
+def setup_config(prfdir):
+    """ PRFs at 0.15"/px for images at 0.10"/px, so each is zoomed by 1.5 """
+    conf.PRFMAP_DIR = {BAND: prfdir}
+    conf.PRFMAP_FILENAME = 'mosaic_gp'
+    conf.PRFMAP_PIXEL_SCALE_ORIG = 0.15
+    conf.PIXEL_SCALE = 0.10
+    conf.PRFMAP_MASKRAD = 25/2.
+    conf.NORMALIZE_PSF = True
+
+
+def make_prf_grid(prfdir, n_nodes, size=101, seed=1234):
+    """ One Gaussian PRF of random width per node, written as <PRFMAP_FILENAME><node>.fits """
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[:size, :size] - size // 2
+    for prf_idx in range(n_nodes):
+        sigma = rng.uniform(3, 6)
+        img = np.exp(-(x**2 + y**2) / (2 * sigma**2)).astype('float32')
+        pad_prf_idx = ((6 - len(str(prf_idx))) * "0") + str(prf_idx)
+        fits.PrimaryHDU(img).writeto(os.path.join(prfdir, f'{conf.PRFMAP_FILENAME}{pad_prf_idx}.fits'), overwrite=True)
+
+
+def prepare(img):
+    """ Outskirts masked and normalized, as in make_model_image_prfmap """
+    img = img.copy()
+    pw, ph = np.shape(img)
+    y, x = np.ogrid[:pw, :ph]
+    outskirts = np.sqrt((x - ph // 2)**2 + (y - pw // 2)**2) > conf.PRFMAP_MASKRAD / conf.PIXEL_SCALE
+    img[outskirts & (img > 0)] = 0
+    img[(img < 0) | np.isnan(img)] = 0
+    return (img / img.sum()).astype('float32')
+
+
+def read_prf(band, prf_idx):
+    """ The old way: open and resample the PRF for every blob """
+    pad_prf_idx = ((6 - len(str(prf_idx))) * "0") + str(prf_idx)
+    hdul = fits.open(os.path.join(conf.PRFMAP_DIR[band], f'{conf.PRFMAP_FILENAME}{pad_prf_idx}.fits'))
+    img = hdul[0].data
+    img = zoom(img, conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE)
+    if np.shape(img)[0]%2 == 0:
+        img = zoom(img, np.shape(img)[0] / (np.shape(img)[0] + 1))
+    return img
+
+
+def time_reads(nodes):
+    tstart = time.time()
+    prfs = [prepare(read_prf(BAND, prf_idx)) for prf_idx in nodes]
+    return time.time() - tstart, prfs
+
+
+def time_store(store, nodes):
+    tstart = time.time()
+    prfs = [prepare(store.get(BAND, prf_idx)) for prf_idx in nodes]
+    return time.time() - tstart, prfs
+
+
+def run(n_blobs=2000, n_nodes=50, seed=1234):
+    prfdir = tempfile.mkdtemp(prefix='farmer_prf_')
+    try:
+        setup_config(prfdir)
+        make_prf_grid(prfdir, n_nodes, seed=seed)
+        from src.core.blob import PRFStore
+
+        # nearest node of every blob
+        nodes = np.random.RandomState(seed).randint(0, n_nodes, n_blobs)
+        store = PRFStore(size=n_nodes)
+        t_reads, prfs_reads = time_reads(nodes)
+        t_store, prfs_store = time_store(store, nodes)
+        assert np.all([np.array_equal(a, b) for a, b in zip(prfs_reads, prfs_store)]), 'PRFs differ!'
+    finally:
+        shutil.rmtree(prfdir)
+
+    print(f'{n_blobs} blobs over {n_nodes} PRF nodes (store: {store})')
+    print(f'{"PER-BLOB READS [s]":>19} {"STORE [s]":>10} {"SPEED-UP":>9}')
+    print(f'{t_reads:19.3f} {t_store:10.3f} {t_reads / t_store:8.1f}x')
+    return t_reads, t_store
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
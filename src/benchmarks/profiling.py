@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Lightweight stage timers for the pipeline benchmark.
+
+Functions and methods are wrapped in place so that every call appends a line
+(context, stage, blob id, seconds) to a per-process file in the log directory. This works
+the same in serial and under the pathos pools, as the workers inherit the wrappers when
+they fork and write their own files. The context (the top-level stage being run, e.g.
+make_models) is read from the log directory on each call, so that reused workers still
+attribute their calls correctly.
+
+Known Issues
+------------
+Peak RSS comes from getrusage, so it is the high-water mark of the whole process (and of
+its reaped children), not of a single stage.
+
+
+"""
+
+import os
+import glob
+import time
+import resource
+import functools
+import numpy as np
+
+# Originals of wrapped module functions, so that the picklable wrapper can find them again
+_wrapped = {}
+
+
+class TimingLog():
+    """ Per-process timing records under a common directory """
+
+    def __init__(self, logdir):
+        self.logdir = logdir
+        os.makedirs(logdir, exist_ok=True)
+        for fname in glob.glob(os.path.join(logdir, 'timing_*.txt')):
+            os.remove(fname)
+        self.set_context('setup')
+
+    def set_context(self, context):
+        with open(os.path.join(self.logdir, 'context.txt'), 'w') as f:
+            f.write(context)
+
+    def get_context(self):
+        with open(os.path.join(self.logdir, 'context.txt'), 'r') as f:
+            return f.read().strip()
+
+    def record(self, stage, blob_id, duration):
+        with open(os.path.join(self.logdir, f'timing_{os.getpid()}.txt'), 'a') as f:
+            f.write(f'{self.get_context()} {stage} {blob_id} {duration:.6f}\n')
+
+    def read(self):
+        """ All records as {(context, stage): array of seconds} """
+        records = {}
+        for fname in glob.glob(os.path.join(self.logdir, 'timing_*.txt')):
+            with open(fname, 'r') as f:
+                for line in f:
+                    context, stage, __, duration = line.split()
+                    records.setdefault((context, stage), []).append(float(duration))
+        return {key: np.array(value) for key, value in records.items()}
+
+
+class Timed():
+    """ Stand-in for a module-level function. Picklable (by module and name), so it can be
+    shipped to the worker pools inside a functools.partial. """
+
+    def __init__(self, module, name, stage, log):
+        self.module, self.name, self.stage, self.log = module.__name__, name, stage, log
+        _wrapped[(self.module, self.name)] = getattr(module, name)
+
+    def __call__(self, *args, **kwargs):
+        tstart = time.time()
+        try:
+            return _wrapped[(self.module, self.name)](*args, **kwargs)
+        finally:
+            blob_id = args[0] if len(args) > 0 else kwargs.get('blob_id', -1)
+            self.log.record(self.stage, blob_id, time.time() - tstart)
+
+
+def patch_function(module, name, stage, log):
+    """ Replaces module.name by a timed wrapper """
+    setattr(module, name, Timed(module, name, stage, log))
+
+
+def patch_method(cls, name, stage, log):
+    """ Replaces cls.name by a timed wrapper. The blob id is taken from the instance, if it has one. """
+    method = getattr(cls, name)
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        tstart = time.time()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            log.record(stage, getattr(self, 'blob_id', -1), time.time() - tstart)
+
+    setattr(cls, name, timed)
+
+
+def peak_rss():
+    """ Peak resident set size (MB) of this process, and of its largest reaped child """
+    # ru_maxrss is in kilobytes on Linux
+    rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.
+    return rss_self, rss_children
+
+
+def summarize(durations):
+    """ Count, total and latency percentiles (s) of a set of timings """
+    return {'n': int(len(durations)),
+            'total': float(np.sum(durations)),
+            'p50': float(np.percentile(durations, 50)),
+            'p90': float(np.percentile(durations, 90)),
+            'p99': float(np.percentile(durations, 99)),
+            'max': float(np.max(durations))}
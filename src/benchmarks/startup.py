@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Benchmark of the start-up cost of the interface: the import itself, interface.init(), and the
+overhead of each new pool worker that has to import it.
+
+Importing the interface used to print the banner, start the logging and translate the bands.
+That now happens in interface.init(), so the old cost of an import is import + init. Both are
+timed in a fresh interpreter each time. For the workers, a pool of spawned processes imports
+the interface, once as is and once also running init() as the old import did, and every
+worker reports how long that took.
+
+Usage (from the repository root):
+    python -m src.benchmarks.startup --repeats 5 --workers 8
+    python -m src.benchmarks.startup --repeats 5 --workers 8 --method forkserver
+
+Known Issues
+------------
+Under fork (the pathos default on Linux) the workers inherit the loaded modules, so the
+import cost only shows up with spawn or forkserver.
+
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing as mp
+import numpy as np
+
+# Times one import (and init) in a fresh interpreter
+IMPORT_SNIPPET = """
+import sys, os, time, json
+sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+tstart = time.time()
+from src.core import interface
+t_import = time.time() - tstart
+tstart = time.time()
+interface.init(banner=False)
+t_init = time.time() - tstart
+print(json.dumps({'import': t_import, 'init': t_init}))
+"""
+
+_worker_startup = None
+_barrier = None
+
+
+def _start_worker(run_init, barrier):
+    global _worker_startup, _barrier
+    tstart = time.time()
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+    from src.core import interface
+    if run_init:
+        interface.init(banner=False)
+    _worker_startup = time.time() - tstart
+    _barrier = barrier
+
+
+def _report_startup(i):
+    # Every worker has to hold a task at once, so each reports exactly once
+    _barrier.wait()
+    return _worker_startup
+
+
+def time_import(repeats=5):
+    """ Import and init times (s), each in a new interpreter """
+    times = {'import': [], 'init': []}
+    for i in range(repeats):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().split('\n')[-1])
+        for key in times:
+            times[key].append(result[key])
+    return {key: np.array(value) for key, value in times.items()}
+
+
+def time_workers(n_workers=4, run_init=False, method='spawn'):
+    """ Wall time until a pool of n_workers is up and running, and the start-up time of each worker (s) """
+    ctx = mp.get_context(method)
+    barrier = ctx.Barrier(n_workers)
+    tstart = time.time()
+    with ctx.Pool(n_workers, initializer=_start_worker, initargs=(run_init, barrier)) as pool:
+        startup = pool.map(_report_startup, range(n_workers), chunksize=1)
+    return time.time() - tstart, np.array(startup)
+
+
+def run(repeats=5, n_workers=4, method='spawn'):
+
+    times = time_import(repeats)
+    results = {'import': times['import'].tolist(), 'init': times['init'].tolist()}
+    t_import, t_init = np.median(times['import']), np.median(times['init'])
+    print(f'\n{"IMPORT [s]":>12} {"INIT [s]":>10} {"IMPORT+INIT [s]":>16}   (median of {repeats})')
+    print(f'{t_import:12.3f} {t_init:10.3f} {t_import + t_init:16.3f}')
+
+    print(f'\n{"WORKERS":>8} {"METHOD":>10} {"WITH INIT":>10} {"POOL UP [s]":>12} {"PER WORKER P50 [s]":>19} {"MAX [s]":>8}')
+    for run_init in (False, True):
+        t_pool, startup = time_workers(n_workers, run_init=run_init, method=method)
+        results[f'workers_init{int(run_init)}'] = {'pool': t_pool, 'startup': startup.tolist()}
+        print(f'{n_workers:8d} {method:>10} {str(run_init):>10} {t_pool:12.3f} {np.median(startup):19.3f} {np.max(startup):8.3f}')
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import and worker start-up cost of the interface.')
+    parser.add_argument('--repeats', type=int, default=5, help='fresh interpreters to time the import in')
+    parser.add_argument('--workers', type=int, default=4, help='pool size')
+    parser.add_argument('--method', choices=('spawn', 'forkserver', 'fork'), default='spawn', help='start method of the pool')
+    parser.add_argument('--save', default=None, help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(repeats=args.repeats, n_workers=args.workers, method=args.method)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.save}')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+
+Authors
+-------
+John Weaver <john.weaver.astro@gmail.com>
+
+
+About
+-----
+Synthetic bricks for offline benchmarking. Nothing here touches the disk.
+
+Known Issues
+------------
+None
+
+
+"""
+
+import os
+import sys
+import numpy as np
+from astropy.table import Table
+
+if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
+    sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
+import config as conf
+
+from src.core.brick import Brick
+from .mosaics import make_wcs, render_gaussians
+
+
+def make_blob_layout(n_blobs, blob_size=10, shape=(2200, 2200), border=conf.BRICK_BUFFER):
+    """ Places square, well-separated blobs on a regular grid within the brick.
+
+    Returns the blobmap and the (y, x) centre of each blob. Blob ids start at 1.
+    """
+    height, width = shape
+    n_side = int(np.ceil(np.sqrt(n_blobs)))
+    spacing_y = (height - 2 * border) // n_side
+    spacing_x = (width - 2 * border) // n_side
+    if min(spacing_y, spacing_x) <= blob_size + 1:
+        raise ValueError(f'{n_blobs} blobs of {blob_size}px do not fit in a {width}x{height} brick!')
+
+    blobmap = np.zeros(shape, dtype=int)
+    centers = np.zeros((n_blobs, 2))
+    half = blob_size // 2
+    for i in np.arange(n_blobs):
+        cy = border + (i // n_side) * spacing_y + spacing_y // 2
+        cx = border + (i % n_side) * spacing_x + spacing_x // 2
+        blobmap[cy-half:cy-half+blob_size, cx-half:cx-half+blob_size] = i + 1
+        centers[i] = cy, cx
+
+    return blobmap, centers
+
+
+def make_synthetic_brick(n_blobs=100, blob_size=10, shape=(2200, 2200), n_bands=1, sources_per_blob=1,
+                         flux=100., noise=1., psf_sigma=1.5, brick_id=1, seed=1234):
+    """ Builds a fully staged Brick (images, segmap, blobmap, catalog) of Gaussian sources in Gaussian noise.
+
+    Each blob holds `sources_per_blob` sources, split into vertical strips of the segmap.
+    """
+    rng = np.random.RandomState(seed)
+    blobmap, centers = make_blob_layout(n_blobs, blob_size, shape)
+    height, width = shape
+
+    # Split every blob into segments, one per source
+    segmap = np.zeros_like(blobmap)
+    n_sources = n_blobs * sources_per_blob
+    x, y = np.zeros(n_sources), np.zeros(n_sources)
+    half = blob_size // 2
+    strip = max(blob_size // sources_per_blob, 1)
+    for i, (cy, cx) in enumerate(centers.astype(int)):
+        for j in np.arange(sources_per_blob):
+            sid = i * sources_per_blob + j + 1
+            x0 = cx - half + j * strip
+            x1 = cx - half + blob_size if j == sources_per_blob - 1 else x0 + strip
+            segmap[cy-half:cy-half+blob_size, x0:x1] = sid
+            x[sid-1], y[sid-1] = (x0 + x1 - 1) / 2., cy
+
+    # Render Gaussian sources into noise
+    images = noise * rng.standard_normal((n_bands, height, width))
+    for image in images:
+        render_gaussians(image, x, y, flux * np.ones(n_sources), psf_sigma)
+    weights = np.ones_like(images) / noise**2
+    masks = np.zeros_like(images, dtype=bool)
+
+    bands = [conf.MODELING_NICKNAME,] if n_bands == 1 else [f'SYN{i}' for i in np.arange(n_bands)]
+    brick = Brick(images=images, weights=weights, masks=masks, psfmodels=None,
+                  wcs=make_wcs(width, height), bands=np.array(bands), brick_id=brick_id)
+
+    catalog = Table()
+    catalog['source_id'] = np.arange(1, n_sources+1)
+    catalog['brick_id'] = brick_id * np.ones(n_sources, dtype=int)
+    catalog['blob_id'] = np.repeat(np.arange(1, n_blobs+1), sources_per_blob)
+    catalog['N_BLOB'] = sources_per_blob * np.ones(n_sources, dtype=int)
+    catalog['x'] = x
+    catalog['y'] = y
+    catalog['a'] = psf_sigma * np.ones(n_sources)
+    catalog['b'] = psf_sigma * np.ones(n_sources)
+    catalog['theta'] = np.zeros(n_sources)
+    catalog['flux'] = flux * np.ones(n_sources)
+    catalog['cflux'] = flux * np.ones(n_sources)
+
+    brick.catalog = catalog
+    brick.n_sources = n_sources
+    brick.segmap = segmap
+    brick.blobmap = blobmap
+    brick.n_blobs = n_blobs
+    brick.is_modeling = True
+
+    return brick
@@ -30,6 +30,7 @@ from scipy.ndimage import zoom
 from scipy import stats
 from copy import deepcopy
 from scipy.ndimage import binary_dilation
+from scipy.linalg import cho_factor, cho_solve
 
 from tractor import NCircularGaussianPSF, PixelizedPSF, PixelizedPsfEx, Image, Tractor, FluxesPhotoCal, NullWCS, ConstantSky, EllipseE, EllipseESoft, Fluxes, PixPos, Catalog
 from tractor.sersic import SersicIndex, SersicGalaxy
@@ -38,6 +39,7 @@ from tractor.galaxy import ExpGalaxy, DevGalaxy, FixedCompositeGalaxy, SoftenedF
 from tractor.pointsource import PointSource
 from tractor.psf import HybridPixelizedPSF
 import time
+import functools
 import photutils
 import sep
 from matplotlib.colors import LogNorm
@@ -50,6 +52,216 @@ import config as conf
 
 import logging
 
+
+class PSFCache():
+    """Preprocessed PSF models keyed by (band, PSF node), kept for the life of the process"""
+
+    def __init__(self, size=conf.PSF_CACHE_SIZE):
+        self.size = size
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.models:
+            self.hits += 1
+            return deepcopy(self.models[key])
+        self.misses += 1
+        return None
+
+    def put(self, key, psfmodel):
+        if self.size <= 0:
+            return
+        if len(self.models) >= self.size:
+            self.models.pop(next(iter(self.models))) # drop the oldest
+        self.models[key] = deepcopy(psfmodel)
+
+    def clear(self):
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return f'{len(self.models)} PSFs cached, {self.hits} hits, {self.misses} misses'
+
+psf_cache = PSFCache()
+
+
+class PRFStore():
+    """PRF images keyed by (band, PRF node), read and resampled once per process and handed out read-only"""
+
+    def __init__(self, size=conf.PRF_STORE_SIZE):
+        self.size = size
+        self.images = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, band, prf_idx):
+        pad_prf_idx = ((6 - len(str(prf_idx))) * "0") + str(prf_idx)
+        return os.path.join(conf.PRFMAP_DIR[band], f'{conf.PRFMAP_FILENAME}{pad_prf_idx}.fits')
+
+    def get(self, band, prf_idx):
+        """PRF image at the pixel scale of the images, or None if it has no file. Copy it before changing it!"""
+        key = (band, prf_idx)
+        if key in self.images:
+            self.hits += 1
+            return self.images[key]
+        self.misses += 1
+
+        path_prffile = self.path(band, prf_idx)
+        if not os.path.exists(path_prffile):
+            return None
+        img = np.array(fits.getdata(path_prffile))
+        assert(img.shape[0] == img.shape[1]) # am I square!?
+
+        # Do I need to resample?
+        if (conf.PRFMAP_PIXEL_SCALE_ORIG > 0) & (conf.PRFMAP_PIXEL_SCALE_ORIG is not None):
+            img = zoom(img, conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE)
+            if np.shape(img)[0]%2 == 0:
+                img = zoom(img, np.shape(img)[0] / (np.shape(img)[0] + 1))
+
+        img.setflags(write=False)
+        if self.size > 0:
+            if len(self.images) >= self.size:
+                self.images.pop(next(iter(self.images))) # drop the oldest
+            self.images[key] = img
+        return img
+
+    def clear(self):
+        self.images = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return f'{len(self.images)} PRFs stored, {self.hits} hits, {self.misses} misses'
+
+prf_store = PRFStore()
+
+
+class RenderCache():
+    """Model renders of one tractor, per band: the per-source patches and their sum. Any change
+    to the images, sources or source parameters since the last render invalidates the lot."""
+
+    def __init__(self):
+        self.key = None
+        self.patches = {}
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self, tractor):
+        catalog = tractor.getCatalog()
+        params = list(catalog.getAllParams())
+        for timg in tractor.getImages():
+            params += list(timg.getSky().getAllParams())
+        key = (tuple(id(timg) for timg in tractor.getImages()), tuple(id(src) for src in catalog),
+               np.array(params, dtype=float))
+        if (self.key is None) or (key[:2] != self.key[:2]) or (not np.array_equal(key[2], self.key[2], equal_nan=True)):
+            self.key = key
+            self.patches = {}
+            self.models = {}
+
+    def _render(self, tractor, idx):
+        if idx in self.models:
+            self.hits += 1
+            return
+        self.misses += 1
+        timg = tractor.getImage(idx)
+        model = np.zeros(timg.getModelShape(), tractor.modtype)
+        timg.getSky().addTo(model)
+        patches = []
+        for src in tractor.getCatalog():
+            patch = tractor.getModelPatch(timg, src)
+            if patch is not None:
+                patch.addTo(model)
+            patches.append(patch)
+        self.patches[idx] = patches
+        self.models[idx] = model
+
+    def model(self, tractor, idx, source=None):
+        """Model image of band idx, of all sources or only the source-th one (both with the sky)"""
+        self._sync(tractor)
+        self._render(tractor, idx)
+        if source is None:
+            return self.models[idx].copy()
+        timg = tractor.getImage(idx)
+        model = np.zeros(timg.getModelShape(), tractor.modtype)
+        timg.getSky().addTo(model)
+        if self.patches[idx][source] is not None:
+            self.patches[idx][source].addTo(model)
+        return model
+
+    def chi(self, tractor, idx):
+        """Chi image of band idx, as Tractor.getChiImage"""
+        timg = tractor.getImage(idx)
+        return (timg.getImage() - self.model(tractor, idx)) * timg.getInvError()
+
+    def __str__(self):
+        return f'{len(self.models)} bands rendered, {self.hits} hits, {self.misses} misses'
+
+
+def clip_patch(patch, shape):
+    """Cuts a tractor Patch down to the image, as (ylo, yhi, xlo, xhi, pixels). None if nothing is left."""
+    if (patch is None) or (patch.patch is None):
+        return None
+    H, W = shape
+    ph, pw = np.shape(patch.patch)
+    x0, y0 = patch.x0, patch.y0
+    xlo, xhi = max(x0, 0), min(x0 + pw, W)
+    ylo, yhi = max(y0, 0), min(y0 + ph, H)
+    if (xlo >= xhi) | (ylo >= yhi):
+        return None
+    return ylo, yhi, xlo, xhi, np.asarray(patch.patch[ylo-y0:yhi-y0, xlo-x0:xhi-x0], dtype=float)
+
+
+def patch_normal_equations(patches, data, invvar):
+    """Normal equations (F, b) of the weighted fit of data by a linear sum of the (clipped) patches.
+    Inner products only run over where patches overlap. Also returns the sum of each patch."""
+    n = len(patches)
+    fisher = np.zeros((n, n))
+    bvec = np.zeros(n)
+    psum = np.zeros(n)
+    for j, pj in enumerate(patches):
+        if pj is None:
+            continue
+        ylo, yhi, xlo, xhi, aj = pj
+        wj = aj * invvar[ylo:yhi, xlo:xhi]
+        psum[j] = aj.sum()
+        bvec[j] = np.sum(wj * data[ylo:yhi, xlo:xhi])
+        fisher[j, j] = np.sum(wj * aj)
+        for k in np.arange(j+1, n):
+            pk = patches[k]
+            if pk is None:
+                continue
+            y0, y1 = max(ylo, pk[0]), min(yhi, pk[1])
+            x0, x1 = max(xlo, pk[2]), min(xhi, pk[3])
+            if (y0 >= y1) | (x0 >= x1):
+                continue
+            fisher[j, k] = fisher[k, j] = np.sum(wj[y0-ylo:y1-ylo, x0-xlo:x1-xlo] * pk[4][y0-pk[0]:y1-pk[0], x0-pk[2]:x1-pk[2]])
+    return fisher, bvec, psum
+
+
+def solve_normal_equations(fisher, bvec):
+    """Solution and covariance of a symmetric positive-definite system, by Cholesky factorisation.
+    Raises np.linalg.LinAlgError if the system is singular."""
+    cho = cho_factor(fisher, lower=True)
+    return cho_solve(cho, bvec), cho_solve(cho, np.eye(len(bvec)))
+
+
+def timed(stage):
+    """ Adds the run time of a Blob method (and the optimizer steps it took) to blob.timing and blob.steps under stage """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tstart, steps_start = time.time(), self.opt_steps
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.add_timing(stage, tstart, steps_start)
+        return wrapper
+    return decorator
+
+
 class Blob(Subimage):
     """TODO: docstring"""
 
@@ -58,6 +270,11 @@ class Blob(Subimage):
 
         self.logger = logging.getLogger(f'farmer.blob.{blob_id}')
         self.rejected = False
+
+        # Seconds and optimizer steps spent per stage, for the per-blob timing tables
+        self.timing = {}
+        self.steps = {}
+        self.opt_steps = 0
         # fh = logging.FileHandler(f'farmer_B{blob_id}.log')
         # fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
         # formatter = logging.Formatter('[%(asctime)s] %(name)s :: %(levelname)s - %(message)s', '%H:%M:%S')
@@ -65,9 +282,11 @@ class Blob(Subimage):
        
         # self.logger = pathos.logger(level=logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL), handler=fh)
 
-        blobmask = np.array(brick.blobmap == blob_id, bool)
-        mask_frac = blobmask.sum() / blobmask.size
-        if (mask_frac > conf.SPARSE_THRESH) & (blobmask.size > conf.SPARSE_SIZE):
+        # Only the bounding box of the blob is ever touched, never the full brick
+        blob_slice, blob_npix = brick.get_blob_slice(blob_id)
+        blobmask = np.array(brick.blobmap[blob_slice] == blob_id, bool)
+        mask_frac = blob_npix / brick.blobmap.size
+        if (mask_frac > conf.SPARSE_THRESH) & (brick.blobmap.size > conf.SPARSE_SIZE):
             self.logger.warning('Blob is rejected as mask is sparse - likely an artefact issue.')
             self.rejected = True
 
@@ -78,18 +297,16 @@ class Blob(Subimage):
 
         # Grab blob
         self.blob_id = blob_id
-        self.blobmask = blobmask
-        blob_sources = np.unique(brick.segmap[blobmask])
+        blob_sources = np.unique(brick.segmap[blob_slice][blobmask])
 
-        source_density =  len(blob_sources) / blobmask.sum() # N/px2
+        source_density =  len(blob_sources) / blob_npix # N/px2
         if (conf.BLOB_DENSITY_LIMIT > 0) & (source_density > conf.BLOB_DENSITY_LIMIT):
             self.logger.warning(f'Blob is rejected as being too dense ({source_density:2.2f} src/px2) - likely an artefact issue.')
             self.rejected = True
 
         # Dimensions
-        idx, idy = blobmask.nonzero()
-        xlo, xhi = np.min(idx), np.max(idx) + 1
-        ylo, yhi = np.min(idy), np.max(idy) + 1
+        xlo, xhi = blob_slice[0].start, blob_slice[0].stop
+        ylo, yhi = blob_slice[1].start, blob_slice[1].stop
         h = xhi - xlo
         w = yhi - ylo
 
@@ -105,7 +322,8 @@ class Blob(Subimage):
             self.logger.warning('Blob has no unmasked pixels! -- skipping!')
             self.rejected = True
 
-        self.masks[self.slicepix] = np.logical_not(blobmask[self.slice], dtype=bool)
+        self.blobmask = np.array(brick.blobmap[self.slice] == blob_id, bool) # within the buffered cutout
+        self.masks[self.slicepix] = np.logical_not(self.blobmask, dtype=bool)
         self.segmap = brick.segmap[self.slice]
         self.backgrounds = np.array([back for back in brick.backgrounds])
         self.background_images = np.array([img[self.slice] for img in brick.background_images])
@@ -174,6 +392,7 @@ class Blob(Subimage):
         self.solution_catalog = np.zeros(self.n_sources, dtype=object)
         self.solved_chisq = np.zeros(self.n_sources)
         self.solved_bic = np.zeros(self.n_sources)
+        self.early_exit = np.zeros(self.n_sources, dtype=bool)
         self.solution_chisq = np.zeros(self.n_sources)
         self.tr_catalogs = np.zeros((self.n_sources, self.max_level + 1, 2), dtype=object)
         self.chisq = np.zeros((self.n_sources, self.max_level + 1, 2))
@@ -192,6 +411,7 @@ class Blob(Subimage):
         # self.parameter_variance = np.zeros((self.n_sources, 3))
         # self.forced_variance = np.zeros((self.n_sources, self.n_bands))
         self.solution_tractor = None
+        self.render_cache = RenderCache()
         self.psfimg = {}
 
         self.residual_catalog = np.zeros((self.n_bands), dtype=object)
@@ -199,9 +419,18 @@ class Blob(Subimage):
         self.n_residual_sources = np.zeros(self.n_bands, dtype=int)
 
         self.minsep = dict.fromkeys(conf.PRFMAP_PSF)
+        self.linear_solution = {}
+        self._corral = None
+        self._source_pixels = None
 
         del brick
 
+    def add_timing(self, stage, tstart, steps_start=None):
+        self.timing[stage] = self.timing.get(stage, 0.) + time.time() - tstart
+        if steps_start is not None:
+            self.steps[stage] = self.steps.get(stage, 0) + self.opt_steps - steps_start
+
+    @timed('stage_images')
     def stage_images(self):
         """ Collect image information (img, wgt, mask, psf, wcs) to build a Tractor Image for the blob"""
 
@@ -234,34 +463,38 @@ class Blob(Subimage):
             psfplotband = band
 
             if (band_strip in conf.CONSTANT_PSF) & (psf is not None):
-                psfmodel = deepcopy(psf.constantPsfAt(conf.MOSAIC_WIDTH/2., conf.MOSAIC_HEIGHT/2.)) # if not spatially varying psfex model, this won't matter.
-                pw, ph = np.shape(psfmodel.img)
-                if remove_background_psf & (not conf.FORCE_GAUSSIAN_PSF):
-                    self.logger.debug('Removing PSF background.')
-                    cmask = create_circular_mask(pw, ph, radius=conf.PSF_MASKRAD / conf.PIXEL_SCALE)
-                    bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
-                    if np.sum(bcmask) == 0:
-                        self.logger.error(f'PSF masking has left no valid pixels for {band}! PSF stamp is {pw}x{ph}px with a mask diameter of {2*conf.PSF_MASKRAD/conf.PIXEL_SCALE:3.3f}px. Consider setting PSF_MASKRAD to a larger value.')
-                    psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
-                    # psfmodel.img[np.isnan(psfmodel.img)] = 0
-                    # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
-                    psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
-
-                if conf.PSF_RADIUS > 0:
-                    psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
-                    self.logger.debug(f'Clipping PSF ({psf_rad_pix}px radius)')
-                    psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
-                    self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
-
-                if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
-                    norm = psfmodel.img.sum()
-                    self.logger.debug(f'Normalizing PSF (sum = {norm:4.4f})')
-                    psfmodel.img /= norm # HACK -- force normalization to 1
-                self.logger.debug('Adopting constant PSF.')
-
-                if conf.USE_MOG_PSF:
-                    self.logger.debug('Making a Gaussian Mixture PSF')
-                    psfmodel = HybridPixelizedPSF(pix=psfmodel, N=10).gauss
+                psf_key = (band, 'constant')
+                psfmodel = psf_cache.get(psf_key)
+                if psfmodel is None:
+                    psfmodel = deepcopy(psf.constantPsfAt(conf.MOSAIC_WIDTH/2., conf.MOSAIC_HEIGHT/2.)) # if not spatially varying psfex model, this won't matter.
+                    pw, ph = np.shape(psfmodel.img)
+                    if remove_background_psf & (not conf.FORCE_GAUSSIAN_PSF):
+                        self.logger.debug('Removing PSF background.')
+                        cmask = create_circular_mask(pw, ph, radius=conf.PSF_MASKRAD / conf.PIXEL_SCALE)
+                        bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
+                        if np.sum(bcmask) == 0:
+                            self.logger.error(f'PSF masking has left no valid pixels for {band}! PSF stamp is {pw}x{ph}px with a mask diameter of {2*conf.PSF_MASKRAD/conf.PIXEL_SCALE:3.3f}px. Consider setting PSF_MASKRAD to a larger value.')
+                        psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
+                        # psfmodel.img[np.isnan(psfmodel.img)] = 0
+                        # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
+                        psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+
+                    if conf.PSF_RADIUS > 0:
+                        psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
+                        self.logger.debug(f'Clipping PSF ({psf_rad_pix}px radius)')
+                        psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
+                        self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
+
+                    if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
+                        norm = psfmodel.img.sum()
+                        self.logger.debug(f'Normalizing PSF (sum = {norm:4.4f})')
+                        psfmodel.img /= norm # HACK -- force normalization to 1
+                    self.logger.debug('Adopting constant PSF.')
+
+                    if conf.USE_MOG_PSF:
+                        self.logger.debug('Making a Gaussian Mixture PSF')
+                        psfmodel = HybridPixelizedPSF(pix=psfmodel, N=10).gauss
+                    psf_cache.put(psf_key, psfmodel)
             
             elif (band_strip in conf.PSFGRID) & (psf is not None):
                 self.logger.debug('Adopting a GRIDPSF from file.')
@@ -279,53 +512,56 @@ class Blob(Subimage):
 
                 self.minsep[band_strip] = minsep # record it, and add it to the output catalog!
 
-                # open id file
-                path_psffile = os.path.join(conf.PSFGRID_OUT_DIR, f'{band_strip}_OUT/{psf_fname}.psf')
-                if not os.path.exists(path_psffile):
-                    self.logger.error(f'PSF file has not been found! ({path_psffile}')
-                    return False
-                self.logger.debug(f'Adopting GRID PSF: {psf_fname}')
+                psfplotband = psf_fname
+                psf_key = (band, psf_fname)
+                psfmodel = psf_cache.get(psf_key)
+                if psfmodel is None:
+                    # open id file
+                    path_psffile = os.path.join(conf.PSFGRID_OUT_DIR, f'{band_strip}_OUT/{psf_fname}.psf')
+                    if not os.path.exists(path_psffile):
+                        self.logger.error(f'PSF file has not been found! ({path_psffile}')
+                        return False
+                    self.logger.debug(f'Adopting GRID PSF: {psf_fname}')
                 
-                # # Do I need to resample?
-                # if  (conf.PRFMAP_PIXEL_SCALE_ORIG > 0) & (conf.PRFMAP_PIXEL_SCALE_ORIG is not None):
+                    # # Do I need to resample?
+                    # if  (conf.PRFMAP_PIXEL_SCALE_ORIG > 0) & (conf.PRFMAP_PIXEL_SCALE_ORIG is not None):
                     
-                #     factor = conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE
-                #     self.logger.debug(f'Resampling PRF with zoom factor: {factor:2.2f}')
-                #     img = zoom(img, factor)
-                #     if np.shape(img)[0]%2 == 0:
-                #         shape_factor = np.shape(img)[0] / (np.shape(img)[0] + 1)
-                #         img = zoom(img, shape_factor)
-                #     self.logger.debug(f'Final PRF size: {np.shape(img)}')
-                # blob_centerx = self.blob_center[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
-                # blob_centery = self.blob_center[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
-                # psfmodel = psf.) # init at blob center, may need to swap!
-                psfmodel = PixelizedPsfEx(fn=path_psffile)
-                pw, ph = np.shape(psfmodel.img)
-
-                psfplotband = psf_fname
+                    #     factor = conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE
+                    #     self.logger.debug(f'Resampling PRF with zoom factor: {factor:2.2f}')
+                    #     img = zoom(img, factor)
+                    #     if np.shape(img)[0]%2 == 0:
+                    #         shape_factor = np.shape(img)[0] / (np.shape(img)[0] + 1)
+                    #         img = zoom(img, shape_factor)
+                    #     self.logger.debug(f'Final PRF size: {np.shape(img)}')
+                    # blob_centerx = self.blob_center[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
+                    # blob_centery = self.blob_center[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
+                    # psfmodel = psf.) # init at blob center, may need to swap!
+                    psfmodel = PixelizedPsfEx(fn=path_psffile)
+                    pw, ph = np.shape(psfmodel.img)
 
-                if remove_background_psf & (not conf.FORCE_GAUSSIAN_PSF):
+                    if remove_background_psf & (not conf.FORCE_GAUSSIAN_PSF):
                     
-                    cmask = create_circular_mask(pw, ph, radius=conf.PSF_MASKRAD / conf.PIXEL_SCALE)
-                    bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
-                    psf_bkg = np.nanmax(psfmodel.img[bcmask])
-                    psfmodel.img -= psf_bkg
-                    self.logger.debug(f'Removing PSF background. {psf_bkg:e}')
-                    # psfmodel.img[np.isnan(psfmodel.img)] = 0
-                    # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
-                    psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
-
-                if conf.PSF_RADIUS > 0:
-                    psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
-                    self.logger.debug(f'Clipping PSF ({psf_rad_pix}px radius)')
-                    psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
-                    self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
-
-                if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
-                    norm = psfmodel.img.sum()
-                    self.logger.debug(f'Normalizing PSF (sum = {norm:4.4f})')
-                    psfmodel.img /= norm # HACK -- force normalization to 1       
-                    self.logger.debug(f'PSF has been normalized. (sum = {psfmodel.img.sum():4.4f})') 
+                        cmask = create_circular_mask(pw, ph, radius=conf.PSF_MASKRAD / conf.PIXEL_SCALE)
+                        bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
+                        psf_bkg = np.nanmax(psfmodel.img[bcmask])
+                        psfmodel.img -= psf_bkg
+                        self.logger.debug(f'Removing PSF background. {psf_bkg:e}')
+                        # psfmodel.img[np.isnan(psfmodel.img)] = 0
+                        # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
+                        psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+
+                    if conf.PSF_RADIUS > 0:
+                        psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
+                        self.logger.debug(f'Clipping PSF ({psf_rad_pix}px radius)')
+                        psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
+                        self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
+
+                    if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
+                        norm = psfmodel.img.sum()
+                        self.logger.debug(f'Normalizing PSF (sum = {norm:4.4f})')
+                        psfmodel.img /= norm # HACK -- force normalization to 1       
+                        self.logger.debug(f'PSF has been normalized. (sum = {psfmodel.img.sum():4.4f})')
+                    psf_cache.put(psf_key, psfmodel)
 
             elif (band_strip in conf.PRFMAP_PSF) & (psf is not None):
                 self.logger.debug('Adopting a PRF from file.')
@@ -345,54 +581,38 @@ class Blob(Subimage):
 
                     self.minsep[band] = minsep # record it, and add it to the output catalog!
 
-                # open id file
-                pad_prf_idx = ((6 - len(str(prf_idx))) * "0") + str(prf_idx)
-                path_prffile = os.path.join(conf.PRFMAP_DIR[band_strip], f'{conf.PRFMAP_FILENAME}{pad_prf_idx}.fits')
-                if not os.path.exists(path_prffile):
-                    self.logger.error(f'PRF file has not been found! ({path_prffile}')
-                    return False
-                hdul = fits.open(path_prffile)
-                from scipy.ndimage.interpolation import rotate
-                # img = rotate(hdul[0].data, )
-                img = hdul[0].data
-                # img = 1E-31 * np.ones_like(img)
-                # img[50:-50, 50:-50] = hdul[0].data[50:-50, 50:-50]
-                assert(img.shape[0] == img.shape[1]) # am I square!?
-                self.logger.debug(f'PRF size: {np.shape(img)}')
-                
-                # Do I need to resample?
-                if  (conf.PRFMAP_PIXEL_SCALE_ORIG > 0) & (conf.PRFMAP_PIXEL_SCALE_ORIG is not None):
-                    
-                    factor = conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE
-                    self.logger.debug(f'Resampling PRF with zoom factor: {factor:2.2f}')
-                    img = zoom(img, factor)
-                    if np.shape(img)[0]%2 == 0:
-                        shape_factor = np.shape(img)[0] / (np.shape(img)[0] + 1)
-                        img = zoom(img, shape_factor)
-                    self.logger.debug(f'Final PRF size: {np.shape(img)}')
-
-                psfmodel = PixelizedPSF(img)
-                pw, ph = np.shape(psfmodel.img)
-
-                if (conf.PRFMAP_MASKRAD > 0) & (not conf.FORCE_GAUSSIAN_PSF):
-                    self.logger.debug('Clipping outskirts of PRF.')
-                    cmask = create_circular_mask(pw, ph, radius=conf.PRFMAP_MASKRAD / conf.PIXEL_SCALE)
-                    bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
-                    psfmodel.img[bcmask] = 0
-                    # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
-                    psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+                psf_key = (band, prf_idx)
+                psfmodel = psf_cache.get(psf_key)
+                if psfmodel is None:
+                    img = prf_store.get(band_strip, prf_idx)
+                    if img is None:
+                        self.logger.error(f'PRF file has not been found! ({prf_store.path(band_strip, prf_idx)}')
+                        return False
+                    self.logger.debug(f'PRF size: {np.shape(img)}')
 
-                if conf.PSF_RADIUS > 0:
-                    psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
-                    self.logger.debug(f'Clipping PRF ({psf_rad_pix}px radius)')
-                    psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
-                    self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
+                    psfmodel = PixelizedPSF(img.copy())
+                    pw, ph = np.shape(psfmodel.img)
 
-                if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
-                    norm = psfmodel.img.sum()
-                    self.logger.debug(f'Normalizing PRF (sum = {norm:4.4f})')
-                    psfmodel.img /= norm # HACK -- force normalization to 1       
-                    self.logger.debug(f'PRF has been normalized. (sum = {psfmodel.img.sum():4.4f})')         
+                    if (conf.PRFMAP_MASKRAD > 0) & (not conf.FORCE_GAUSSIAN_PSF):
+                        self.logger.debug('Clipping outskirts of PRF.')
+                        cmask = create_circular_mask(pw, ph, radius=conf.PRFMAP_MASKRAD / conf.PIXEL_SCALE)
+                        bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
+                        psfmodel.img[bcmask] = 0
+                        # psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
+                        psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+
+                    if conf.PSF_RADIUS > 0:
+                        psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
+                        self.logger.debug(f'Clipping PRF ({psf_rad_pix}px radius)')
+                        psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
+                        self.logger.debug(f'New shape: {np.shape(psfmodel.img)}')
+
+                    if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
+                        norm = psfmodel.img.sum()
+                        self.logger.debug(f'Normalizing PRF (sum = {norm:4.4f})')
+                        psfmodel.img /= norm # HACK -- force normalization to 1       
+                        self.logger.debug(f'PRF has been normalized. (sum = {psfmodel.img.sum():4.4f})')
+                    psf_cache.put(psf_key, psfmodel)
 
             elif (psf is not None):
                 blob_centerx = self.blob_center[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
@@ -462,6 +682,7 @@ class Blob(Subimage):
             # pickle.dump(tweight, open("tweight.pkl", "wb"))
             # pickle.dump(psfmodel, open("psf.pkl", 'wb'))
 
+        self.logger.debug(f'PSF cache: {psf_cache}')
         self.timages = timages
         return True
 
@@ -616,6 +837,7 @@ class Blob(Subimage):
 
 
             for i in range(conf.TRACTOR_MAXSTEPS):
+                self.opt_steps += 1
 
                 # for mod in self.tr.getCatalog():
                 #     print(mod)
@@ -759,9 +981,6 @@ class Blob(Subimage):
                         sid = self.bcatalog['source_id'][idx]
                         xp, yp = src.pos[0], src.pos[1]
                         xp0, yp0 = x_orig[idx], y_orig[idx]
-                        radius = 1
-                        struct1 = create_circular_mask(2*abs(radius), 2*abs(radius), radius=abs(radius))
-                        srcseg = binary_dilation(self.segmap == sid, structure=struct1).astype(bool)
                         maxy, maxx = np.shape(self.segmap)
                         if (xp > maxx) | (xp < 0) | (yp < 0) | (yp > maxy):
                             self.logger.warning(f'Source {sid} has escaped the blob on step #{i+1}!')
@@ -783,7 +1002,7 @@ class Blob(Subimage):
                                 src.pos.addGaussianPrior('y', yp0, gpxy)
 
 
-                        elif ~srcseg[int(yp), int(xp)]:
+                        elif not self.in_corral(sid, xp, yp):
                             trip = True
 
                             # fig, ax = plt.subplots()
@@ -836,7 +1055,7 @@ class Blob(Subimage):
         var_catalog.setParams(var)
         self.variance = var_catalog
 
-        if np.shape(self.tr.getChiImage(0)) != np.shape(self.segmap):
+        if np.shape(self.get_chi_image(0, tractor=self.tr)) != np.shape(self.segmap):
             self.logger.warning(f'Chimap and segmap are not the same shape for #{self.blob_id}')
             return False
 
@@ -847,6 +1066,116 @@ class Blob(Subimage):
 
         return True
 
+    def corral_footprints(self, radius=1):
+        """ Segment of each source dilated by radius, as {source_id: (y0, x0, footprint)} cut to its bounding box.
+        Made once per blob, as the segmap does not change between optimizer steps. """
+        if self._corral is None:
+            struct1 = create_circular_mask(2*abs(radius), 2*abs(radius), radius=abs(radius))
+            pad = np.max(np.shape(struct1))
+            maxy, maxx = np.shape(self.segmap)
+            self._corral = {}
+            for sid in self.bcatalog['source_id']:
+                ys, xs = np.nonzero(self.segmap == sid)
+                if len(ys) == 0:
+                    self._corral[sid] = (0, 0, np.zeros((0, 0), dtype=bool))
+                    continue
+                y0, x0 = max(ys.min() - pad, 0), max(xs.min() - pad, 0)
+                y1, x1 = min(ys.max() + pad + 1, maxy), min(xs.max() + pad + 1, maxx)
+                srcseg = binary_dilation(self.segmap[y0:y1, x0:x1] == sid, structure=struct1).astype(bool)
+                self._corral[sid] = (y0, x0, srcseg)
+        return self._corral
+
+    def in_corral(self, sid, xp, yp):
+        """ Is the pixel position (xp, yp) still on the dilated segment of source sid? """
+        y0, x0, srcseg = self.corral_footprints()[sid]
+        iy, ix = int(yp) - y0, int(xp) - x0
+        return (0 <= iy < srcseg.shape[0]) and (0 <= ix < srcseg.shape[1]) and srcseg[iy, ix]
+
+    def source_pixels(self):
+        """ Flat indices of the segment pixels of each source, in bcatalog order and ascending, so that
+        image.ravel()[pixels[i]] picks the same values as image[segmap == sid]. Made once per blob. """
+        if self._source_pixels is None:
+            flat = self.segmap.ravel()
+            order = np.argsort(flat, kind='stable')
+            sids = np.array(self.bcatalog['source_id'])
+            start = np.searchsorted(flat[order], sids, side='left')
+            end = np.searchsorted(flat[order], sids, side='right')
+            self._source_pixels = [order[a:b] for a, b in zip(start, end)]
+        return self._source_pixels
+
+    def segment_stats(self, i, j, pix, chi, res, img, wimg, rms, n_data):
+        """ Noise, residual normality, chi moments and raw fluxes of the i-th source in band j, over its segment pixels """
+        self.noise[i, j] = np.median(rms[pix])
+        res_seg = res[pix]
+        if len(res_seg) < 8:
+            self.k2[i,j] = -99
+        else:
+            try:
+                self.k2[i,j], __ = stats.normaltest(res_seg)
+            except:
+                self.k2[i,j] = -99
+                self.logger.warning('Normality test FAILED. Setting to -99')
+        chi_seg = chi[pix]
+        self.chi_sig[i,j] = np.std(chi_seg)
+        self.chi_mu[i,j] = np.mean(chi_seg)
+        self.chisq_nomodel[i,j] = np.sum(wimg[pix]**2) / n_data
+        self.seg_rawflux[i,j] = np.sum(img[pix])
+
+    def flat_solution_images(self):
+        """ Chi, residual, image, weighted image and background rms of the solution, as (band, pixel) arrays """
+        shape = (self.n_bands, -1)
+        return (np.reshape(self.solution_chi_images, shape),
+                np.reshape(self.images - self.solution_model_images, shape),
+                np.reshape(self.images, shape),
+                np.reshape(self.images * np.sqrt(self.weights), shape),
+                np.reshape(self.background_rms_images, shape))
+
+    def solve_linear_fluxes(self):
+        """ With positions and shapes frozen the model is linear in the fluxes, so solve them (and their variances)
+        directly by weighted least-squares in each band instead of iterating the optimizer. """
+
+        tstart = time.time()
+        self.logger.info(f'Starting linear flux solve for blob #{self.blob_id}')
+
+        self.tr.freezeParams('images')
+        var_catalog = deepcopy(self.tr.getCatalog())
+        self.linear_solution = {}
+
+        for j, band in enumerate(self.bands):
+            timg = self.timages[j]
+            data = timg.getImage()
+
+            # Each source rendered once at unit flux, then only overlapping patches are multiplied out
+            patches = [clip_patch(src.getUnitFluxModelPatches(timg)[0], np.shape(data)) for src in self.model_catalog]
+            fisher, bvec, psum = patch_normal_equations(patches, data, timg.getInvvar())
+            try:
+                flux, covar = solve_normal_equations(fisher, bvec)
+            except np.linalg.LinAlgError:
+                flux, covar = None, None
+            if (flux is None) or (not np.all(np.isfinite(flux))) or (not np.all(covar.diagonal() > 0)):
+                # e.g. a source with no patch in the cutout leaves an empty row. The optimizer copes with it.
+                self.logger.warning(f'Linear flux solve is singular in {band} for blob #{self.blob_id}. Falling back to the optimizer.')
+                self.linear_solution = {}
+                return self.optimize_tractor()
+            var = covar.diagonal()
+
+            for k, src in enumerate(self.model_catalog):
+                src.getBrightness().setFlux(band, flux[k])
+                var_catalog[k].getBrightness().setFlux(band, var[k])
+
+            # kept for the Rao-Cramer estimate, which normalises each model to its flux within the cutout
+            self.linear_solution[band] = (flux, var, psum)
+
+        self.variance = var_catalog
+        self.n_converge = 0
+
+        if np.shape(self.get_chi_image(0, tractor=self.tr)) != np.shape(self.segmap):
+            self.logger.warning(f'Chimap and segmap are not the same shape for #{self.blob_id}')
+            return False
+
+        self.logger.info(f'Blob #{self.blob_id} solved linearly ({time.time() - tstart:3.3f}s)')
+        return True
+
     def tractor_phot(self):
         """ Determines the best-fit model """
 
@@ -866,6 +1195,7 @@ class Blob(Subimage):
 
         while not self._solved.all():
             self._level += 1
+            tlevel, steps_level = time.time(), self.opt_steps
 
             if self._level > self.max_level:
                 self.logger.critical(f'SOURCE LEFT UNSOLVED IN BLOB {self.blob_id}')
@@ -902,9 +1232,13 @@ class Blob(Subimage):
                     self.position_variance = self.variance
                     # print(f'POSITION VAR: {self.position_variance}')
 
+                # One chi image per band for the whole blob, reduced over each source's segment pixels
+                pixels = self.source_pixels()
+                chis = [self.get_chi_image(k, tractor=self.tr).ravel() for k in np.arange(self.n_bands if self.multiband_model else 1)]
                 for i, src in enumerate(self.bcatalog):
                     if self._solved[i]:
                         continue
+                    pix = pixels[i]
                     if self.multiband_model:
                         totalchisq = 0
                         opttop = 0
@@ -917,19 +1251,19 @@ class Blob(Subimage):
                                 fwhm = 2.355 * np.std(self.tr.getImage(k).psf.img[midx, :])
                                 wgt = fwhm**-1
 
-                            totalchisq += np.sum((self.tr.getChiImage(k)[self.segmap == src['source_id']])**2)
-                            chi2 = np.sum((self.tr.getChiImage(k)[self.segmap == src['source_id']])**2)
+                            chi2 = np.sum(chis[k][pix]**2)
+                            totalchisq += chi2
                             nparam = self.model_catalog[i].numberOfParams() - (len(self.bands) + 1)
-                            ndof = (np.sum(self.segmap == src['source_id']) - nparam)
+                            ndof = (len(pix) - nparam)
                             if ndof < 1:
                                 ndof = 1
                             rchi2 = chi2 / ndof
                             opttop += rchi2* wgt
                             optbot += wgt
                     else:
-                        totalchisq = np.sum((self.tr.getChiImage(0)[self.segmap == src['source_id']])**2)
+                        totalchisq = np.sum(chis[0][pix]**2)
                     m_param = self.model_catalog[i].numberOfParams()
-                    n_data = np.sum(self.segmap == src['source_id']) * self.n_bands # 1, or else multimodel!
+                    n_data = len(pix) * self.n_bands # 1, or else multimodel!
                     self.chisq[i, self._level, self._sublevel] = totalchisq
                     ndof = (n_data - m_param)
                     if ndof < 1:
@@ -959,6 +1293,11 @@ class Blob(Subimage):
                             self.logger.debug(f'               {self.model_catalog[i].shape}')
                     
 
+                # Settle the clear-cut point sources before any galaxy model is tried
+                if conf.EARLY_EXIT & (self._level == 0) & (sublevel == 0):
+                    self.decide_early_exit()
+                    self._solved = self.solution_catalog != 0
+
                 # Move unsolved to next sublevel
                 if sublevel == 0:
                     self.mids[~self._solved] += 1
@@ -966,9 +1305,13 @@ class Blob(Subimage):
                     for figi, axi, band in zip(fig, ax, self.bands):
                         plot_detblob(self, figi, axi, band=band, level=self._level, sublevel=self._sublevel)
 
+                if self._solved.all():
+                    break
+
             # decide
             self.decide_winners()
             self._solved = self.solution_catalog != 0
+            self.add_timing(f'level_{self._level}', tlevel, steps_level)
 
         # print('Starting final optimization')
         # Final optimization
@@ -991,13 +1334,15 @@ class Blob(Subimage):
 
         self.pre_solution_catalog = self.tr.getCatalog()
         self.pre_solution_tractor = Tractor(self.timages, self.pre_solution_catalog)
-        self.pre_solution_model_images = np.array([self.tr.getModelImage(i) for i in np.arange(self.n_bands)])
-        self.pre_solution_chi_images = np.array([self.tr.getChiImage(i) for i in np.arange(self.n_bands)])
+        self.pre_solution_model_images = np.array([self.get_model_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
+        self.pre_solution_chi_images = np.array([self.get_chi_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
 
         self.stage = 'Final Optimization'
         self._level, self._sublevel = self._level+1, self._sublevel+1
         self.logger.debug(self.stage)
+        tfinal, steps_final = time.time(), self.opt_steps
         self.status = self.optimize_tractor()
+        self.add_timing('final_opt', tfinal, steps_final)
         
         if not self.status:
             return False
@@ -1005,19 +1350,22 @@ class Blob(Subimage):
 
         self.solution_catalog = self.tr.getCatalog()
         self.solution_tractor = Tractor(self.timages, self.solution_catalog)
-        self.solution_model_images = np.array([self.tr.getModelImage(i) for i in np.arange(self.n_bands)])
-        self.solution_chi_images = np.array([self.tr.getChiImage(i) for i in np.arange(self.n_bands)])
+        self.solution_model_images = np.array([self.get_model_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
+        self.solution_chi_images = np.array([self.get_chi_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
         self.parameter_variance = self.variance
         # print(f'PARAMETER VAR: {self.parameter_variance}')
 
         self.logger.debug(f'Resulting model parameters for blob #{self.blob_id}')
         self.solution_chisq = np.zeros((self.n_sources, self.n_bands))
         self.solution_bic = np.zeros((self.n_sources, self.n_bands))
+        pixels = self.source_pixels()
+        chis, residuals, imgs, wimgs, rmss = self.flat_solution_images()
         for i, src in enumerate(self.bcatalog):
+            pix = pixels[i]
             for j, band in enumerate(self.bands):
-                totalchisq = np.sum((self.tr.getChiImage(j)[self.segmap == src['source_id']])**2)
+                totalchisq = np.sum(chis[j][pix]**2)
                 m_param = self.model_catalog[i].numberOfParams() - (len(self.bands) + 1) # is this bugged?!
-                n_data = np.sum(self.segmap == src['source_id'])
+                n_data = len(pix)
                 ndof = (n_data - m_param)
                 if ndof < 1:
                     ndof = 1
@@ -1025,27 +1373,8 @@ class Blob(Subimage):
                 self.solution_bic[i, j] = self.solution_chisq[i, j] + np.log(n_data) * m_param
                 self.logger.debug(f'Source #{src["source_id"]} ({band}) with {self.model_catalog[i].name} has rchisq={self.solution_chisq[i, j]:3.3f} | bic={self.solution_bic[i, j]:3.3f}')
 
-                # signal-to-noise
-                self.noise[i, j] = np.median(self.background_rms_images[j][self.segmap == src['source_id']])
-
-                sid = src['source_id']
-                mod = self.solution_model_images[j]
-                chi = self.solution_chi_images[j]
-                res = self.images[j] - mod
-                res_seg = res[self.segmap==sid].flatten()
-                if len(res_seg) < 8:
-                    self.k2[i,j] = -99
-                else:
-                    try:
-                        self.k2[i,j], __ = stats.normaltest(res_seg)
-                    except:
-                        self.k2[i,j] = -99
-                        self.logger.warning('Normality test FAILED. Setting to -99')
-                chi_seg = chi[self.segmap==sid].flatten()
-                self.chi_sig[i,j] = np.std(chi_seg)
-                self.chi_mu[i,j] = np.mean(chi_seg)
-                self.chisq_nomodel[i,j] = np.sum((self.images[j]*np.sqrt(self.weights[j]))[self.segmap==sid]**2) / n_data
-                self.seg_rawflux[i,j] = np.sum(self.images[j][self.segmap==sid])
+                # signal-to-noise, residuals
+                self.segment_stats(i, j, pix, chis[j], residuals[j], imgs[j], wimgs[j], rmss[j], n_data)
                 if self.chisq_nomodel[i,j] < self.solution_chisq[i,j]:
                     self.logger.info(f'WARNING -- Source has better fit without model! Likely spurious...')
 
@@ -1066,11 +1395,7 @@ class Blob(Subimage):
                 else:
                     self.logger.debug(f'               {self.model_catalog[i].shape}')
         # self.rows = np.zeros(len(self.solution_catalog))
-        for idx, src in enumerate(self.solution_catalog):
-            # row = np.argwhere(self.brick.catalog['source_id'] == sid)[0][0]
-            # self.rows[idx] = row
-            # print(f'STASHING {sid} IN ROW {row}')
-            self.get_catalog(idx, src, multiband_model=self.multiband_model)
+        self.get_catalog(multiband_model=self.multiband_model)
 
         if conf.PLOT > 1:
             for figi, axi, band in zip(fig, ax, self.bands):
@@ -1087,6 +1412,7 @@ class Blob(Subimage):
 
         return self.status
 
+    @timed('forced_phot')
     def forced_phot(self):
         """ Forces the best-fit models """
 
@@ -1137,7 +1463,12 @@ class Blob(Subimage):
 
 
         # Optimize
-        status = self.optimize_tractor()
+        linear = conf.FORCE_LINEAR_SOLVE & conf.FREEZE_FORCED_POSITION & conf.FREEZE_FORCED_SHAPE \
+                    & np.all([m.name != 'SersicCoreGalaxy' for m in self.model_catalog])
+        if linear:
+            status = self.solve_linear_fluxes()
+        else:
+            status = self.optimize_tractor()
 
         if not status:
             return status
@@ -1148,8 +1479,8 @@ class Blob(Subimage):
         self.solution_bic = np.zeros((self.n_sources, self.n_bands))
         self.solution_catalog = self.tr.getCatalog()
         self.solution_tractor = Tractor(self.timages, self.solution_catalog)
-        self.solution_model_images = np.array([self.tr.getModelImage(i) for i in np.arange(self.n_bands)])
-        self.solution_chi_images = np.array([self.tr.getChiImage(i) for i in np.arange(self.n_bands)])
+        self.solution_model_images = np.array([self.get_model_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
+        self.solution_chi_images = np.array([self.get_chi_image(i, tractor=self.tr) for i in np.arange(self.n_bands)])
 
         # Rao-cramer direct estimate
 
@@ -1205,7 +1536,10 @@ class Blob(Subimage):
 
 
         self.logger.info(f'Resulting model parameters for blob #{self.blob_id}')
+        pixels = self.source_pixels()
+        chis, residuals, imgs, wimgs, rmss = self.flat_solution_images()
         for i, src in enumerate(self.bcatalog):
+            pix = pixels[i]
             self.logger.info(f'Source #{src["source_id"]}: {self.solution_catalog[i].name} model at {self.solution_catalog[i].pos}')
             # if self.solution_catalog[i].name not in ('PointSource', 'SimpleGalaxy'):
             #     if self.solution_catalog[i].name == 'FixedCompositeGalaxy': 
@@ -1223,9 +1557,9 @@ class Blob(Subimage):
             #         self.logger.info(f'    Shape -- ee1:       {shape.ee1:3.3f} +/- {shape_err.ee1:3.3f}')
             #         self.logger.info(f'    Shape -- ee2:       {shape.ee2:3.3f} +/- {shape_err.ee2:3.3f}')
             for j, band in enumerate(self.bands):
-                totalchisq = np.sum((self.tr.getChiImage(j)[self.segmap == src['source_id']])**2)
+                totalchisq = np.sum(chis[j][pix]**2)
                 m_param = self.model_catalog[i].numberOfParams() / self.n_bands
-                n_data = np.sum(self.segmap == src['source_id'])
+                n_data = len(pix)
                 self.solution_bic[i, j] = totalchisq + np.log(n_data) * m_param
                 self.solution_chisq[i, j] = totalchisq / (n_data - m_param)
                 # flux = self.solution_catalog[i].getBrightness().getFlux(self.bands[j])
@@ -1235,28 +1569,8 @@ class Blob(Subimage):
                 # self.logger.info(f'    Chisq({self.bands[j]}): {totalchisq:3.3f}')
                 # self.logger.info(f'    BIC({self.bands[j]}):   {self.solution_bic[i, j]:3.3f}')
 
-                # signal-to-noise
-                self.noise[i, j] = np.median(self.background_rms_images[j][self.segmap == src['source_id']])
-
-                sid = src['source_id']
-                mod = self.solution_model_images[j]
-                chi = self.solution_chi_images[j]
-                res = self.images[j] - mod
-                res_seg = res[self.segmap==sid].flatten()
-                if len(res_seg) < 8:
-                    self.k2[i,j] = -99
-                else:
-                    try:
-                        self.k2[i,j], __ = stats.normaltest(res_seg)
-                    except:
-                        self.k2[i,j] = -99
-                        self.logger.warning('Normality test FAILED. Setting to -99')
-                self.chisq_nomodel[i,j] = np.sum((self.images[j]*np.sqrt(self.weights[j]))[self.segmap==sid]**2) / n_data
-                self.seg_rawflux[i,j] = np.sum(self.images[j][self.segmap==sid])
-
-                chi_seg = chi[self.segmap==sid].flatten()
-                self.chi_sig[i,j] = np.std(chi_seg)
-                self.chi_mu[i,j] = np.mean(chi_seg)
+                # signal-to-noise, residuals
+                self.segment_stats(i, j, pix, chis[j], residuals[j], imgs[j], wimgs[j], rmss[j], n_data)
                 # self.chi_pc[i,j] = np.percentile(chi_seg, q=[5, 16, 50, 84, 95])
 
                 if conf.PLOT > 3:
@@ -1265,10 +1579,8 @@ class Blob(Subimage):
                         plot_xsection(self, band, ssrc, sid)
 
         # self.rows = np.zeros(len(self.solution_catalog))
+        self.get_catalog(multiband_only=True)
         for idx, src in enumerate(self.solution_catalog):
-            self.get_catalog(idx, src, multiband_only=True)
-
-
             if conf.PLOT > 0:
                 sid = self.bcatalog['source_id'][idx]
                 plot_srcprofile(self, src, sid, self.bands)
@@ -1276,6 +1588,31 @@ class Blob(Subimage):
         self.rao_cramer()
         return status
 
+    def decide_early_exit(self):
+        """ Takes the PointSource fit as final wherever the level 0 decision would keep it whatever the SimpleGalaxy
+        (or any later) fit gives, given that no model reaches a reduced chi2 below EARLY_EXIT_CHISQ_FLOOR.
+        SimpleGalaxy has as many parameters as PointSource, so the same margin holds for the BIC tree. """
+
+        if (conf.DECISION_TREE == 2) & (not conf.USE_BIC):
+            thresh, force = conf.PS_SG_THRESH2, conf.CHISQ_FORCE_SERSIC
+        else:
+            thresh, force = conf.PS_SG_THRESH1, conf.CHISQ_FORCE_EXP_DEV
+
+        rchisq_ps = self.rchisq[:, 0, 0]
+        # the back-door to the galaxy models needs the SimpleGalaxy fit too, unless PointSource already passes it
+        exitmask = ~self._solved & (rchisq_ps - conf.EARLY_EXIT_CHISQ_FLOOR < thresh) & (rchisq_ps <= force)
+        if not exitmask.any():
+            return
+
+        for i, sid in enumerate(self.bcatalog['source_id'][exitmask]):
+            self.logger.debug(f'Source #{sid} exits the tree as PointSource -- PS({rchisq_ps[exitmask][i]:3.3f}) with floor of {conf.EARLY_EXIT_CHISQ_FLOOR:3.3f}')
+        self.solution_catalog[exitmask] = self.tr_catalogs[exitmask, 0, 0].copy()
+        self.solved_chisq[exitmask] = rchisq_ps[exitmask]
+        self.solved_bic[exitmask] = self.bic[exitmask, 0, 0]
+        self.mids[exitmask] = 1
+        self.early_exit[exitmask] = True
+        self.logger.debug(f'{np.sum(exitmask)}/{self.n_sources} sources settled as PointSource after level 0')
+
     def decide_winners(self, use_bic=conf.USE_BIC):
         """ Traffic cop to direct BIC or CHISQ trees """
         if use_bic:
@@ -1690,6 +2027,19 @@ class Blob(Subimage):
         self.solved_chisq[~self._solved] = solved_chisq
         self.mids[~self._solved] = mids
 
+    def get_model_image(self, idx, source=None, tractor=None):
+        """ Model image of band idx from the render cache, of all sources or only the source-th one """
+        if tractor is None:
+            tractor = self.solution_tractor
+        return self.render_cache.model(tractor, idx, source)
+
+    def get_chi_image(self, idx, tractor=None):
+        """ Chi image of band idx from the render cache """
+        if tractor is None:
+            tractor = self.solution_tractor
+        return self.render_cache.chi(tractor, idx)
+
+    @timed('aperture_phot')
     def aperture_phot(self, band=None, image_type=None, sub_background=False):
         """ Provides post-processing aperture photometry support """
         # Allow user to enter image (i.e. image, residual, model...)
@@ -1718,13 +2068,13 @@ class Blob(Subimage):
             image = self.images[idx] 
 
         elif image_type == 'model':
-            image = self.solution_tractor.getModelImage(idx)
+            image = self.get_model_image(idx)
         
         elif image_type == 'isomodel':
             use_iso = True
 
         elif image_type == 'residual':
-            model = self.solution_tractor.getModelImage(idx)
+            model = self.get_model_image(idx)
             model[np.isnan(model)] = 0
             image = (self.images[idx] - model)
 
@@ -1732,7 +2082,7 @@ class Blob(Subimage):
             image = self.weights[idx]
 
         elif image_type == 'chisq':
-            model = self.solution_tractor.getModelImage(idx)
+            model = self.get_model_image(idx)
             model[np.isnan(model)] = 0
             image = (self.images[idx] - model)**2 * self.weights[idx]
         
@@ -1785,6 +2135,15 @@ class Blob(Subimage):
             imgerr = np.sqrt(var)
 
 
+        if use_iso: # One model image per source, shared by all apertures
+            iso_images = []
+            for j in np.arange(len(cat)):
+                image = self.get_model_image(idx, source=j)
+                image[np.isnan(image)] = 0
+                if conf.APER_APPLY_SEGMASK:
+                    image *= self.masks[self._band2idx(sband)]
+                iso_images.append(image)
+
         for i, rad in enumerate(apertures):
             if not use_iso: # Run with all models in image
                 aper = photutils.CircularAperture(apxy[Iap], rad)
@@ -1801,10 +2160,7 @@ class Blob(Subimage):
                 sid = self.bcatalog['source_id'][j]
                 if use_iso: # Run with only one model in image
                     aper = photutils.CircularAperture(apxy[j], rad)
-                    image = self.solution_tractor.getModelImage(idx, srcs=[src,])
-                    image[np.isnan(image)] = 0
-                    if conf.APER_APPLY_SEGMASK:
-                        image *= self.masks[self._band2idx(sband)]
+                    image = iso_images[j]
                     # if sub_background:
                     #     image -= self.background_images[idx]
                     self.logger.debug(f'Measuring {apertures_arcsec[i]:2.2f}" aperture flux on 1 source of {len(cat)}.')
@@ -1860,8 +2216,10 @@ class Blob(Subimage):
             # self.bcatalog[row][f'MAG_TOTAL_{band}_{image_type}'] = apmag[idx, -1]
             # self.bcatalog[row][f'MAG_TOTAL_{band}_{image_type}_err'] = apmag_err[idx, -1]
 
+        self.logger.debug(f'Render cache: {self.render_cache}')
         self.logger.info(f'Aperture photometry complete ({time.time() - tstart:3.3f}s)')
 
+    @timed('sep_phot')
     def sep_phot(self, band=None, image_type=None, sub_background=False, centroid='MODEL'):
         """ Run Sextractor on the image with either the detection or model centroid, where available! """
 
@@ -1894,13 +2252,13 @@ class Blob(Subimage):
             image = self.images[idx] 
 
         elif image_type == 'model':
-            image = self.solution_tractor.getModelImage(idx)
+            image = self.get_model_image(idx)
         
         elif image_type == 'isomodel':
             use_iso = True
 
         elif image_type == 'residual':
-            image = (self.images[idx] - self.solution_tractor.getModelImage(idx))
+            image = (self.images[idx] - self.get_model_image(idx))
         
         if conf.APER_APPLY_SEGMASK & (not use_iso):
             image *= self.masks[idx]
@@ -1987,7 +2345,7 @@ class Blob(Subimage):
 
             if use_iso:
 
-                image = self.solution_tractor.getModelImage(idx, srcs=[src,])
+                image = self.get_model_image(idx, source=j)
                 if conf.APER_APPLY_SEGMASK:
                     image *= self.masks[self.band2idx(band)]
                 if sub_background:
@@ -2034,6 +2392,7 @@ class Blob(Subimage):
             # print(self.bcatalog[row][f'C{centroid}_FLUX_AUTO_{band}_{image_type}']/self.bcatalog[row][f'FLUX_{band}'] )
             # plt.pause(5)
 
+    @timed('residual_phot')
     def residual_phot(self, band=None, sub_background=False):
         """ Run Sextractor on the residuals and flag any sources with detections in the parent blob """
         # SHOULD WE STACK THE RESIDUALS? (No?)
@@ -2044,7 +2403,7 @@ class Blob(Subimage):
             if band.startswith(conf.MODELING_NICKNAME):
                 band = band[len(conf.MODELING_NICKNAME)+1:]
             self.logger.info(f'Performing aperture photometry on {band} {image_type}...')
-        residual = self.images[idx] - self.solution_tractor.getModelImage(idx)
+        residual = self.images[idx] - self.get_model_image(idx)
         tweight = self.weights[idx].copy()
         var = np.zeros_like(tweight)
         var[tweight>0] = 1. / tweight[tweight>0]
@@ -2089,11 +2448,27 @@ class Blob(Subimage):
         else:
             self.logger.debug('No objects found by SExtractor.')
 
-    def get_catalog(self, row, src, multiband_only=False, multiband_model=False):
-        """ Turn photometry into a catalog. Add flags. """
+    def get_catalog(self, multiband_only=False, multiband_model=False):
+        """ Turn photometry into a catalog. Add flags. The values of every source are gathered first, and each
+        column is then written once. """
+
+        columns = {}
+        for row, src in enumerate(self.solution_catalog):
+            for colname, value in self.catalog_row(row, src, multiband_only=multiband_only, multiband_model=multiband_model).items():
+                rows, values = columns.setdefault(colname, ([], []))
+                rows.append(row)
+                values.append(value)
+
+        for colname, (rows, values) in columns.items():
+            self.bcatalog[colname][rows] = values
+
+    def catalog_row(self, row, src, multiband_only=False, multiband_model=False):
+        """ Catalog entries of one source, as {column: value} """
 
         sid = self.bcatalog['source_id'][row]
         self.logger.debug(f'blob.get_catalog :: Writing output entires for #{sid}')
+        values = {}
+        log_info = self.logger.isEnabledFor(logging.INFO)
 
         # Add band fluxes, flux errors
         for i, band in enumerate(self.bands):
@@ -2115,159 +2490,160 @@ class Blob(Subimage):
 
             # print(np.sqrt(param_var[row].brightness.getParams()[i]))
 
-            self.bcatalog[row]['MAG_'+band] = -2.5 * np.log10(src.getBrightness().getFlux(band)) + zpt
-            self.bcatalog[row]['MAGERR_'+band] = 1.089 * np.sqrt(param_var[row].brightness.getParams()[i]) / src.getBrightness().getFlux(band)
-            self.bcatalog[row]['RAWFLUX_'+band] = src.getBrightness().getFlux(band)
-            self.bcatalog[row]['RAWFLUXERR_'+band] = np.sqrt(param_var[row].brightness.getParams()[i])
-            self.bcatalog[row]['FLUX_'+band] = src.getBrightness().getFlux(band) * 10**(-0.4 * (zpt - 23.9))  # Force fluxes to be in uJy!
-            self.bcatalog[row]['FLUXERR_'+band] = np.sqrt(param_var[row].brightness.getParams()[i]) * 10**(-0.4 * (zpt - 23.9))
+            values['MAG_'+band] = -2.5 * np.log10(src.getBrightness().getFlux(band)) + zpt
+            values['MAGERR_'+band] = 1.089 * np.sqrt(param_var[row].brightness.getParams()[i]) / src.getBrightness().getFlux(band)
+            values['RAWFLUX_'+band] = src.getBrightness().getFlux(band)
+            values['RAWFLUXERR_'+band] = np.sqrt(param_var[row].brightness.getParams()[i])
+            values['FLUX_'+band] = src.getBrightness().getFlux(band) * 10**(-0.4 * (zpt - 23.9))  # Force fluxes to be in uJy!
+            values['FLUXERR_'+band] = np.sqrt(param_var[row].brightness.getParams()[i]) * 10**(-0.4 * (zpt - 23.9))
             if 'SersicCore' in src.name:
-                self.bcatalog[row]['RAWFLUXCORE_'+band] = src.brightnessPsf.getFlux(band)
-                self.bcatalog[row]['RAWFLUXCOREERR_'+band] = np.sqrt(param_var[row].brightnessPsf.getParams()[i])
-            self.bcatalog[row]['CHISQ_'+band] = self.solution_chisq[row, i]
-            self.bcatalog[row]['BIC_'+band] = self.solution_bic[row, i]
-            self.bcatalog[row]['N_CONVERGE_'+band] = self.n_converge
-            self.bcatalog[row]['SNR_'+band] = self.bcatalog[row]['RAWFLUX_'+band] / self.bcatalog[row]['RAWFLUXERR_'+band]
-            self.bcatalog[row]['NORM_'+band] = self.norm[row, i]
-            self.bcatalog[row]['CHI_MU_'+band] = self.chi_mu[row, i]
-            self.bcatalog[row]['CHI_SIG_'+band] = self.chi_sig[row, i]
-            self.bcatalog[row]['CHI_K2_'+band] = self.k2[row, i]
-            # self.bcatalog[row]['CHI_PERCENT_'+band] = self.chi_pc[row, i]
-            self.bcatalog[row]['SEG_RAWFLUX_'+band] = self.seg_rawflux[row, i]
-            self.bcatalog[row]['CHISQ_NOMODEL_'+band] = self.chisq_nomodel[row, i]
-            self.bcatalog[row]['VALID_SOURCE_'+band] = valid_source
+                values['RAWFLUXCORE_'+band] = src.brightnessPsf.getFlux(band)
+                values['RAWFLUXCOREERR_'+band] = np.sqrt(param_var[row].brightnessPsf.getParams()[i])
+            values['CHISQ_'+band] = self.solution_chisq[row, i]
+            values['BIC_'+band] = self.solution_bic[row, i]
+            values['N_CONVERGE_'+band] = self.n_converge
+            values['SNR_'+band] = values['RAWFLUX_'+band] / values['RAWFLUXERR_'+band]
+            values['NORM_'+band] = self.norm[row, i]
+            values['CHI_MU_'+band] = self.chi_mu[row, i]
+            values['CHI_SIG_'+band] = self.chi_sig[row, i]
+            values['CHI_K2_'+band] = self.k2[row, i]
+            # values['CHI_PERCENT_'+band] = self.chi_pc[row, i]
+            values['SEG_RAWFLUX_'+band] = self.seg_rawflux[row, i]
+            values['CHISQ_NOMODEL_'+band] = self.chisq_nomodel[row, i]
+            values['VALID_SOURCE_'+band] = valid_source
 
             if not conf.FREEZE_FORCED_POSITION:
-                self.bcatalog[row][f'X_MODEL_{band}'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
-                self.bcatalog[row][f'Y_MODEL_{band}'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
-                self.bcatalog[row][f'XERR_MODEL_{band}'] = np.sqrt(param_var[row].pos.getParams()[0])
-                self.bcatalog[row][f'YERR_MODEL_{band}'] = np.sqrt(param_var[row].pos.getParams()[1])
+                values[f'X_MODEL_{band}'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
+                values[f'Y_MODEL_{band}'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
+                values[f'XERR_MODEL_{band}'] = np.sqrt(param_var[row].pos.getParams()[0])
+                values[f'YERR_MODEL_{band}'] = np.sqrt(param_var[row].pos.getParams()[1])
                 if self.wcs is not None:
-                    # skyc = self.brick_wcs.all_pix2world(self.bcatalog[row][f'X_MODEL_{band}'] - self.mosaic_origin[0] + conf.BRICK_BUFFER, self.bcatalog[row][f'Y_MODEL_{band}'] - self.mosaic_origin[1] + conf.BRICK_BUFFER, 0)
+                    # skyc = self.brick_wcs.all_pix2world(values[f'X_MODEL_{band}'] - self.mosaic_origin[0] + conf.BRICK_BUFFER, values[f'Y_MODEL_{band}'] - self.mosaic_origin[1] + conf.BRICK_BUFFER, 0)
                     skyc = self.brick_wcs.all_pix2world(src.pos[0] + self.subvector[1], src.pos[1] + self.subvector[0] , 0)
-                    self.bcatalog[row][f'RA_{band}'] = skyc[0]
-                    self.bcatalog[row][f'DEC_{band}'] = skyc[1]
+                    values[f'RA_{band}'] = skyc[0]
+                    values[f'DEC_{band}'] = skyc[1]
 
             if not conf.FREEZE_FORCED_SHAPE:
                 # Model Parameters
-                self.bcatalog[row][f'VALID_SOURCE_{band}'] = valid_source
+                values[f'VALID_SOURCE_{band}'] = valid_source
 
                 if src.name in ('ExpGalaxy', 'DevGalaxy', 'SersicGalaxy', 'SersicCoreGalaxy'):
-                    self.bcatalog[row][f'REFF_{band}'] = src.shape.logre
-                    self.bcatalog[row][f'REFF_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[0])
-                    self.bcatalog[row][f'EE1_{band}'] = src.shape.ee1
-                    self.bcatalog[row][f'EE2_{band}'] = src.shape.ee2
+                    values[f'REFF_{band}'] = src.shape.logre
+                    values[f'REFF_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[0])
+                    values[f'EE1_{band}'] = src.shape.ee1
+                    values[f'EE2_{band}'] = src.shape.ee2
                     if (src.shape.e >= 1) | (src.shape.e <= -1):
-                        # self.bcatalog[row][f'VALID_SOURCE'] = False
-                        self.bcatalog[row][f'AB_{band}'] = -99.0
+                        # values[f'VALID_SOURCE'] = False
+                        values[f'AB_{band}'] = -99.0
                         self.logger.warning(f'Source has invalid ellipticity! (e = {src.shape.e:3.3f})')
                     else:
-                        self.bcatalog[row][f'AB_{band}'] = (src.shape.e + 1) / (1 - src.shape.e)
-                    self.bcatalog[row][f'AB_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[1])
-                    self.bcatalog[row][f'THETA_{band}'] = np.rad2deg(src.shape.theta)
-                    self.bcatalog[row][f'THETA_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[2])
+                        values[f'AB_{band}'] = (src.shape.e + 1) / (1 - src.shape.e)
+                    values[f'AB_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[1])
+                    values[f'THETA_{band}'] = np.rad2deg(src.shape.theta)
+                    values[f'THETA_ERR_{band}'] = np.sqrt(param_var[row].shape.getParams()[2])
 
-                    self.logger.info(f"    Reff:               {self.bcatalog[row][f'REFF_{band}']:3.3f} +/- {self.bcatalog[row][f'REFF_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    a/b:                {self.bcatalog[row][f'AB_{band}']:3.3f} +/- {self.bcatalog[row][f'AB_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    pa:                 {self.bcatalog[row][f'THETA_{band}']:3.3f} +/- {self.bcatalog[row][f'THETA_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    Reff:               {values[f'REFF_{band}']:3.3f} +/- {values[f'REFF_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    a/b:                {values[f'AB_{band}']:3.3f} +/- {values[f'AB_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    pa:                 {values[f'THETA_{band}']:3.3f} +/- {values[f'THETA_ERR_{band}']:3.3f}")
 
                     if src.name in ('SersicGalaxy', 'SersicCoreGalaxy'):
-                        self.bcatalog[row][f'N_{band}'] = src.sersicindex.val
-                        self.bcatalog[row][f'N_ERR_{band}'] = np.sqrt(param_var[row].sersicindex.val)
+                        values[f'N_{band}'] = src.sersicindex.val
+                        values[f'N_ERR_{band}'] = np.sqrt(param_var[row].sersicindex.val)
 
-                        self.logger.info(f"   N:                  {self.bcatalog[row][f'N_{band}']:3.3f} +/- {self.bcatalog[row][f'N_ERR_{band}']:3.3f}")
+                        self.logger.info(f"   N:                  {values[f'N_{band}']:3.3f} +/- {values[f'N_ERR_{band}']:3.3f}")
 
                 elif src.name == 'FixedCompositeGalaxy':
-                    self.bcatalog[row][f'FRACDEV_{band}'] = src.fracDev.getValue()
-                    self.bcatalog[row][f'EXP_REFF_{band}'] = src.shapeExp.logre
-                    self.bcatalog[row][f'EXP_REFF_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[0])
+                    values[f'FRACDEV_{band}'] = src.fracDev.getValue()
+                    values[f'EXP_REFF_{band}'] = src.shapeExp.logre
+                    values[f'EXP_REFF_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[0])
                     if (src.shapeExp.e >= 1) | (src.shapeExp.e <= -1):
-                        # self.bcatalog[row][f'VALID_SOURCE'] = False
-                        self.bcatalog[row][f'EXP_AB_{band}'] = -99.0
+                        # values[f'VALID_SOURCE'] = False
+                        values[f'EXP_AB_{band}'] = -99.0
                         self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeExp.e:3.3f})')
                     else:
-                        self.bcatalog[row][f'EXP_AB_{band}'] = (src.shapeExp.e + 1) / (1 - src.shapeExp.e)
-                    self.bcatalog[row][f'EXP_AB_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[1])
-                    self.bcatalog[row][f'EXP_THETA_{band}'] = np.rad2deg(src.shapeExp.theta)
-                    self.bcatalog[row][f'EXP_THETA_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[2])
-                    self.bcatalog[row][f'DEV_REFF_{band}'] = src.shapeDev.logre
-                    self.bcatalog[row][f'DEV_REFF_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[0])
+                        values[f'EXP_AB_{band}'] = (src.shapeExp.e + 1) / (1 - src.shapeExp.e)
+                    values[f'EXP_AB_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[1])
+                    values[f'EXP_THETA_{band}'] = np.rad2deg(src.shapeExp.theta)
+                    values[f'EXP_THETA_ERR_{band}'] = np.sqrt(param_var[row].shapeExp.getParams()[2])
+                    values[f'DEV_REFF_{band}'] = src.shapeDev.logre
+                    values[f'DEV_REFF_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[0])
                     if (src.shapeDev.e >= 1) | (src.shapeDev.e <= -1):
-                        # self.bcatalog[row][f'VALID_SOURCE'] = False
-                        self.bcatalog[row][f'DEV_AB_{band}'] = -99.0
+                        # values[f'VALID_SOURCE'] = False
+                        values[f'DEV_AB_{band}'] = -99.0
                         self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeDev.e:3.3f})')
                     else:
-                        self.bcatalog[row][f'DEV_AB_{band}'] = (src.shapeDev.e + 1) / (1 - src.shapeDev.e)
-                    self.bcatalog[row][f'DEV_AB_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[1])
-                    self.bcatalog[row][f'DEV_THETA_{band}'] = np.rad2deg(src.shapeDev.theta)
-                    self.bcatalog[row][f'DEV_THETA_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[2])
-                    # self.bcatalog[row][f'reff_err'] = np.sqrt(self.parameter_variance[row][0])
-                    # self.bcatalog[row][f'ab_err'] = np.sqrt(self.parameter_variance[row][1])
-                    # self.bcatalog[row][f'phi_err'] = np.sqrt(self.parameter_variance[row][2])
+                        values[f'DEV_AB_{band}'] = (src.shapeDev.e + 1) / (1 - src.shapeDev.e)
+                    values[f'DEV_AB_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[1])
+                    values[f'DEV_THETA_{band}'] = np.rad2deg(src.shapeDev.theta)
+                    values[f'DEV_THETA_ERR_{band}'] = np.sqrt(param_var[row].shapeDev.getParams()[2])
+                    # values[f'reff_err'] = np.sqrt(self.parameter_variance[row][0])
+                    # values[f'ab_err'] = np.sqrt(self.parameter_variance[row][1])
+                    # values[f'phi_err'] = np.sqrt(self.parameter_variance[row][2])
 
-                    self.bcatalog[row][f'EXP_EE1_{band}'] = src.shapeExp.ee1
-                    self.bcatalog[row][f'EXP_EE2_{band}'] = src.shapeExp.ee2
-                    self.bcatalog[row][f'DEV_EE1_{band}'] = src.shapeDev.ee1
-                    self.bcatalog[row][f'DEV_EE2_{band}'] = src.shapeDev.ee2
+                    values[f'EXP_EE1_{band}'] = src.shapeExp.ee1
+                    values[f'EXP_EE2_{band}'] = src.shapeExp.ee2
+                    values[f'DEV_EE1_{band}'] = src.shapeDev.ee1
+                    values[f'DEV_EE2_{band}'] = src.shapeDev.ee2
 
 
                     if (src.shapeExp.e >= 1) | (src.shapeExp.e <= -1):
-                        # self.bcatalog[row]['VALID_SOURCE'] = False
+                        # values['VALID_SOURCE'] = False
                         self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeExp.e:3.3f})')
 
 
                     if (src.shapeDev.e >= 1) | (src.shapeDev.e <= -1):
-                        # self.bcatalog[row]['VALID_SOURCE'] = False
+                        # values['VALID_SOURCE'] = False
                         self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeDev.e:3.3f})')
 
 
-                    self.logger.info(f"    Reff(Exp):          {self.bcatalog[row][f'EXP_REFF_{band}']:3.3f} +/- {self.bcatalog[row][f'EXP_REFF_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    a/b (Exp):          {self.bcatalog[row][f'EXP_AB_{band}']:3.3f} +/- {self.bcatalog[row][f'EXP_AB_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    pa  (Exp):          {self.bcatalog[row][f'EXP_THETA_{band}']:3.3f} +/- {self.bcatalog[row][f'EXP_THETA_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    Reff(Dev):          {self.bcatalog[row][f'DEV_REFF_{band}']:3.3f} +/- {self.bcatalog[row][f'DEV_REFF_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    a/b (Dev):          {self.bcatalog[row][f'DEV_AB_{band}']:3.3f} +/- {self.bcatalog[row][f'DEV_AB_ERR_{band}']:3.3f}")
-                    self.logger.info(f"    pa  (Dev):          {self.bcatalog[row][f'DEV_THETA_{band}']:3.3f} +/- {self.bcatalog[row][f'DEV_THETA_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    Reff(Exp):          {values[f'EXP_REFF_{band}']:3.3f} +/- {values[f'EXP_REFF_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    a/b (Exp):          {values[f'EXP_AB_{band}']:3.3f} +/- {values[f'EXP_AB_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    pa  (Exp):          {values[f'EXP_THETA_{band}']:3.3f} +/- {values[f'EXP_THETA_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    Reff(Dev):          {values[f'DEV_REFF_{band}']:3.3f} +/- {values[f'DEV_REFF_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    a/b (Dev):          {values[f'DEV_AB_{band}']:3.3f} +/- {values[f'DEV_AB_ERR_{band}']:3.3f}")
+                    self.logger.info(f"    pa  (Dev):          {values[f'DEV_THETA_{band}']:3.3f} +/- {values[f'DEV_THETA_ERR_{band}']:3.3f}")
 
                 elif src.name not in ('PointSource', 'SimpleGalaxy'): # last resort
                     self.logger.warning(f"Source does not have a valid solution model!")
                     valid_source = False
-                    self.bcatalog[row][f'VALID_SOURCE_{band}'] = valid_source
-
-
-            pos = 0000
-            # print(type(row))
-            mag, magerr = self.bcatalog[row]['MAG_'+band], self.bcatalog[row]['MAGERR_'+band]
-            flux, fluxerr = self.bcatalog[row]['FLUX_'+band], self.bcatalog[row]['FLUXERR_'+band]
-            rawflux, rawfluxerr = self.bcatalog[row]['RAWFLUX_'+band], self.bcatalog[row]['RAWFLUXERR_'+band]
-            chisq, bic = self.bcatalog[row]['CHISQ_'+band], self.bcatalog[row]['BIC_'+band]
-            self.logger.info(f"    Model({band}):        {src.name}")
-            self.logger.info(f'    Position({band}):     {pos}')
-            # print(self.bcatalog[row]['RAWFLUX_'+band])
-            self.logger.info(f'    Raw Flux({band}):     {rawflux:3.3f} +/- {rawfluxerr:3.3f}')
-            if 'SersicCore' in src.name:
-                rawfluxcore, rawfluxcoreerr = self.bcatalog[row]['RAWFLUXCORE_'+band], self.bcatalog[row]['RAWFLUXCOREERR_'+band]
-                self.logger.info(f'    Raw FluxCore({band}): {rawfluxcore:3.3f} +/- {rawfluxcoreerr:3.3f}')
-            self.logger.info(f'    Flux({band}):         {flux:3.3f} +/- {fluxerr:3.3f} uJy')               
-            self.logger.info(f'    Mag({band}):          {mag:3.3f} +/- {magerr:3.3f} AB')
-            self.logger.info(f'    Chi2({band}):         {chisq:3.3f}')
-            self.logger.info(f'    BIC({band}):          {bic:3.3f}')
-            self.logger.info(f'    Chi2 No Model({band}): {self.chisq_nomodel[row,i]:3.3f}')
-            self.logger.info(f'    Res. Chi({band}):     {self.chi_mu[row,i]:3.3f}+/-{self.chi_sig[row,i]:3.3f}')
-            self.logger.info(f'    DAgostino K2({band}): {self.k2[row,i]:3.3f}')
-            self.logger.info(f'    Seg Raw Flux({band}): {self.seg_rawflux[row,i]:3.3f}')
-            self.logger.info(f'    Zpt({band}):          {zpt:3.3f} AB')
+                    values[f'VALID_SOURCE_{band}'] = valid_source
+
+
+            if log_info:
+                pos = 0000
+                # print(type(row))
+                mag, magerr = values['MAG_'+band], values['MAGERR_'+band]
+                flux, fluxerr = values['FLUX_'+band], values['FLUXERR_'+band]
+                rawflux, rawfluxerr = values['RAWFLUX_'+band], values['RAWFLUXERR_'+band]
+                chisq, bic = values['CHISQ_'+band], values['BIC_'+band]
+                self.logger.info(f"    Model({band}):        {src.name}")
+                self.logger.info(f'    Position({band}):     {pos}')
+                # print(values['RAWFLUX_'+band])
+                self.logger.info(f'    Raw Flux({band}):     {rawflux:3.3f} +/- {rawfluxerr:3.3f}')
+                if 'SersicCore' in src.name:
+                    rawfluxcore, rawfluxcoreerr = values['RAWFLUXCORE_'+band], values['RAWFLUXCOREERR_'+band]
+                    self.logger.info(f'    Raw FluxCore({band}): {rawfluxcore:3.3f} +/- {rawfluxcoreerr:3.3f}')
+                self.logger.info(f'    Flux({band}):         {flux:3.3f} +/- {fluxerr:3.3f} uJy')               
+                self.logger.info(f'    Mag({band}):          {mag:3.3f} +/- {magerr:3.3f} AB')
+                self.logger.info(f'    Chi2({band}):         {chisq:3.3f}')
+                self.logger.info(f'    BIC({band}):          {bic:3.3f}')
+                self.logger.info(f'    Chi2 No Model({band}): {self.chisq_nomodel[row,i]:3.3f}')
+                self.logger.info(f'    Res. Chi({band}):     {self.chi_mu[row,i]:3.3f}+/-{self.chi_sig[row,i]:3.3f}')
+                self.logger.info(f'    DAgostino K2({band}): {self.k2[row,i]:3.3f}')
+                self.logger.info(f'    Seg Raw Flux({band}): {self.seg_rawflux[row,i]:3.3f}')
+                self.logger.info(f'    Zpt({band}):          {zpt:3.3f} AB')
             
 
         # # Just do the positions again - more straightforward to do it here than in interface.py
         # # Why do we need this!? Should we not be adding in extra X/Y if the force_position is turned off?
-        # self.bcatalog[row]['x'] = self.bcatalog[row]['x'] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
-        # self.bcatalog[row]['y'] = self.bcatalog[row]['y'] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
-        self.bcatalog[row][f'X_MODEL'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
-        self.bcatalog[row][f'Y_MODEL'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
+        # values['x'] = values['x'] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
+        # values['y'] = values['y'] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
+        values[f'X_MODEL'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
+        values[f'Y_MODEL'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
         if self.wcs is not None:
             skyc = self.brick_wcs.all_pix2world(src.pos[0] + self.subvector[1], src.pos[1] + self.subvector[0], 0)
-            self.bcatalog[row][f'RA'] = skyc[0]
-            self.bcatalog[row][f'DEC'] = skyc[1]
+            values[f'RA'] = skyc[0]
+            values[f'DEC'] = skyc[1]
             self.logger.info(f"    Model position:      {src.pos[0]:6.6f}, {src.pos[1]:6.6f}")
             self.logger.info(f"    Sky Model RA, Dec:   {skyc[0]:6.6f} deg, {skyc[1]:6.6f} deg")
 
@@ -2283,110 +2659,115 @@ class Blob(Subimage):
                 mod_band = conf.MODELING_NICKNAME
             else:
                 mod_band = self.bands[0]
-            self.bcatalog[row]['x'] = self.bcatalog[row]['x'] + self.subvector[1] #+ self.mosaic_origin[1] - conf.BRICK_BUFFER
-            self.bcatalog[row]['y'] = self.bcatalog[row]['y'] + self.subvector[0] #+ self.mosaic_origin[0] - conf.BRICK_BUFFER
-            self.bcatalog[row][f'X_MODEL_{mod_band}'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
-            self.bcatalog[row][f'Y_MODEL_{mod_band}'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
-            self.logger.info(f"    Detection Position: {self.bcatalog[row]['x']:3.3f}, {self.bcatalog[row]['y']:3.3f}")
-            self.logger.info(f"    Model Position:     {self.bcatalog[row][f'X_MODEL_{mod_band}']:3.3f}, {self.bcatalog[row][f'Y_MODEL_{mod_band}']:3.3f}")
+            values['x'] = self.bcatalog['x'][row] + self.subvector[1] #+ self.mosaic_origin[1] - conf.BRICK_BUFFER
+            values['y'] = self.bcatalog['y'][row] + self.subvector[0] #+ self.mosaic_origin[0] - conf.BRICK_BUFFER
+            values[f'X_MODEL_{mod_band}'] = src.pos[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER
+            values[f'Y_MODEL_{mod_band}'] = src.pos[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER
+            self.logger.info(f"    Detection Position: {values['x']:3.3f}, {values['y']:3.3f}")
+            self.logger.info(f"    Model Position:     {values[f'X_MODEL_{mod_band}']:3.3f}, {values[f'Y_MODEL_{mod_band}']:3.3f}")
             self.logger.debug(f"   Blob Origin:        {self.subvector[1]:3.3f}, {self.subvector[0]:3.3f}")
             self.logger.debug(f"   Mosaic Origin:      {self.mosaic_origin[1]:3.3f}, {self.mosaic_origin[0]:3.3f}")
             self.logger.debug(f"   Brick Buffer:       {conf.BRICK_BUFFER:3.3f}")
-            self.bcatalog[row][f'XERR_MODEL_{mod_band}'] = np.sqrt(self.position_variance[row].pos.getParams()[0])
-            self.bcatalog[row][f'YERR_MODEL_{mod_band}'] = np.sqrt(self.position_variance[row].pos.getParams()[1])
+            values[f'XERR_MODEL_{mod_band}'] = np.sqrt(self.position_variance[row].pos.getParams()[0])
+            values[f'YERR_MODEL_{mod_band}'] = np.sqrt(self.position_variance[row].pos.getParams()[1])
             if self.brick_wcs is not None:
                 skyc = self.brick_wcs.all_pix2world(src.pos[0] + self.subvector[1], src.pos[1] + self.subvector[0], 0)
-                self.bcatalog[row][f'RA_{mod_band}'] = skyc[0]
-                self.bcatalog[row][f'DEC_{mod_band}'] = skyc[1]
+                values[f'RA_{mod_band}'] = skyc[0]
+                values[f'DEC_{mod_band}'] = skyc[1]
                 self.logger.info(f"    Sky Model RA, Dec:   {skyc[0]:6.6f} deg, {skyc[1]:6.6f} deg")
 
             # Model Parameters
-            self.bcatalog[row][f'SOLMODEL_{mod_band}'] = src.name
-            self.bcatalog[row][f'VALID_SOURCE_{mod_band}'] = valid_source
-            # self.bcatalog[row]['N_BLOB'] = self.n_sources
+            values[f'SOLMODEL_{mod_band}'] = src.name
+            if f'EARLY_EXIT_{mod_band}' in self.bcatalog.colnames:
+                values[f'EARLY_EXIT_{mod_band}'] = self.early_exit[row]
+            values[f'VALID_SOURCE_{mod_band}'] = valid_source
+            # values['N_BLOB'] = self.n_sources
 
             if src.name in ('ExpGalaxy', 'DevGalaxy', 'SersicGalaxy', 'SersicCoreGalaxy'):
-                self.bcatalog[row][f'REFF_{mod_band}'] = src.shape.logre
-                self.bcatalog[row][f'REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[0])
-                self.bcatalog[row][f'EE1_{mod_band}'] = src.shape.ee1
-                self.bcatalog[row][f'EE2_{mod_band}'] = src.shape.ee2
+                values[f'REFF_{mod_band}'] = src.shape.logre
+                values[f'REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[0])
+                values[f'EE1_{mod_band}'] = src.shape.ee1
+                values[f'EE2_{mod_band}'] = src.shape.ee2
                 if (src.shape.e >= 1) | (src.shape.e <= -1):
-                    # self.bcatalog[row][f'VALID_SOURCE'] = False
-                    self.bcatalog[row][f'AB_{mod_band}'] = -99.0
+                    # values[f'VALID_SOURCE'] = False
+                    values[f'AB_{mod_band}'] = -99.0
                     self.logger.warning(f'Source has invalid ellipticity! (e = {src.shape.e:3.3f})')
                 else:
-                    self.bcatalog[row][f'AB_{mod_band}'] = (src.shape.e + 1) / (1 - src.shape.e)
-                self.bcatalog[row][f'AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[1])
-                self.bcatalog[row][f'THETA_{mod_band}'] = np.rad2deg(src.shape.theta)
-                self.bcatalog[row][f'THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[2])
+                    values[f'AB_{mod_band}'] = (src.shape.e + 1) / (1 - src.shape.e)
+                values[f'AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[1])
+                values[f'THETA_{mod_band}'] = np.rad2deg(src.shape.theta)
+                values[f'THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shape.getParams()[2])
 
-                self.logger.info(f"    Reff:               {self.bcatalog[row][f'REFF_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'REFF_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    a/b:                {self.bcatalog[row][f'AB_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'AB_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    pa:                 {self.bcatalog[row][f'THETA_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'THETA_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    Reff:               {values[f'REFF_{mod_band}']:3.3f} +/- {values[f'REFF_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    a/b:                {values[f'AB_{mod_band}']:3.3f} +/- {values[f'AB_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    pa:                 {values[f'THETA_{mod_band}']:3.3f} +/- {values[f'THETA_ERR_{mod_band}']:3.3f}")
 
                 if src.name in ('SersicGalaxy', 'SersicCoreGalaxy'):
-                    self.bcatalog[row][f'N_{mod_band}'] = src.sersicindex.val
-                    self.bcatalog[row][f'N_ERR_{mod_band}'] = np.sqrt(param_var[row].sersicindex.val)
+                    values[f'N_{mod_band}'] = src.sersicindex.val
+                    values[f'N_ERR_{mod_band}'] = np.sqrt(param_var[row].sersicindex.val)
 
-                    self.logger.info(f"    N:                  {self.bcatalog[row][f'N_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'N_ERR_{mod_band}']:3.3f}")
+                    self.logger.info(f"    N:                  {values[f'N_{mod_band}']:3.3f} +/- {values[f'N_ERR_{mod_band}']:3.3f}")
 
 
             elif src.name == 'FixedCompositeGalaxy':
-                self.bcatalog[row][f'FRACDEV_{mod_band}'] = src.fracDev.getValue()
-                self.bcatalog[row][f'EXP_REFF_{mod_band}'] = src.shapeExp.logre
-                self.bcatalog[row][f'EXP_REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[0])
+                values[f'FRACDEV_{mod_band}'] = src.fracDev.getValue()
+                values[f'EXP_REFF_{mod_band}'] = src.shapeExp.logre
+                values[f'EXP_REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[0])
                 if (src.shapeExp.e >= 1) | (src.shapeExp.e <= -1):
-                    # self.bcatalog[row][f'VALID_SOURCE'] = False
-                    self.bcatalog[row][f'EXP_AB_{mod_band}'] = -99.0
+                    # values[f'VALID_SOURCE'] = False
+                    values[f'EXP_AB_{mod_band}'] = -99.0
                     self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeExp.e:3.3f})')
                 else:
-                    self.bcatalog[row][f'EXP_AB_{mod_band}'] = (src.shapeExp.e + 1) / (1 - src.shapeExp.e)
-                self.bcatalog[row][f'EXP_AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[1])
-                self.bcatalog[row][f'EXP_THETA_{mod_band}'] = np.rad2deg(src.shapeExp.theta)
-                self.bcatalog[row][f'EXP_THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[2])
-                self.bcatalog[row][f'DEV_REFF_{mod_band}'] = src.shapeDev.logre
-                self.bcatalog[row][f'DEV_REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[0])
+                    values[f'EXP_AB_{mod_band}'] = (src.shapeExp.e + 1) / (1 - src.shapeExp.e)
+                values[f'EXP_AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[1])
+                values[f'EXP_THETA_{mod_band}'] = np.rad2deg(src.shapeExp.theta)
+                values[f'EXP_THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeExp.getParams()[2])
+                values[f'DEV_REFF_{mod_band}'] = src.shapeDev.logre
+                values[f'DEV_REFF_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[0])
                 if (src.shapeDev.e >= 1) | (src.shapeDev.e <= -1):
-                    # self.bcatalog[row][f'VALID_SOURCE'] = False
-                    self.bcatalog[row][f'DEV_AB_{mod_band}'] = -99.0
+                    # values[f'VALID_SOURCE'] = False
+                    values[f'DEV_AB_{mod_band}'] = -99.0
                     self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeDev.e:3.3f})')
                 else:
-                    self.bcatalog[row][f'DEV_AB_{mod_band}'] = (src.shapeDev.e + 1) / (1 - src.shapeDev.e)
-                self.bcatalog[row][f'DEV_AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[1])
-                self.bcatalog[row][f'DEV_THETA_{mod_band}'] = np.rad2deg(src.shapeDev.theta)
-                self.bcatalog[row][f'DEV_THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[2])
-                # self.bcatalog[row][f'reff_err'] = np.sqrt(self.parameter_variance[row][0])
-                # self.bcatalog[row][f'ab_err'] = np.sqrt(self.parameter_variance[row][1])
-                # self.bcatalog[row][f'phi_err'] = np.sqrt(self.parameter_variance[row][2])
+                    values[f'DEV_AB_{mod_band}'] = (src.shapeDev.e + 1) / (1 - src.shapeDev.e)
+                values[f'DEV_AB_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[1])
+                values[f'DEV_THETA_{mod_band}'] = np.rad2deg(src.shapeDev.theta)
+                values[f'DEV_THETA_ERR_{mod_band}'] = np.sqrt(self.parameter_variance[row].shapeDev.getParams()[2])
+                # values[f'reff_err'] = np.sqrt(self.parameter_variance[row][0])
+                # values[f'ab_err'] = np.sqrt(self.parameter_variance[row][1])
+                # values[f'phi_err'] = np.sqrt(self.parameter_variance[row][2])
 
-                self.bcatalog[row][f'EXP_EE1_{mod_band}'] = src.shapeExp.ee1
-                self.bcatalog[row][f'EXP_EE2_{mod_band}'] = src.shapeExp.ee2
-                self.bcatalog[row][f'DEV_EE1_{mod_band}'] = src.shapeDev.ee1
-                self.bcatalog[row][f'DEV_EE2_{mod_band}'] = src.shapeDev.ee2
+                values[f'EXP_EE1_{mod_band}'] = src.shapeExp.ee1
+                values[f'EXP_EE2_{mod_band}'] = src.shapeExp.ee2
+                values[f'DEV_EE1_{mod_band}'] = src.shapeDev.ee1
+                values[f'DEV_EE2_{mod_band}'] = src.shapeDev.ee2
 
 
                 if (src.shapeExp.e >= 1) | (src.shapeExp.e <= -1):
-                    # self.bcatalog[row]['VALID_SOURCE'] = False
+                    # values['VALID_SOURCE'] = False
                     self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeExp.e:3.3f})')
 
 
                 if (src.shapeDev.e >= 1) | (src.shapeDev.e <= -1):
-                    # self.bcatalog[row]['VALID_SOURCE'] = False
+                    # values['VALID_SOURCE'] = False
                     self.logger.warning(f'Source has invalid ellipticity! (e = {src.shapeDev.e:3.3f})')
 
 
-                self.logger.info(f"    Reff(Exp):          {self.bcatalog[row][f'EXP_REFF_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'EXP_REFF_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    a/b (Exp):          {self.bcatalog[row][f'EXP_AB_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'EXP_AB_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    pa  (Exp):          {self.bcatalog[row][f'EXP_THETA_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'EXP_THETA_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    Reff(Dev):          {self.bcatalog[row][f'DEV_REFF_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'DEV_REFF_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    a/b (Dev):          {self.bcatalog[row][f'DEV_AB_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'DEV_AB_ERR_{mod_band}']:3.3f}")
-                self.logger.info(f"    pa  (Dev):          {self.bcatalog[row][f'DEV_THETA_{mod_band}']:3.3f} +/- {self.bcatalog[row][f'DEV_THETA_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    Reff(Exp):          {values[f'EXP_REFF_{mod_band}']:3.3f} +/- {values[f'EXP_REFF_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    a/b (Exp):          {values[f'EXP_AB_{mod_band}']:3.3f} +/- {values[f'EXP_AB_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    pa  (Exp):          {values[f'EXP_THETA_{mod_band}']:3.3f} +/- {values[f'EXP_THETA_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    Reff(Dev):          {values[f'DEV_REFF_{mod_band}']:3.3f} +/- {values[f'DEV_REFF_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    a/b (Dev):          {values[f'DEV_AB_{mod_band}']:3.3f} +/- {values[f'DEV_AB_ERR_{mod_band}']:3.3f}")
+                self.logger.info(f"    pa  (Dev):          {values[f'DEV_THETA_{mod_band}']:3.3f} +/- {values[f'DEV_THETA_ERR_{mod_band}']:3.3f}")
 
             elif src.name not in ('PointSource', 'SimpleGalaxy'): # last resort
                 self.logger.warning(f"Source does not have a valid solution model!")
                 valid_source = False
-                self.bcatalog[row][f'VALID_SOURCE_{mod_band}'] = valid_source
+                values[f'VALID_SOURCE_{mod_band}'] = valid_source
+
+        return values
 
+    @timed('rao_cramer')
     def rao_cramer(self, bands=None):
 
         if bands is None:
@@ -2397,31 +2778,24 @@ class Blob(Subimage):
         for i, band in enumerate(bands): # this will really just be one band.
             # Prepare matrix
             try:
-                im = tr.getImage(i).data
-                inverr = np.sqrt(tr.getImage(i).invvar)
-                store_mod = np.zeros_like(self.model_catalog)
-                for j, m in enumerate(self.model_catalog):
-                    trm = Tractor([tr.getImage(i),], [m,])
-                    # trm.freezeParams('images') # Not doing tractor here...
-                    store_mod[j] = trm.getModelImage(i).flatten()
-
-                # More prep work
-                _A = np.vstack(store_mod)
-                renorm = _A.sum(axis=1)
-                # print(renorm)
-                _A = (_A.T/renorm).T
-
-                # print(_A.shape)
-                _Ax = (_A*inverr.flatten()).T
-                _yx = (im*inverr).flatten()
-
-                _coeffs = np.linalg.lstsq(_Ax, _yx, rcond=None)
-
-                # collect + output
-                flux = _coeffs[0]  ## WE ARE NOT RUNNING FLUXES!
-                # flux = -99.0 * np.ones(len(self.bcatalog))
-                covar = np.matrix(np.dot(_Ax.T, _Ax)).I.A
-                err = np.sqrt(covar.diagonal())
+                if band in self.linear_solution:
+                    # The forced fluxes already solved this system, up to the normalisation
+                    lin_flux, lin_var, renorm = self.linear_solution[band]
+                    flux = lin_flux * renorm
+                    err = np.sqrt(lin_var) * renorm
+                else:
+                    timg = tr.getImage(i)
+                    im = timg.data
+                    patches = [clip_patch(m.getModelPatch(timg), np.shape(im)) for m in self.model_catalog]
+
+                    # Fisher matrix of the models normalised to their flux within the cutout
+                    fisher, bvec, renorm = patch_normal_equations(patches, im, timg.invvar)
+                    fisher /= np.outer(renorm, renorm)
+                    bvec /= renorm
+
+                    # collect + output
+                    flux, covar = solve_normal_equations(fisher, bvec)
+                    err = np.sqrt(covar.diagonal())
 
                 zpt = conf.MULTIBAND_ZPT[self._band2idx(band)]
 
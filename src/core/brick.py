@@ -19,11 +19,16 @@ None
 
 import os
 import sys
+import time
+import pickle
+import shutil
+from copy import deepcopy
+from functools import partial
 import numpy as np
 
 from astropy.table import Column
 from astropy.io import fits
-from scipy.ndimage import label, binary_dilation, binary_erosion, binary_fill_holes
+from scipy.ndimage import label, binary_dilation, binary_erosion, binary_fill_holes, find_objects
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 from scipy.ndimage import zoom
@@ -37,11 +42,104 @@ from tractor.psf import HybridPixelizedPSF
 from .utils import create_circular_mask, SimpleGalaxy
 from .visualization import plot_blobmap, plot_detblob, plot_fblob
 from .subimage import Subimage
-from .blob import Blob
+from .blob import Blob, psf_cache, prf_store
 import config as conf
+import pathos as pa
 
 import logging
 
+# Brick arrays that Brick.share puts in read-only memmaps rather than the pickle
+SHARED_ARRAYS = ('_images', '_weights', '_masks', 'segmap', '_blobmap', 'background_images', 'background_rms_images')
+
+
+def load_shared_brick(path):
+    """Rebuilds a brick written by Brick.share, with its arrays as read-only memmaps"""
+    brick = Brick.__new__(Brick)
+    with open(os.path.join(path, 'brick.pkl'), 'rb') as f:
+        brick.__dict__.update(pickle.load(f))
+    for attr in SHARED_ARRAYS:
+        fname = os.path.join(path, f'{attr.strip("_")}.npy')
+        brick.__dict__[attr] = np.load(fname, mmap_mode='r') if os.path.exists(fname) else None
+    return brick
+
+
+def render_model_tile(tile, include_chi=True):
+    """Model (and chi) images of one tile. The tile is rendered with its padding, so that sources just
+    outside still add their wings, and only the tile itself is kept."""
+    (y0, y1, x0, x1), (py0, py1, px0, px1), psfmodels, bands, sources = tile
+    shape = (py1 - py0, px1 - px0)
+    timages = [Image(data=np.zeros(shape),
+                     invvar=np.ones(shape),
+                     psf=psfmodel,
+                     wcs=NullWCS(dx=-px0, dy=-py0),
+                     photocal=FluxesPhotoCal(band),
+                     sky=ConstantSky(0.),
+                     name=band) for psfmodel, band in zip(psfmodels, bands)]
+    tr = Tractor(timages, sources)
+    core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+    models = np.array([tr.getModelImage(k)[core] for k in np.arange(len(bands))])
+    chis = None
+    if include_chi:
+        chis = np.array([tr.getChiImage(k)[core] for k in np.arange(len(bands))])
+    return (y0, y1, x0, x1), models, chis
+
+
+def effective_sources(catalog, band, modeling=False):
+    """Which sources of the catalog pass the residual rejections (RESIDUAL_CHISQ_REJECTION, RESIDUAL_NEGFLUX_REJECTION
+    and RESIDUAL_AB_REJECTION) in band, with a whole column at a time"""
+    accepted = np.ones(len(catalog), dtype=bool)
+    if modeling:
+        raw_fluxes = np.asarray(catalog[f'FLUX_{conf.MODELING_NICKNAME}_{band}'])
+    else:
+        raw_fluxes = np.asarray(catalog[f'FLUX_{band}'])
+
+    if conf.RESIDUAL_CHISQ_REJECTION is not None:
+        if modeling:
+            chisq_band = np.asarray(catalog[f'CHISQ_MODELING_{band}'])
+        else:
+            chisq_band = np.asarray(catalog[f'CHISQ_{band}'])
+        accepted &= ~(chisq_band > conf.RESIDUAL_CHISQ_REJECTION)
+
+    if conf.RESIDUAL_NEGFLUX_REJECTION:
+        accepted &= ~(raw_fluxes <= 0.0)
+
+    if conf.RESIDUAL_AB_REJECTION is not None:  # HACK -- does NOT apply to unfixed shapes!
+        solmodel = np.asarray(catalog[f'SOLMODEL_{conf.MODELING_NICKNAME}']).astype(str)
+        single = np.isin(solmodel, ('ExpGalaxy', 'DevGalaxy'))
+        composite = ~single & ~np.isin(solmodel, ('PointSource', 'SimpleGalaxy'))
+        for cols, rows in (((f'AB_{conf.MODELING_NICKNAME}',), single),
+                           ((f'EXP_AB_{conf.MODELING_NICKNAME}', f'DEV_AB_{conf.MODELING_NICKNAME}'), composite)):
+            if not np.any(rows):
+                continue
+            for col in cols:
+                ab = np.asarray(catalog[col])[rows]
+                accepted[rows] &= ~((ab > conf.RESIDUAL_AB_REJECTION) | (ab <= 0))
+
+    return accepted
+
+
+def effective_area_pixels(segmap, mask, source_ids):
+    """Good and inner area (pix) of a brick. Unmasked pixels of the inner region that are in no segment are good,
+    and so are the segments of source_ids (see effective_sources), all counted in a single pass."""
+    inner_area_pix = (conf.BRICK_WIDTH) * (conf.BRICK_HEIGHT)
+    source_ids = np.asarray(source_ids, dtype=int)
+    source_ids = source_ids[source_ids >= 0]
+    segmap = np.asarray(segmap)
+
+    # lookup of the good segments, indexed by segment id
+    good_segment = np.zeros(max(segmap.max(), source_ids.max(initial=0)) + 1, dtype=bool)
+    good_segment[source_ids] = True
+    residual_mask = good_segment[segmap]
+
+    inner = np.zeros_like(residual_mask)
+    inner[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = True  # inner region ok
+    residual_mask |= inner & ~np.asarray(mask, dtype=bool) & (segmap == 0)
+
+    # HACK -- this is a slight estimationf in the case that a source bleeds into the buffer, but it is EXACT for the good area!
+    good_area_pix = np.sum(residual_mask)
+    return good_area_pix, inner_area_pix
+
+
 class Brick(Subimage):
     """TODO: docstring"""
 
@@ -105,6 +203,79 @@ class Brick(Subimage):
     def buffer(self):
         return self._buffer
 
+    @property
+    def blobmap(self):
+        return self._blobmap
+
+    @blobmap.setter
+    def blobmap(self, value):
+        # Any new blobmap invalidates the blob index; it is rebuilt on demand
+        self._blobmap = value
+        self._blob_slices = None
+        self._blob_npix = None
+
+    def index_blobs(self):
+        """Find the bounding box and pixel count of every blob in a single pass over the blobmap"""
+        tstart = time.time()
+        blobmap = np.asarray(self.blobmap).astype(int, copy=False)
+        self._blob_slices = find_objects(blobmap)
+        self._blob_npix = np.bincount(blobmap.ravel(), minlength=len(self._blob_slices)+1)
+        self.logger.debug(f'Indexed {len(self._blob_slices)} blobs ({time.time() - tstart:3.3f}s)')
+
+    def get_blob_slice(self, blob_id):
+        """Returns the bounding box slice and pixel count of a blob from the blob index"""
+        if self._blob_slices is None:
+            self.index_blobs()
+
+        if (blob_id < 1) or (blob_id > len(self._blob_slices)) or (self._blob_slices[blob_id-1] is None):
+            raise ValueError(f'Blob #{blob_id} has no pixels in the blobmap!')
+
+        return self._blob_slices[blob_id-1], self._blob_npix[blob_id]
+
+    def blob_costs(self, blob_ids):
+        """Rough relative run time of each blob, as bounding box pixels x sources x bands"""
+        if self._blob_slices is None:
+            self.index_blobs()
+
+        n_slices = len(self._blob_slices)
+        blob_col = np.asarray(self.catalog['blob_id'], dtype=int)
+        n_sources = np.bincount(blob_col, minlength=max(n_slices, blob_col.max(initial=0))+1)
+        costs = np.zeros(len(blob_ids))
+        for i, blob_id in enumerate(blob_ids):
+            if (blob_id < 1) or (blob_id > n_slices) or (self._blob_slices[blob_id-1] is None):
+                continue
+            yslice, xslice = self._blob_slices[blob_id-1]
+            costs[i] = (yslice.stop - yslice.start) * (xslice.stop - xslice.start) * n_sources[blob_id]
+        return costs * len(self.bands)
+
+    def share(self, path=None):
+        """Dumps the brick arrays to read-only memmaps and the rest of the brick to a pickle, once.
+
+        Workers attach to it with load_shared_brick and build their blobs locally,
+        so only blob ids need to cross the process boundary.
+        """
+        tstart = time.time()
+        if path is None:
+            path = os.path.join(conf.INTERIM_DIR, f'B{self.brick_id}_SHARED')
+        if os.path.exists(path):
+            # left over from a run that died, whose arrays must not be picked up again
+            shutil.rmtree(path)
+        os.makedirs(path)
+        if self._blob_slices is None:
+            self.index_blobs()
+
+        state = self.__dict__.copy()
+        for attr in SHARED_ARRAYS:
+            array = state.pop(attr, None)
+            if array is None:
+                continue
+            np.save(os.path.join(path, f'{attr.strip("_")}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(path, 'brick.pkl'), 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.logger.info(f'Brick #{self.brick_id} shared to {path} ({time.time() - tstart:3.3f}s)')
+        return path
+
     def cleanup(self):
         """TODO: docstring"""
 
@@ -206,23 +377,24 @@ class Brick(Subimage):
         self._allowed_sources = (coords[:,0] > self._buff_left) & (coords[:,0] < self._buff_right )\
                         & (coords[:,1] > self._buff_bottom) & (coords[:,1] < self._buff_top)
         
-        idx = np.where(~self._allowed_sources)[0]
-        for i in idx:
-            self.segmap[self.segmap == i+1] = 0
+        self._drop_segments(np.where(~self._allowed_sources)[0] + 1)
 
     def clean_segmap_withmask(self):
         """TODO: docstring"""
         self.logger.info('Removing sources in the mask')
-        coords = np.array([self.catalog['x'], self.catalog['y']]).T
-        # self._allowed_sources = ...$
-        for i, coord in enumerate(coords):
-            iy, ix = np.round(coord, 0).astype(int)
-            if self.masks[0][ix, iy]:
-                self._allowed_sources[i] = False
+        ix = np.round(np.array(self.catalog['x'])).astype(int)
+        iy = np.round(np.array(self.catalog['y'])).astype(int)
+        self._allowed_sources &= ~np.array(self.masks[0][iy, ix], dtype=bool)
 
-        idx = np.where(~self._allowed_sources)[0]
-        for i in idx:
-            self.segmap[self.segmap == i+1] = 0
+        self._drop_segments(np.where(~self._allowed_sources)[0] + 1)
+
+    def _drop_segments(self, segment_ids):
+        """Zero out the given segments with one lookup-table pass over the segmap"""
+        if len(segment_ids) == 0:
+            return
+        lut = np.arange(max(self.segmap.max(), np.max(segment_ids)) + 1, dtype=self.segmap.dtype)
+        lut[segment_ids] = 0
+        self.segmap = lut[self.segmap]
 
     def clean_catalog(self):
         """TODO: docstring"""
@@ -304,6 +476,8 @@ class Brick(Subimage):
                     self.catalog.add_column(Column(np.zeros(len(self.catalog), dtype='S20'), name=f'SOLMODEL_{colname}'))
                 except:
                     pass  # This is a bit silly, but it gets around the issue of an input catalog already having these columns...
+                if f'EARLY_EXIT_{colname}' not in self.catalog.colnames:
+                    self.catalog.add_column(Column(boolfiller, name=f'EARLY_EXIT_{colname}'))
                 
                 for colname_fill in [f'{colext}_{colname}' for colext in ('REFF', 'REFF_ERR', 'EE1', 'EE2', 'AB', 'AB_ERR', 'THETA', 'THETA_ERR',
                             'N', 'N_ERR',
@@ -321,6 +495,7 @@ class Brick(Subimage):
                 for colname_fill in [f'{colext}_{colname}' for colext in ('X_MODEL', 'Y_MODEL', 'XERR_MODEL', 'YERR_MODEL', 'RA', 'DEC')]:
                     self.catalog.add_column(Column(filler, name=colname_fill))
                 self.catalog.add_column(Column(np.zeros(len(self.catalog), dtype='S20'), name=f'SOLMODEL_{colname}'))
+                self.catalog.add_column(Column(boolfiller, name=f'EARLY_EXIT_{colname}'))
                 self.catalog.add_column(Column(boolfiller, name=f'VALID_SOURCE_{conf.MODELING_NICKNAME}'))
 
                 # self.catalog.add_column(Column(np.zeros(len(self.catalog), dtype=bool), name=f'VALID_SOURCE_{colname}'))
@@ -357,11 +532,11 @@ class Brick(Subimage):
                 self.logger.info(f'Eroding segments with radius of {radius}px')
                 segmask = binary_erosion(segmask, structure=struct2).astype(int)
 
-                uniq_sm = np.unique(self.segmap)[1:]
-                keep = np.array([np.sum(self.segmap==i) < 50 for i in uniq_sm])
+                npix = np.bincount(self.segmap.ravel())
+                keep = (npix > 0) & (npix < 50)
+                keep[0] = False
                 self.logger.info(f'Found {np.sum(keep)} segments smaller than {conf.SEGMAP_MINAREA} px2 to re-instate.')
-                for i in uniq_sm[keep]:
-                    segmask[self.segmap == i] = 1
+                segmask[keep[self.segmap]] = 1
 
             if fill_holes:
                 segmask = binary_fill_holes(segmask).astype(int)
@@ -385,64 +560,30 @@ class Brick(Subimage):
 
         # Check that no sources were cut out!
         self.logger.info('Checking that all sources have a segment')
-        sxy = []
-        trip = False
-        keep = np.ones(len(self.catalog), dtype=bool)
-        for i, sid in enumerate(self.catalog['source_id']):
-            px, py = x[i], y[i]
-            segval = self.segmap[py, px]
-            if segval != sid:
-                sxy.append((px, py))
-                self.logger.warning(f'Source {sid} is missing a segment, sits on {segval} at ({px}, {py}).')
-                trip = True
-                keep[i] = False
+        self._check_segments(x, y)
         
         self.logger.info('Cleaning blobmap')
-        n_rm = 0
-        pix_rm = 0
-        uniq_bm = np.unique(self.blobmap)
-        
-        for i in uniq_bm:
-            if i == 0:
-                continue
-            mask = self.blobmap==i
-            n_px = np.sum(mask)
-
-            if (mask[y, x] == 1).any(): # is there a centroid in the blob?
-                continue
-            else:
-                self.blobmap[mask] = 0
-                sids = np.unique(self.segmap[mask])
-                sids = sids[sids!=0]
-                self.logger.debug(f'   Removed blob #{i} with size {np.sum(mask)} ({sids})')
-                n_rm += 1
-                pix_rm +=1
-                
-                # if np.sum(mask) > 50:
-                #     import matplotlib.pyplot as plt
-                #     plt.figure(figsize=(20,20))
-                #     plt.imshow(mask)
-                #     plt.scatter(x, y, s=1)
-                #     plt.savefig(conf.PLOT_DIR + f'/checkplot_{i}')
-                #     plt.close('all')
+        # A blob survives only if a source centroid falls in it
+        npix = np.bincount(self.blobmap.ravel())
+        has_source = np.zeros(len(npix), dtype=bool)
+        has_source[self.blobmap[y, x]] = True
+        removed = np.where((npix > 0) & ~has_source)[0]
+        removed = removed[removed != 0]
+        n_rm, pix_rm = len(removed), np.sum(npix[removed])
+        if n_rm > 0:
+            self.logger.debug(f'   Removed blobs {removed} with sizes {npix[removed]}')
+            lut = np.arange(len(npix), dtype=self.blobmap.dtype)
+            lut[removed] = 0
+            self.blobmap = lut[self.blobmap]
             
-        self.logger.info(f'Cleaned out {n_rm}/{len(uniq_bm)} blobs ({100*pix_rm/mask.size:2.3f}% by area)')
+        self.logger.info(f'Cleaned out {n_rm}/{np.sum(npix > 0)} blobs ({100*pix_rm/self.blobmap.size:2.3f}% by area)')
         
         self.segmap[self.blobmap == 0] = 0 # blobs are smaller than segs, so just cut away segs...
         self.segmask[self.blobmap == 0] = 0
 
         # Check that no sources were cut out!
-        sxy = []
-        trip = False
-        keep = np.ones(len(self.catalog), dtype=bool)
-        for i, sid in enumerate(self.catalog['source_id']):
-            px, py = x[i], y[i]
-            segval = self.segmap[py, px]
-            if segval != sid:
-                sxy.append((px, py))
-                self.logger.warning(f'Source {sid} is missing a segment, sits on {segval} at ({px}, {py}).')
-                trip = True
-                keep[i] = False
+        keep, sxy = self._check_segments(x, y)
+        trip = not keep.all()
 
         self.catalog = self.catalog[keep]
         self.n_sources = np.sum(keep)
@@ -458,18 +599,35 @@ class Brick(Subimage):
 
         self.relabel() # clean it up again.
 
+    def _check_segments(self, x, y):
+        """Flags sources whose centroid pixel is not in their own segment"""
+        sids = np.array(self.catalog['source_id'])
+        segval = self.segmap[y, x]
+        keep = segval == sids
+        sxy = []
+        for i in np.where(~keep)[0]:
+            sxy.append((x[i], y[i]))
+            self.logger.warning(f'Source {sids[i]} is missing a segment, sits on {segval[i]} at ({x[i]}, {y[i]}).')
+        return keep, sxy
+
     def add_ids(self):
         """TODO: docstring. rename sid and bid throughout"""
         brick_col = float(self.brick_id) * np.ones(self.n_sources, dtype=int)
         self.catalog.add_column(Column(brick_col.astype(int), name='brick_id'), 1)
 
-        blob_col = np.array([np.unique(self.blobmap[self.segmap == sid])[0] for sid in self.catalog['source_id']])
+        # Pair each segment with its blob in one pass; a segment takes the lowest blob label it touches
+        sids = np.array(self.catalog['source_id'])
+        insegment = self.segmap > 0
+        seg_blob = np.full(max(self.segmap.max(), sids.max()) + 1, np.iinfo(int).max)
+        np.minimum.at(seg_blob, self.segmap[insegment], self.blobmap[insegment].astype(int))
+        blob_col = seg_blob[sids]
+        missing = blob_col == np.iinfo(int).max
+        if missing.any():
+            self.logger.warning(f'{np.sum(missing)} sources have no segment pixels left: {sids[missing]}')
+            blob_col[missing] = 0
         self.catalog.add_column(Column(blob_col.astype(int), name='blob_id'), 1)
 
-        nblob_col = -99*np.ones(len(self.catalog))
-        for bid in np.unique(self.catalog['blob_id']):
-            nbid = np.sum(self.catalog['blob_id'] == bid)
-            nblob_col[self.catalog['blob_id'] == bid] = nbid
+        nblob_col = np.bincount(blob_col)[blob_col]
 
         self.catalog.add_column(Column(nblob_col.astype(int), name='N_BLOB'), 1)
 
@@ -564,6 +722,9 @@ class Brick(Subimage):
         # Figure out which bands are to be run with which setup.
         # The output should be an attribute containing all the model images, in the right order for self.bands
         self.logger.info(f'Making Model images for {self.bands}')
+        if conf.MODEL_TILE_SIZE > 0:
+            self.make_model_image_tiled(catalog, include_chi=include_chi, include_nopsf=include_nopsf, save=save, use_band_position=use_band_position, use_band_shape=use_band_shape, modeling=modeling)
+            return
         if np.in1d(sbands, conf.BANDS).any() & ~np.in1d(sbands, conf.PRFMAP_PSF).any() & ~np.in1d(sbands, conf.PSFGRID).any():
             self.logger.info('Making Models for PSF images')
             self.make_model_image_psf(catalog, include_chi=include_chi, include_nopsf=include_nopsf, save=save, use_band_position=use_band_position, use_band_shape=use_band_shape, modeling=modeling)
@@ -577,6 +738,257 @@ class Brick(Subimage):
         # if not (np.in1d(self.bands, conf.BANDS).any() & ~np.in1d(self.bands, conf.PRFMAP_PSF).any() | np.in1d(self.bands, conf.PRFMAP_PSF).any()):
         #     raise ValueError('')
 
+    def local_psf(self, i, x, y):
+        """PSF of band i at brick pixel (x, y), prepared as for the blobs. None if there is no PSF sample close enough."""
+        band = self.bands[i]
+        band_strip = band
+        if (band_strip != conf.MODELING_NICKNAME) & band_strip.startswith(conf.MODELING_NICKNAME):
+            band_strip = band[len(conf.MODELING_NICKNAME)+1:]
+        psf = self.psfmodels[i]
+
+        if psf is None:
+            if conf.USE_GAUSSIAN_PSF:
+                return NCircularGaussianPSF([conf.PSF_SIGMA / conf.PIXEL_SCALE], [1,])
+            raise ValueError(f'WARNING - No PSF model found for {band}!')
+
+        # Same keys as the blobs, so that both share the PSFs already prepared in this process
+        if (band_strip in conf.PSFGRID) | (band_strip in conf.PRFMAP_PSF):
+            tab_coords, tab_nodes = psf
+            ra, dec = self.wcs.all_pix2world([x], [y], 0)
+            minsep_idx, minsep, __ = SkyCoord(ra=ra*u.degree, dec=dec*u.degree).match_to_catalog_sky(tab_coords)
+            maxsep = conf.PSFGRID_MAXSEP if band_strip in conf.PSFGRID else conf.PRFMAP_MAXSEP
+            if minsep[0] > maxsep*u.arcsec:
+                self.logger.error(f'Separation ({minsep[0].to(u.arcsec)}) exceeds maximum {maxsep}!')
+                return None
+            psf_key = (band, tab_nodes[minsep_idx[0]])
+        elif band_strip in conf.CONSTANT_PSF:
+            psf_key = (band, 'constant')
+        else:
+            psf_key = None # realized where it is needed, so not worth keeping
+
+        if psf_key is not None:
+            psfmodel = psf_cache.get(psf_key)
+            if psfmodel is not None:
+                return psfmodel
+
+        if band_strip in conf.PSFGRID:
+            path_psffile = os.path.join(conf.PSFGRID_OUT_DIR, f'{band_strip}_OUT/{psf_key[1]}.psf')
+            if not os.path.exists(path_psffile):
+                self.logger.error(f'PSF file has not been found! ({path_psffile}')
+                return None
+            psfmodel = PixelizedPsfEx(fn=path_psffile)
+        elif band_strip in conf.PRFMAP_PSF:
+            img = prf_store.get(band_strip, psf_key[1])
+            if img is None:
+                self.logger.error(f'PRF file has not been found! ({prf_store.path(band_strip, psf_key[1])}')
+                return None
+            psfmodel = PixelizedPSF(img.copy())
+        elif band_strip in conf.CONSTANT_PSF:
+            psfmodel = deepcopy(psf.constantPsfAt(conf.MOSAIC_WIDTH/2., conf.MOSAIC_HEIGHT/2.))
+        else:
+            mosaic_x = x + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
+            mosaic_y = y + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
+            psfmodel = psf.constantPsfAt(mosaic_x, mosaic_y)
+
+        pw, ph = np.shape(psfmodel.img)
+        if band_strip in conf.PRFMAP_PSF:
+            if (conf.PRFMAP_MASKRAD > 0) & (not conf.FORCE_GAUSSIAN_PSF):
+                cmask = create_circular_mask(pw, ph, radius=conf.PRFMAP_MASKRAD / conf.PIXEL_SCALE)
+                psfmodel.img[~cmask.astype(bool) & (psfmodel.img > 0)] = 0
+                psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+        elif (band_strip in conf.RMBACK_PSF) & (not conf.FORCE_GAUSSIAN_PSF):
+            cmask = create_circular_mask(pw, ph, radius=conf.PSF_MASKRAD / conf.PIXEL_SCALE)
+            bcmask = ~cmask.astype(bool) & (psfmodel.img > 0)
+            psfmodel.img -= np.nanmax(psfmodel.img[bcmask])
+            psfmodel.img[(psfmodel.img < 0) | np.isnan(psfmodel.img)] = 0
+
+        if conf.PSF_RADIUS > 0:
+            psf_rad_pix = int(conf.PSF_RADIUS / conf.PIXEL_SCALE)
+            psfmodel.img = psfmodel.img[int(pw/2.-psf_rad_pix):int(pw/2+psf_rad_pix), int(ph/2.-psf_rad_pix):int(ph/2+psf_rad_pix)]
+
+        if conf.NORMALIZE_PSF & (not conf.FORCE_GAUSSIAN_PSF):
+            psfmodel.img /= psfmodel.img.sum() # HACK -- force normalization to 1
+
+        if conf.USE_MOG_PSF and (psf_key is not None) and (psf_key[1] == 'constant'):
+            psfmodel = HybridPixelizedPSF(pix=psfmodel, N=10).gauss
+        else:
+            psfmodel.img = psfmodel.img.astype('float32')
+
+        if psf_key is not None:
+            psf_cache.put(psf_key, psfmodel)
+        return psfmodel
+
+    def model_source(self, src, bands, mbands, use_band_position=False, use_band_shape=False):
+        """Tractor model of one catalog source for the brick model images, or None if it is rejected"""
+        best_band = conf.MODELING_NICKNAME
+        band = mbands[-1] # for the band positions and shapes
+
+        raw_fluxes = np.array([src[f'RAWFLUX_{mband}'] for mband in mbands])
+        if conf.RESIDUAL_CHISQ_REJECTION is not None:
+            chisq = np.array([src[f'CHISQ_{mband}'] for mband in mbands])
+            raw_fluxes[chisq > conf.RESIDUAL_CHISQ_REJECTION] = 0.0
+            if (raw_fluxes <= 0.0).all():
+                self.logger.debug('Source has too large chisq in all bands. Rejecting!')
+                return None
+            raw_fluxes[raw_fluxes < 0.0] = 0.0
+
+        if conf.RESIDUAL_NEGFLUX_REJECTION:
+            if (raw_fluxes <= 0.0).all():
+                self.logger.debug('Source has negative flux in all bands. Rejecting!')
+                return None
+            raw_fluxes[raw_fluxes < 0.0] = 0.0
+
+        solmodel = src[f'SOLMODEL_{best_band}']
+        if (conf.RESIDUAL_AB_REJECTION is not None) & (solmodel not in ('PointSource', 'SimpleGalaxy')):  # HACK -- does NOT apply to unfixed shapes!
+            prefixes = ('',) if solmodel in ('ExpGalaxy', 'DevGalaxy') else ('EXP_', 'DEV_')
+            for prefix in prefixes:
+                ab = np.full(len(mbands), src[f'{prefix}AB_{best_band}'])
+                if (ab > conf.RESIDUAL_AB_REJECTION).all() | (ab <= 0).all():
+                    self.logger.debug(f'Source has exessive {prefix.lower()}a/b in all bands. Rejecting!')
+                    return None
+
+        if use_band_position:
+            bx_model = src[f'X_MODEL_{band}'] - self.mosaic_origin[1] + conf.BRICK_BUFFER
+            by_model = src[f'Y_MODEL_{band}'] - self.mosaic_origin[0] + conf.BRICK_BUFFER
+        else:
+            bx_model = src[f'X_MODEL_{best_band}'] - self.mosaic_origin[1] + conf.BRICK_BUFFER
+            by_model = src[f'Y_MODEL_{best_band}'] - self.mosaic_origin[0] + conf.BRICK_BUFFER
+
+        position = PixPos(bx_model, by_model)
+        flux = Fluxes(**dict(zip(bands, raw_fluxes)), order=bands) # IMAGES ARE IN NATIVE ZPT, USE RAWFLUXES!
+        shape_band = band if use_band_shape else best_band
+
+        if solmodel == 'PointSource':
+            model = PointSource(position, flux)
+            model.name = 'PointSource' # HACK to get around Dustin's HACK.
+        elif solmodel == 'SimpleGalaxy':
+            model = SimpleGalaxy(position, flux)
+        elif solmodel in ('ExpGalaxy', 'DevGalaxy'):
+            shape = EllipseESoft(src[f'REFF_{shape_band}'], src[f'EE1_{shape_band}'], src[f'EE2_{shape_band}'])
+            model = (ExpGalaxy if solmodel == 'ExpGalaxy' else DevGalaxy)(position, flux, shape)
+        elif solmodel == 'FixedCompositeGalaxy':
+            shape_exp = EllipseESoft(src[f'EXP_REFF_{shape_band}'], src[f'EXP_EE1_{shape_band}'], src[f'EXP_EE2_{shape_band}'])
+            shape_dev = EllipseESoft(src[f'DEV_REFF_{shape_band}'], src[f'DEV_EE1_{shape_band}'], src[f'DEV_EE2_{shape_band}'])
+            model = FixedCompositeGalaxy(position, flux, SoftenedFracDev(src[f'FRACDEV_{best_band}']), shape_exp, shape_dev)
+        else:
+            self.logger.warning(f'Source #{src["source_id"]}: has no solution model at {position}')
+            return None
+
+        self.logger.debug(f'Source #{src["source_id"]}: {model.name} model at {position}')
+        return model
+
+    def make_model_image_tiled(self, catalog, include_chi=True, include_nopsf=False, save=True, use_band_position=False, use_band_shape=False, modeling=False):
+        """Model images of every band, rendered in MODEL_TILE_SIZE tiles that each have their own local PSF.
+        A tile only renders the sources whose segment, grown by the PSF radius, reaches into it."""
+        tstart = time.time()
+        idx = np.arange(len(self.bands))
+        self.mbands = np.array([f'{conf.MODELING_NICKNAME}_{band}' if modeling & (not band.startswith(conf.MODELING_NICKNAME)) else band for band in self.bands])
+        if conf.MODEL_APPLY_SEGMAP:
+            self.logger.warning('MODEL_APPLY_SEGMAP is not applied to tiled model images.')
+        if include_nopsf:
+            self.logger.warning('INCLUSION OF NO PSF IS CURRENTLY DISABLED.')
+            include_nopsf = False
+
+        # Make models
+        self.model_catalog = np.zeros(len(catalog), dtype=object)
+        self.model_mask = np.zeros(len(catalog), dtype=bool)
+        for i, src in enumerate(catalog):
+            model = self.model_source(src, self.bands, self.mbands, use_band_position=use_band_position, use_band_shape=use_band_shape)
+            if model is not None:
+                self.model_catalog[i] = model
+                self.model_mask[i] = True
+
+        mtotal = len(self.model_catalog)
+        nmasked = np.sum(~self.model_mask)
+        msrc = np.sum(self.model_mask)
+        if not self.model_mask.any():
+            raise RuntimeError(f'No valid models to make model image! (of {mtotal}, {nmasked} masked)')
+        self.logger.info(f'Making model image with {msrc}/{mtotal} sources. ({nmasked} are masked)')
+
+        # Footprint of each source: its segment bounding box, or its own pixel if it has lost its segment
+        sources = self.model_catalog[self.model_mask]
+        sids = np.array(catalog['source_id'][self.model_mask], dtype=int)
+        seg_slices = find_objects(np.asarray(self.segmap).astype(int, copy=False))
+        footprints = np.zeros((len(sources), 4), dtype=int)
+        for k, (sid, src) in enumerate(zip(sids, sources)):
+            if (sid <= len(seg_slices)) and (seg_slices[sid-1] is not None):
+                yslice, xslice = seg_slices[sid-1]
+                footprints[k] = yslice.start, yslice.stop, xslice.start, xslice.stop
+            else:
+                x, y = int(src.pos.x), int(src.pos.y)
+                footprints[k] = y, y+1, x, x+1
+
+        height, width = np.shape(self.images[0])
+        size = conf.MODEL_TILE_SIZE
+
+        def tiles():
+            for y0 in np.arange(0, height, size):
+                for x0 in np.arange(0, width, size):
+                    y1, x1 = min(y0 + size, height), min(x0 + size, width)
+                    psfmodels = [self.local_psf(i, (x0 + x1) / 2., (y0 + y1) / 2.) for i in idx]
+                    if np.any([psfmodel is None for psfmodel in psfmodels]):
+                        self.logger.error(f'No PSF for tile at ({x0}, {y0}) in every band! Skipping!')
+                        continue
+                    pad = int(np.ceil(np.max([psfmodel.getRadius() for psfmodel in psfmodels]))) + 1
+                    touching = (footprints[:, 1] + pad > y0) & (footprints[:, 0] - pad < y1) \
+                                & (footprints[:, 3] + pad > x0) & (footprints[:, 2] - pad < x1)
+                    if not touching.any():
+                        continue
+                    padded = (max(y0 - pad, 0), min(y1 + pad, height), max(x0 - pad, 0), min(x1 + pad, width))
+                    yield (y0, y1, x0, x1), padded, psfmodels, self.bands, list(sources[touching])
+
+        self.model_images = np.zeros(shape=(self.n_bands, height, width))
+        self.chisq_images = np.zeros(shape=(self.n_bands, height, width))
+
+        def add(results):
+            n_tiles = 0
+            for (y0, y1, x0, x1), models, chis in results:
+                self.model_images[:, y0:y1, x0:x1] = models
+                if include_chi:
+                    self.chisq_images[:, y0:y1, x0:x1] = chis
+                n_tiles += 1
+            return n_tiles
+
+        self.logger.info(f'Computing model image in {size}px tiles...')
+        if conf.MODEL_TILE_NTHREADS > 1:
+            with pa.pools.ProcessPool(ncpus=conf.MODEL_TILE_NTHREADS) as pool:
+                n_tiles = add(pool.uimap(partial(render_model_tile, include_chi=include_chi), tiles()))
+        else:
+            n_tiles = add(render_model_tile(tile, include_chi=include_chi) for tile in tiles())
+        self.logger.info(f'Rendered {n_tiles} tiles ({time.time() - tstart:3.3f}s)')
+
+        if save:
+            self.save_model_images(catalog, idx, include_chi=include_chi)
+
+    def save_model_images(self, catalog, idx, include_chi=True):
+        """Writes the image, model (and chi) of bands idx to the auxillary file, with the mask of unmodelled pixels"""
+        if os.path.exists(self.auxhdu_path):
+            self.logger.info(f'Saving image(s) to existing file, {self.auxhdu_path}')
+            hdul = fits.open(self.auxhdu_path, mode='update')
+        else:
+            self.logger.info(f'Saving image(s) to new file, {self.auxhdu_path}')
+            hdul = fits.HDUList()
+
+        for i, band in zip(idx, self.mbands[idx]):
+            hdul.append(fits.ImageHDU(data=self.images[i], name=f'{band}_IMAGE', header=self.wcs.to_header()))
+            hdul.append(fits.ImageHDU(data=self.model_images[i], name=f'{band}_MODEL', header=self.wcs.to_header()))
+            if include_chi:
+                hdul.append(fits.ImageHDU(data=self.chisq_images[i], name=f'{band}_CHI', header=self.wcs.to_header()))
+
+        # make mask array
+        self.residual_mask = np.ones_like(self.masks[i], dtype=bool)
+        self.residual_mask[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = False
+        self.residual_mask[self.masks[i]] = True
+        self.residual_mask[self.segmap != 0] = False
+        self.residual_mask[np.isin(self.segmap, catalog['source_id'][~self.model_mask])] = True
+        self.residual_mask = self.residual_mask.astype(int)
+        hdul.append(fits.ImageHDU(data=self.residual_mask, name=f'{band}_MASK', header=self.wcs.to_header()))
+
+        if os.path.exists(self.auxhdu_path):
+            hdul.flush()
+        else:
+            hdul.writeto(self.auxhdu_path, overwrite=True)
+
     def make_model_image_prfmap(self, catalog, include_chi=True, include_nopsf=False, save=True, use_band_position=False, use_band_shape=False, modeling=False):
 
         # Which indices to use?
@@ -625,11 +1037,10 @@ class Brick(Subimage):
                         continue
 
 
-                # open id file
-                pad_prf_idx = ((6 - len(str(prf_idx))) * "0") + str(prf_idx)
-                path_prffile = os.path.join(conf.PRFMAP_DIR[band], f'{conf.PRFMAP_FILENAME}{pad_prf_idx}.fits')
-                if not os.path.exists(path_prffile):
-                    self.logger.error(f'PRF file has not been found! ({path_prffile}')
+                # read and resampled once, then shared by every blob
+                img = prf_store.get(band, prf_idx)
+                if img is None:
+                    self.logger.error(f'PRF file has not been found! ({prf_store.path(band, prf_idx)}')
                     prf_notfound += 1
                     if prf_notfound == len(self.bands[idx]):
                         self.logger.error(f'No PRF files found for any bands in selection!')
@@ -637,26 +1048,9 @@ class Brick(Subimage):
                     else:
                         continue
 
-                hdul = fits.open(path_prffile)
-                from scipy.ndimage.interpolation import rotate
-                img = hdul[0].data
-                # img = 1E-31 * np.ones_like(img)
-                # img[50:-50, 50:-50] = hdul[0].data[50:-50, 50:-50]
-                assert(img.shape[0] == img.shape[1]) # am I square!?
                 self.logger.debug(f'PRF size: {np.shape(img)}')
-                
-                # Do I need to resample?
-                if  (conf.PRFMAP_PIXEL_SCALE_ORIG > 0) & (conf.PRFMAP_PIXEL_SCALE_ORIG is not None):
-                    
-                    factor = conf.PRFMAP_PIXEL_SCALE_ORIG / conf.PIXEL_SCALE
-                    self.logger.debug(f'Resampling PRF with zoom factor: {factor:2.2f}')
-                    img = zoom(img, factor)
-                    if np.shape(img)[0]%2 == 0:
-                        shape_factor = np.shape(img)[0] / (np.shape(img)[0] + 1)
-                        img = zoom(img, shape_factor)
-                    self.logger.debug(f'Final PRF size: {np.shape(img)}')
-
-                psfmodel = PixelizedPSF(img)
+
+                psfmodel = PixelizedPSF(img.copy())
                 pw, ph = np.shape(psfmodel.img)
 
                 if (conf.PRFMAP_MASKRAD > 0) & (not conf.FORCE_GAUSSIAN_PSF):
@@ -849,6 +1243,7 @@ class Brick(Subimage):
         if not self.model_mask.any():        
             raise RuntimeError(f'No valid models to make model image! (of {mtotal}, {nmasked} masked)')
         self.logger.info(f'Made model image with {msrc}/{mtotal} sources. ({nmasked} are masked)')
+        self.logger.debug(f'PRF store: {prf_store}')
         # self.model_catalog = self.model_catalog[self.model_mask]
 
         # # make mask array
@@ -1298,7 +1693,7 @@ class Brick(Subimage):
                     psfmodel = HybridPixelizedPSF(pix=psfmodel, N=10).gauss
 
             elif (psf is not None):
-                raise RuntimeError('Position dependent PSFs in brick-scale model images is NOT SUPPORTED YET.')
+                raise RuntimeError('Position dependent PSFs in brick-scale model images need MODEL_TILE_SIZE > 0.')
                 # continue
                 # blob_centerx = self.blob_center[0] + self.subvector[1] + self.mosaic_origin[1] - conf.BRICK_BUFFER + 1
                 # blob_centery = self.blob_center[1] + self.subvector[0] + self.mosaic_origin[0] - conf.BRICK_BUFFER + 1
@@ -1636,87 +2031,40 @@ class Brick(Subimage):
 
         # Subtract
         self.logger.info('Constructing residual image...')
-        self.residual_images = self.images - self.model_images
-
-        
-
-        # Save to file
-        if save:
-
-            if os.path.exists(self.auxhdu_path):
-                self.logger.info(f'Saving image(s) to existing file, {self.auxhdu_path}')
-                hdul = fits.open(self.auxhdu_path, mode='update')
-                for i, band in enumerate(self.bands):
-                    hdu_img = fits.ImageHDU(data=self.images[i], name=f'{band}_IMAGE', header=self.wcs.to_header())
-                    hdul.append(hdu_img)
-                    hdu_mod = fits.ImageHDU(data=self.model_images[i], name=f'{band}_MODEL', header=self.wcs.to_header())
-                    hdul.append(hdu_mod)
-                    if include_chi:
-                        hdu_chi = fits.ImageHDU(data=self.chisq_images[i], name=f'{band}_CHI', header=self.wcs.to_header())
-                        hdul.append(hdu_chi)
-                    if include_nopsf:
-                        hdu_nopsf = fits.ImageHDU(data=self.nopsf_images[i], name=f'{band}_NOPSF', header=self.wcs.to_header())
-                        hdul.append(hdu_nopsf)
-
-                    hdu_residual = fits.ImageHDU(data=self.residual_images[i], name=f'{band}_RESIDUAL', header=self.wcs.to_header())
-                    hdul.append(hdu_residual)
-
-                    # make mask array
-                    self.residual_mask = np.ones_like(self.masks[i], dtype=bool)
-                    self.residual_mask[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = False
-                    self.residual_mask[self.masks[i]] = True
-                    self.residual_mask[self.segmap != 0] = False
-                    for src in catalog[~self.model_mask]:
-                        sid = src['source_id']
-                        self.residual_mask[self.segmap == sid] = True
-
-                    self.residual_mask = self.residual_mask.astype(int)
-                    hdu_mask = fits.ImageHDU(data=self.residual_mask, name=f'{band}_MASK', header=self.wcs.to_header())
-                    hdul.append(hdu_mask)
-                # Save
-                hdul.flush()
-
-            else:
-
-                self.logger.info(f'brick.make_residual_image :: Saving image(s) to new file, s{self.auxhdu_path}')
-                hdul = fits.HDUList()
-                for i, band in enumerate(self.bands):
-                    hdu_img = fits.ImageHDU(data=self.images[i], name=f'{band}_IMAGE', header=self.wcs.to_header())
-                    hdul.append(hdu_img)
-                    hdu_mod = fits.ImageHDU(data=self.model_images[i], name=f'{band}_MODEL', header=self.wcs.to_header())
-                    hdul.append(hdu_mod)
-                    if include_chi:
-                        hdu_chi = fits.ImageHDU(data=self.chisq_images[i], name=f'{band}_CHI', header=self.wcs.to_header())
-                        hdul.append(hdu_chi)
-                    if include_nopsf:
-                        hdu_nopsf = fits.ImageHDU(data=self.nopsf_images[i], name=f'{band}_NOPSF', header=self.wcs.to_header())
-                        hdul.append(hdu_nopsf)
-
-                    hdu_residual = fits.ImageHDU(data=self.residual_images[i], name=f'{band}_RESIDUAL', header=self.wcs.to_header())
-                    hdul.append(hdu_residual)
-                
-                    # make mask array
-                    self.residual_mask = np.ones_like(self.masks[i], dtype=bool)
-                    self.residual_mask[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = False
-                    self.residual_mask[self.masks[i]] = True
-                    self.residual_mask[self.segmap != 0] = False
-                    for src in catalog[~self.model_mask]:
-                        sid = src['source_id']
-                        self.residual_mask[self.segmap == sid] = True
-
-
-                        # WHY ARE SOME MODEL MASKS NOT SHOWING UP?
+        if not save:
+            self.residual_images = self.images - self.model_images
+            return
 
-                    self.residual_mask = self.residual_mask.astype(int)
-                    hdu_mask = fits.ImageHDU(data=self.residual_mask, name=f'{band}_MASK', header=self.wcs.to_header())
-                    hdul.append(hdu_mask)
+        # Unmodelled pixels: the brick border and masked pixels off the segments, and the segments of rejected sources
+        segmap = self.segmap.astype(int, copy=False)
+        in_segment = segmap != 0
+        border = np.ones_like(in_segment)
+        border[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = False
+        rejected_ids = np.asarray(catalog['source_id'][~self.model_mask], dtype=int)
+        rejected = np.zeros(max(segmap.max(), rejected_ids.max(initial=0)) + 1, dtype=bool)
+        rejected[rejected_ids] = True
+        rejected_segment = rejected[segmap]
+
+        # Save to file, one band at a time so that only its residual and mask are held at once
+        if os.path.exists(self.auxhdu_path):
+            self.logger.info(f'Saving image(s) to existing file, {self.auxhdu_path}')
+        else:
+            self.logger.info(f'brick.make_residual_image :: Saving image(s) to new file, {self.auxhdu_path}')
 
-                # Save
-                hdul.writeto(self.auxhdu_path, overwrite=True)
+        header = self.wcs.to_header()
+        for i, band in enumerate(self.bands):
+            self.residual_mask = (((border | np.asarray(self.masks[i], dtype=bool)) & ~in_segment) | rejected_segment).astype(int)
+            maps = [('IMAGE', self.images[i]), ('MODEL', self.model_images[i])]
+            if include_chi:
+                maps.append(('CHI', self.chisq_images[i]))
+            maps += [('RESIDUAL', self.images[i] - self.model_images[i]), ('MASK', self.residual_mask)]
+            for name, data in maps:
+                header['EXTNAME'] = f'{band}_{name}'.upper()
+                fits.append(self.auxhdu_path, data, header=header)
+            self.logger.debug(f'Saved {band} ({len(maps)} maps)')
 
     def estimate_effective_area(self, catalog, band, modeling=False):
         self.logger.info(f'Calculating the effective area for {band}')
-        inner_area_pix = (conf.BRICK_WIDTH) * (conf.BRICK_HEIGHT)
         if len(self.masks > 0):  # bit of an assumption, but OK
             mask = self.masks[0]
         else:
@@ -1730,62 +2078,8 @@ class Brick(Subimage):
                 idx = self._band2idx(band)
 
             mask = self.masks[idx]
-        total_area_pix = np.size(mask)
-        residual_mask = np.zeros_like(mask, dtype=bool) # everything masked
-        residual_mask[conf.BRICK_BUFFER:-conf.BRICK_BUFFER, conf.BRICK_BUFFER:-conf.BRICK_BUFFER] = True  # inner region ok
-        residual_mask[mask] = False # mask is not ok
-        residual_mask[self.segmap != 0] = False # assume everything failed
-        for src in catalog:
-            self.logger.debug(f"Evaluating source #{src['source_id']}")
-
-            if modeling:
-                raw_fluxes = src[f'FLUX_{conf.MODELING_NICKNAME}_{band}']
-                try:
-                    solmodel = src[f'SOLMODEL_{conf.MODELING_NICKNAME}_{band}']
-                except:
-                    solmodel = src[f'SOLMODEL_{conf.MODELING_NICKNAME}']
-            else:
-                raw_fluxes = src[f'FLUX_{band}']
-                solmodel = src[f'SOLMODEL_{conf.MODELING_NICKNAME}']
-
-            if conf.RESIDUAL_CHISQ_REJECTION is not None:
-                if modeling:
-                    chisq_band = src[f'CHISQ_MODELING_{band}']
-                else:
-                    chisq_band = src[f'CHISQ_{band}']
-                if chisq_band > conf.RESIDUAL_CHISQ_REJECTION:
-                    raw_fluxes = 0.0
-                    self.logger.debug(f'Source has too large chisq. ({chisq_band:3.3f}) > {conf.RESIDUAL_CHISQ_REJECTION})') 
-                    continue
-
-            if conf.RESIDUAL_NEGFLUX_REJECTION:
-                if raw_fluxes <= 0.0:
-                    self.logger.debug('Source has negative flux. Rejecting!')
-                    continue
-
-            if (conf.RESIDUAL_AB_REJECTION is not None) & (src[f'SOLMODEL_{conf.MODELING_NICKNAME}'] not in ('PointSource', 'SimpleGalaxy')):  # HACK -- does NOT apply to unfixed shapes!
-                
-                if src[f'SOLMODEL_{conf.MODELING_NICKNAME}'] in ('ExpGalaxy', 'DevGalaxy'):
-                    ab = src[f'AB_{conf.MODELING_NICKNAME}']
-                    if (ab > conf.RESIDUAL_AB_REJECTION) | (ab <= 0):
-                        self.logger.debug('Source has exessive a/b. Rejecting!')
-                        continue
-                else:
-                    ab_exp = src[f'EXP_AB_{conf.MODELING_NICKNAME}']
-                    if (ab_exp > conf.RESIDUAL_AB_REJECTION) | (ab_exp <= 0):
-                        self.logger.debug('Source has exessive exp a/b. Rejecting!')
-                        continue
-
-                    ab_dev = src[f'DEV_AB_{conf.MODELING_NICKNAME}']
-                    if (ab_dev > conf.RESIDUAL_AB_REJECTION) | (ab_dev <= 0):
-                        self.logger.debug('Source has exessive dev a/b. Rejecting!')
-                        continue
-
-            sid = src['source_id']
-            residual_mask[self.segmap == sid] = True
-
-        # HACK -- this is a slight estimationf in the case that a source bleeds into the buffer, but it is EXACT for the good area!
-        good_area_pix = np.sum(residual_mask)
+        source_ids = catalog['source_id'][effective_sources(catalog, band, modeling=modeling)]
+        good_area_pix, inner_area_pix = effective_area_pixels(self.segmap, mask, source_ids)
         bad_area_pix = inner_area_pix - good_area_pix
         self.logger.info(f'Total effective area for brick #{self.brick_id}: {good_area_pix*(conf.PIXEL_SCALE/3600)**2:4.4f} deg2 ({good_area_pix/inner_area_pix*100:3.3f}%)')
         self.logger.debug(f'Total masked area for brick #{self.brick_id}: {bad_area_pix*(conf.PIXEL_SCALE/3600)**2:4.4f} deg2 ({bad_area_pix/inner_area_pix*100:3.3f}%)')
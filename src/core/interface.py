@@ -21,13 +21,18 @@ None
 import os
 import sys
 import time
-from functools import partial
+from functools import partial, wraps
 import shutil
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 if os.path.exists(os.path.join(os.getcwd(), 'config')): # You're 1 up from config?
     sys.path.insert(0, os.path.join(os.getcwd(), 'config'))
 else: # You're working from a directory parallel with config?
     sys.path.insert(0, os.path.abspath(os.path.join(os.getcwd(), '../config')))
 import pickle
+import resource
 
 # Tractor imports
 from tractor import NCircularGaussianPSF, PixelizedPSF, Image, Tractor, FluxesPhotoCal, NullWCS, ConstantSky, EllipseESoft, Fluxes, PixPos
@@ -53,9 +58,9 @@ from astropy.coordinates import SkyCoord
 # import sfdmap
 
 # Local imports
-from .brick import Brick
+from .brick import Brick, load_shared_brick, effective_sources, effective_area_pixels
 from .mosaic import Mosaic
-from .utils import header_from_dict, SimpleGalaxy
+from .utils import header_from_dict, merge_catalog, write_catalog, insert_catalog, reserve_band_columns, SimpleGalaxy
 from .visualization import plot_background, plot_blob, plot_blobmap, plot_brick, plot_mask
 try:
     import config as conf
@@ -64,19 +69,22 @@ except:
 
 # m = sfdmap.SFDMap(conf.SFDMAP_DIR)
 
-# Make sure no interactive plotting is going on.
-plt.ioff()
 import warnings
-warnings.filterwarnings("ignore")
+import logging.config
+
+# Nothing is set up on import, so that workers and tools pay only for the imports. See init().
+logger = logging.getLogger('farmer')
+formatter = logging.Formatter('[%(asctime)s] %(name)s :: %(levelname)s - %(message)s', '%H:%M:%S')
+logging_path = None # the main logfile, once start_logging has opened one
+_initialized = False
 
-print(
-f"""
+BANNER = """
 ====================================================================
  ________    _       _______     ____    ____  ________  _______        
-|_   __  |  / \     |_   __ \   |_   \  /   _||_   __  ||_   __ \    
-  | |_ \_| / _ \      | |__) |    |   \/   |    | |_ \_|  | |__) |   
-  |  _|   / ___ \     |  __ /     | |\  /| |    |  _| _   |  __ /    
- _| |_  _/ /   \ \_  _| |  \ \_  _| |_\/_| |_  _| |__/ | _| |  \ \_ 
+|_   __  |  / \\     |_   __ \\   |_   \\  /   _||_   __  ||_   __ \\    
+  | |_ \\_| / _ \\      | |__) |    |   \\/   |    | |_ \\_|  | |__) |   
+  |  _|   / ___ \\     |  __ /     | |\\  /| |    |  _| _   |  __ /    
+ _| |_  _/ /   \\ \\_  _| |  \\ \\_  _| |_\\/_| |_  _| |__/ | _| |  \\ \\_ 
 |_____||____| |____||____| |___||_____||_____||________||____| |___|
                                                                     
 --------------------------------------------------------------------
@@ -85,91 +93,208 @@ M O D E L   P H O T O M E T R Y   W I T H   T H E   T R A C T O R
                                                                     
     (C) 2020 -- J. Weaver (DAWN, University of Copenhagen)          
 ====================================================================
+"""
 
-CONSOLE_LOGGING_LEVEL ..... {conf.CONSOLE_LOGGING_LEVEL}			
-LOGFILE_LOGGING_LEVEL ..... {conf.LOGFILE_LOGGING_LEVEL}												
-PLOT ...................... {conf.PLOT}																		
-NTHREADS .................. {conf.NTHREADS}																			
-OVERWRITE ................. {conf.OVERWRITE} 
-"""	
-)
 
-print('Starting up logging system...')
+def start_logging():
+    """ Attaches the console (and logfile) handlers to the farmer logger """
+    global logging_path
 
-# Start the logging
-import logging.config
-logger = logging.getLogger('farmer')
+    print('Starting up logging system...')
 
-if not len(logger.handlers):
-    if conf.LOGFILE_LOGGING_LEVEL is not None:
-        logging_level = logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL)
-    else:
-        logging_level = logging.DEBUG
-    logger.setLevel(logging_level)
-    logger.propagate = False
-    formatter = logging.Formatter('[%(asctime)s] %(name)s :: %(levelname)s - %(message)s', '%H:%M:%S')
-
-    # Logging to the console at logging level
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.getLevelName(conf.CONSOLE_LOGGING_LEVEL))
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
-
-    if (conf.LOGFILE_LOGGING_LEVEL is None) | (not os.path.exists(conf.LOGGING_DIR)):
-        print('Logging information wills stream only to console.\n')
-        
-    else:
-        # create file handler which logs even debug messages
-        logging_path = os.path.join(conf.LOGGING_DIR, 'logfile.log')
-        print(f'Logging information will stream to console and {logging_path}\n')
-        # If overwrite is on, remove old logger
-        if conf.OVERWRITE & os.path.exists(logging_path):
-            print('WARNING -- Existing logfile will be overwritten.')
-            os.remove(logging_path)
-
-        fh = logging.FileHandler(logging_path)
+    if not len(logger.handlers):
+        if conf.LOGFILE_LOGGING_LEVEL is not None:
+            logging_level = logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL)
+        else:
+            logging_level = logging.DEBUG
+        logger.setLevel(logging_level)
+        logger.propagate = False
+
+        # Logging to the console at logging level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.getLevelName(conf.CONSOLE_LOGGING_LEVEL))
+        ch.setFormatter(formatter)
+        logger.addHandler(ch)
+
+        if (conf.LOGFILE_LOGGING_LEVEL is None) | (not os.path.exists(conf.LOGGING_DIR)):
+            print('Logging information wills stream only to console.\n')
+            
+        else:
+            # create file handler which logs even debug messages
+            logging_path = os.path.join(conf.LOGGING_DIR, 'logfile.log')
+            print(f'Logging information will stream to console and {logging_path}\n')
+            # If overwrite is on, remove old logger
+            if conf.OVERWRITE & os.path.exists(logging_path):
+                print('WARNING -- Existing logfile will be overwritten.')
+                os.remove(logging_path)
+
+            fh = logging.FileHandler(logging_path)
+            fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
+            fh.setFormatter(formatter)
+            logger.addHandler(fh)
+
+
+# The brick each thread is working on, and the brick logfile handlers it has opened (see brick_logging)
+_brick_logs = threading.local()
+
+
+_record_factory = logging.getLogRecordFactory()
+
+
+def _brick_record(*args, **kwargs):
+    """ Tags every record with the brick its thread (or pool worker, see worker_brick_logging) is working on """
+    record = _record_factory(*args, **kwargs)
+    record.brick_id = getattr(_brick_logs, 'brick_id', None)
+    return record
+
+
+logging.setLogRecordFactory(_brick_record)
+
+
+class BrickFilter(logging.Filter):
+    """ Passes only the records tagged with brick_id, so that bricks farmed side by side
+    keep out of each other's logfiles """
+    def __init__(self, brick_id):
+        super().__init__()
+        self.brick_id = brick_id
+
+    def filter(self, record):
+        return getattr(record, 'brick_id', None) == self.brick_id
+
+
+def brick_logging(stage):
+    """ Runs a stage with its brick as the brick of this thread, and removes the brick logfile handlers it
+    opened however it ends """
+    @wraps(stage)
+    def wrapper(*args, **kwargs):
+        brick_id = kwargs['brick_id'] if 'brick_id' in kwargs else args[0]
+        previous = getattr(_brick_logs, 'brick_id', None), getattr(_brick_logs, 'handlers', [])
+        _brick_logs.brick_id, _brick_logs.handlers = brick_id, []
+        try:
+            return stage(*args, **kwargs)
+        finally:
+            for fh in _brick_logs.handlers:
+                logger.removeHandler(fh)
+                fh.close()
+            _brick_logs.brick_id, _brick_logs.handlers = previous
+    return wrapper
+
+
+def add_brick_logfile(brick_id, brick_logging_path):
+    """ Adds a file handler for brick-specific information, starting from a copy of the main logfile if there is one.
+    It only takes records of brick_id, and is removed when the stage (see brick_logging) returns.
+    Returns the handler, or None if there is nowhere to write it. """
+    if not os.path.exists(conf.LOGGING_DIR):
+        logger.warning(f'Logging directory {conf.LOGGING_DIR} not found. Brick logfile will not be written.')
+        return None
+    logger.info(f'Logging information will be streamed to console and to {brick_logging_path}\n')
+    # If overwrite is on, remove old logger
+    if conf.OVERWRITE & os.path.exists(brick_logging_path):
+        logger.warning('Existing logfile will be overwritten.')
+        os.remove(brick_logging_path)
+
+    # we will add an additional file handler to keep track of brick_id specific information
+    if (logging_path is not None) and os.path.exists(logging_path):
+        shutil.copy(logging_path, brick_logging_path)
+    new_fh = logging.FileHandler(brick_logging_path, mode='a')
+    new_fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
+    new_fh.setFormatter(formatter)
+    new_fh.addFilter(BrickFilter(brick_id))
+    logger.addHandler(new_fh)
+    if hasattr(_brick_logs, 'handlers'):
+        _brick_logs.handlers.append(new_fh)
+    return new_fh
+
+
+@contextmanager
+def worker_brick_logging(brick_id, paths):
+    """ Runs one pool task as brick_id, writing its records to the brick logfiles at paths.
+    Pool workers may be forked before the brick opened its logfiles (as in farm_bricks), so any handler the
+    worker did not inherit is opened here, in append mode, and closed again when the task is done. """
+    previous = getattr(_brick_logs, 'brick_id', None)
+    _brick_logs.brick_id = brick_id
+    inherited = [getattr(fh, 'baseFilename', None) for fh in logger.handlers]
+    added = []
+    for path in paths:
+        if path in inherited:
+            continue
+        fh = logging.FileHandler(path, mode='a')
         fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
         fh.setFormatter(formatter)
+        fh.addFilter(BrickFilter(brick_id))
         logger.addHandler(fh)
+        added.append(fh)
+    try:
+        yield
+    finally:
+        for fh in added:
+            logger.removeHandler(fh)
+            fh.close()
+        _brick_logs.brick_id = previous
+
+
+def translate_bands():
+    """ Sets conf.RAWBANDS (the image names for file I/O) from the translate file, or shortens the band names """
+
+    # Try to import the translate file from it's usual spot first.
+    try:
+        from translate import translate
+        logger.info(f'interface.translation :: Imported translate file with {len(translate.keys())} entries.')
+        if len(conf.BANDS) != len(translate.keys()):
+            logger.warning(f'Configuration file only includes {len(conf.BANDS)} entries!')
+        # I have nicknames in the config, I need the raw names for file I/O
+        mask = np.ones_like(conf.BANDS, dtype=bool)
+        for i, band in enumerate(conf.BANDS):
+            if band not in translate.keys():
+                logger.warning(f'Cound not find {band} in translate file!')
+                mask[i] = False
+
+        # Re-assign bands and rawbands in config object
+        logger.debug(f'Assigning nicknames to raw image names:')
+        conf.BANDS = list(np.array(conf.BANDS)[mask])
+        conf.RAWBANDS = conf.BANDS.copy()
+        for i, band in enumerate(conf.RAWBANDS):
+            conf.RAWBANDS[i] = translate[band]
+            logger.debug(f'     {i+1} :: {conf.RAWBANDS[i]} --> {conf.BANDS[i]}')
+
+    # The translation file could not be found, so make a scene.
+    except:
+        logger.warning('interface.translation :: WARNING - Could not import translate file! Will use config instead.')
+        logger.info('interface.translation :: Image names must be < 50 characters (FITS standard) - checking...')
+        # I have raw names, I need shortened raw names (i.e. nicknames)
+        conf.RAWBANDS = conf.BANDS.copy()
+        count_short = 0
+        for i, band in enumerate(conf.RAWBANDS):
+            if len(band) > 50:  
+                conf.BANDS[i] = band[:50]
+                logger.debug(f'     {i+1} :: {band} --> {conf.BANDS[i]}')
+                count_short += 1
+        logger.info(f'interface.translation :: Done checking. Shortened {count_short} image names.')
+
+
+def init(banner=True):
+    """ Prints the banner, starts logging and translates the band names. Call once, before running any stage;
+    the pool workers forked afterwards inherit the setup. Repeated calls do nothing. """
+    global _initialized
+    if _initialized:
+        return
 
+    # Make sure no interactive plotting is going on.
+    plt.ioff()
+    warnings.filterwarnings("ignore")
 
+    if banner:
+        print(BANNER + f"""
+CONSOLE_LOGGING_LEVEL ..... {conf.CONSOLE_LOGGING_LEVEL}			
+LOGFILE_LOGGING_LEVEL ..... {conf.LOGFILE_LOGGING_LEVEL}												
+PLOT ...................... {conf.PLOT}																		
+NTHREADS .................. {conf.NTHREADS}																			
+OVERWRITE ................. {conf.OVERWRITE} 
+""")
 
-# When a user invokes the interface, first check the translation file
-# Optionally, tell the user.
-# Try to import the translate file from it's usual spot first.
-try:
-    from translate import translate
-    logger.info(f'interface.translation :: Imported translate file with {len(translate.keys())} entries.')
-    if len(conf.BANDS) != len(translate.keys()):
-        logger.warning(f'Configuration file only includes {len(conf.BANDS)} entries!')
-    # I have nicknames in the config, I need the raw names for file I/O
-    mask = np.ones_like(conf.BANDS, dtype=bool)
-    for i, band in enumerate(conf.BANDS):
-        if band not in translate.keys():
-            logger.warning(f'Cound not find {band} in translate file!')
-            mask[i] = False
-
-    # Re-assign bands and rawbands in config object
-    logger.debug(f'Assigning nicknames to raw image names:')
-    conf.BANDS = list(np.array(conf.BANDS)[mask])
-    conf.RAWBANDS = conf.BANDS.copy()
-    for i, band in enumerate(conf.RAWBANDS):
-        conf.RAWBANDS[i] = translate[band]
-        logger.debug(f'     {i+1} :: {conf.RAWBANDS[i]} --> {conf.BANDS[i]}')
-
-# The translation file could not be found, so make a scene.
-except:
-    logger.warning('interface.translation :: WARNING - Could not import translate file! Will use config instead.')
-    logger.info('interface.translation :: Image names must be < 50 characters (FITS standard) - checking...')
-    # I have raw names, I need shortened raw names (i.e. nicknames)
-    conf.RAWBANDS = conf.BANDS.copy()
-    count_short = 0
-    for i, band in enumerate(conf.RAWBANDS):
-        if len(band) > 50:  
-            conf.BANDS[i] = band[:50]
-            logger.debug(f'     {i+1} :: {band} --> {conf.BANDS[i]}')
-            count_short += 1
-    logger.info(f'interface.translation :: Done checking. Shortened {count_short} image names.')
+    start_logging()
+    translate_bands()
+    _initialized = True
 
 
 def make_directories():
@@ -263,6 +388,58 @@ def make_psf(image_type=conf.MULTIBAND_NICKNAME, band=None, sextractor_only=Fals
     return
 
 
+# Memory-mapped mosaics opened by this process, as {(band, detection, modeling): Mosaic}
+_brick_mosaics = {}
+
+
+def get_brick_mosaic(band, detection=False, modeling=False):
+    """ Memory-mapped Mosaic, opened once per process """
+    key = (band, detection, modeling)
+    if key not in _brick_mosaics:
+        _brick_mosaics[key] = Mosaic(band, detection=detection, modeling=modeling, memmap=True)
+    return _brick_mosaics[key]
+
+
+def cut_brick(brick_id, stack):
+    """ Cuts brick_id out of each (band, detection, modeling, overwrite) mosaic in the stack, in order """
+    for band, detection, modeling, overwrite in stack:
+        get_brick_mosaic(band, detection, modeling)._make_brick(brick_id, overwrite=overwrite, detection=detection, modeling=modeling)
+    return brick_id
+
+
+def cut_bricks(stack, brick_id=None, max_bricks=None):
+    """ Cuts bricks out of memory-mapped mosaics, with up to BRICK_NTHREADS processes but no more than fit in BRICK_MEMORY_LIMIT.
+    Each process writes whole bricks, so no two of them ever touch the same file. """
+
+    tstart = time.time()
+    if brick_id is not None:
+        brick_ids = [brick_id,]
+    else:
+        if max_bricks is None:
+            max_bricks = get_brick_mosaic(*stack[0][:3]).n_bricks()
+        brick_ids = np.arange(1, max_bricks+1)
+
+    # The bands of a brick are cut one after the other, so only the largest counts
+    nbytes = np.max([get_brick_mosaic(*layer[:3]).brick_nbytes() for layer in stack])
+    nworkers = int(np.clip(conf.BRICK_MEMORY_LIMIT * 1024**2 // nbytes, 1, conf.BRICK_NTHREADS))
+    if nworkers < conf.BRICK_NTHREADS:
+        logger.warning(f'Only {nworkers} of {conf.BRICK_NTHREADS} brick processes fit in BRICK_MEMORY_LIMIT = {conf.BRICK_MEMORY_LIMIT} MB ({nbytes/1024**2:3.1f} MB per brick).')
+
+    if (nworkers > 1) & (len(brick_ids) > 1):
+        with pa.pools.ProcessPool(ncpus=nworkers) as pool:
+            logger.info(f'Parallel brick pool initalized with {nworkers} processes.')
+            for bid in pool.uimap(partial(cut_brick, stack=stack), brick_ids):
+                logger.debug(f'Brick #{bid} written.')
+            logger.info('Parallel processing complete.')
+    else:
+        logger.info('Serial processing initalized.')
+        for bid in brick_ids:
+            cut_brick(bid, stack)
+
+    _brick_mosaics.clear()
+    logger.info(f'Made {len(brick_ids)} bricks from {len(stack)} memory-mapped mosaic(s) ({time.time() - tstart:3.3f}s)')
+
+
 def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, insert=False, skip_psf=True, max_bricks=None, make_new_bricks=False):
     """ Stage 1. Here we collect the detection, modelling, and multiband images for processing. We may also cut them up! 
     
@@ -273,6 +450,11 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
     # Make bricks for the detection image
     if (image_type==conf.DETECTION_NICKNAME) | (image_type is None):
         # Detection
+        if conf.BRICK_NTHREADS > 0:
+            logger.info('Making bricks for detection (from memory-maps)')
+            cut_bricks([(conf.DETECTION_NICKNAME, True, False, True)], brick_id=brick_id)
+            return
+
         logger.info('Making mosaic for detection...')
         detmosaic = Mosaic(conf.DETECTION_NICKNAME, detection=True)
         # print(detmosaic.dims)
@@ -280,7 +462,7 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
         # print('Mosaic: ',conf.MOSAIC_WIDTH, conf.MOSAIC_HEIGHT)
 
         if conf.NTHREADS > 1:
-            logger.warning('Parallelization of brick making is currently not supported. Continuing anyways...')
+            logger.warning('Parallelization of brick making is only supported from memory-maps (see BRICK_NTHREADS). Continuing anyways...')
             # BUGGY DUE TO MEM ALLOC
             # logger.info('Making bricks for detection (in parallel)')
             # pool = mp.ProcessingPool(processes=conf.NTHREADS)
@@ -296,6 +478,14 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
     # Make bricks for the modeling image
     elif (image_type==conf.MODELING_NICKNAME) | (image_type is None):
         # Modeling
+        if conf.BRICK_NTHREADS > 0:
+            if not skip_psf:
+                logger.info('Making mosaic for modeling PSF...')
+                Mosaic(conf.MODELING_NICKNAME, modeling=True)._make_psf(xlims=np.array(conf.MOD_REFF_LIMITS), ylims=np.array(conf.MOD_VAL_LIMITS))
+            logger.info('Making bricks for modeling (from memory-maps)')
+            cut_bricks([(conf.MODELING_NICKNAME, False, True, True)], brick_id=brick_id, max_bricks=max_bricks)
+            return
+
         logger.info('Making mosaic for modeling...')
         modmosaic = Mosaic(conf.MODELING_NICKNAME, modeling=True)
 
@@ -309,7 +499,7 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
 
         # Make bricks in parallel
         if (conf.NTHREADS > 1) & (brick_id is None):
-             logger.warning('Parallelization of brick making is currently not supported. Continuing anyways...')
+             logger.warning('Parallelization of brick making is only supported from memory-maps (see BRICK_NTHREADS). Continuing anyways...')
 
             # BUGGY DUE TO MEM ALLOC
             # if conf.VERBOSE: print('Making bricks for detection (in parallel)')
@@ -343,6 +533,20 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
         else:
             sbands = conf.BANDS
 
+        # From memory-maps, each brick is written band after band by the same worker
+        if conf.BRICK_NTHREADS > 0:
+            stack = []
+            for i, sband in enumerate(sbands):
+                if not skip_psf:
+                    logger.info(f'Making mosaic for {sband} PSF...')
+                    idx_band = np.array(conf.BANDS) == sband
+                    Mosaic(sband)._make_psf(xlims=np.array(conf.MULTIBAND_REFF_LIMITS)[idx_band][0], ylims=np.array(conf.MULTIBAND_VAL_LIMITS)[idx_band][0])
+                overwrite = make_new_bricks & (not insert) & (i == 0)
+                stack.append((sband, False, False, overwrite))
+            logger.info(f'Making bricks for {sbands} (from memory-maps)')
+            cut_bricks(stack, brick_id=brick_id, max_bricks=max_bricks)
+            return
+
         # In serial, loop over images
         for i, sband in enumerate(sbands):
 
@@ -370,7 +574,7 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
 
             # Make bricks in parallel
             if (conf.NTHREADS > 1)  & (brick_id is None):
-                 logger.warning('Parallelization of brick making is currently not supported. Continuing anyways...')
+                 logger.warning('Parallelization of brick making is only supported from memory-maps (see BRICK_NTHREADS). Continuing anyways...')
                 # logger.info(f'Making bricks for band {sband} (in parallel)')
                 # with pa.pools.ProcessPool(ncpus=conf.NTHREADS) as pool:
                 #     logger.info(f'Parallel processing pool initalized with {conf.NTHREADS} threads.')
@@ -396,6 +600,57 @@ def make_bricks(image_type=conf.MULTIBAND_NICKNAME, band=None, brick_id=None, in
     return
 
   
+# Stages timed by Blob, in the order of the timing table. The decision tree levels are stored as one array.
+BLOB_TIMING_STAGES = ('stage_images', 'final_opt', 'forced_phot', 'aperture_phot', 'sep_phot', 'residual_phot', 'rao_cramer')
+
+
+def blob_timing(blob_id, blobs, duration):
+    """ Timing and resource record of one blob, merged over its modeling and forced blobs """
+    blobs = [blob for blob in (blobs if isinstance(blobs, tuple) else (blobs,)) if blob is not None]
+    timing, steps = {}, {}
+    for blob in blobs:
+        for stage, value in blob.timing.items():
+            timing[stage] = timing.get(stage, 0.) + value
+        for stage, value in blob.steps.items():
+            steps[stage] = steps.get(stage, 0) + value
+
+    # the decision tree starts at level 1
+    n_levels = max([int(stage[6:]) for stage in timing if stage.startswith('level_')], default=0)
+    record = {'blob_id': blob_id,
+              'N_PIX': int(np.prod(blobs[0].dims)),
+              'N_SOURCES': int(blobs[0].n_sources),
+              'N_BANDS': int(np.max([blob.n_bands for blob in blobs])),
+              'BANDS': ','.join(np.unique(np.concatenate([blob.bands for blob in blobs]))),
+              'REJECTED': bool(np.any([blob.rejected for blob in blobs])),
+              'T_TOTAL': duration,
+              'N_LEVELS': n_levels}
+    for stage in BLOB_TIMING_STAGES:
+        record[f'T_{stage.upper()}'] = timing.get(stage, 0.)
+    record['T_LEVELS'] = [timing.get(f'level_{i}', 0.) for i in range(1, n_levels+1)]
+    record['N_STEPS_LEVELS'] = [steps.get(f'level_{i}', 0) for i in range(1, n_levels+1)]
+    record['N_STEPS_FINAL'] = steps.get('final_opt', 0)
+    record['N_STEPS_FORCED'] = steps.get('forced_phot', 0)
+    # ru_maxrss is in kilobytes on Linux, and is the high-water mark of the worker so far
+    record['PEAK_RSS_MB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    return record
+
+
+def record_blob_timing(func):
+    """ Attaches the timing record of the blob to the rows returned by a runblob function, under meta['timing'] """
+    @wraps(func)
+    def wrapper(blob_id, blobs, *args, **kwargs):
+        tstart = time.time()
+        rows = func(blob_id, blobs, *args, **kwargs)
+        if conf.BLOB_TIMING and hasattr(rows, 'meta'):
+            try:
+                rows.meta['timing'] = blob_timing(blob_id, blobs, time.time() - tstart)
+            except Exception:
+                logger.warning(f'Could not make the timing record of Blob #{blob_id}.')
+        return rows
+    return wrapper
+
+
+@record_blob_timing
 def runblob(blob_id, blobs, modeling=None, catalog=None, plotting=0, source_id=None, source_only=False, blob_only=False):
     """ Essentially a private function. Runs each individual blob and handles the bulk of the work. """
 
@@ -748,6 +1003,178 @@ def runblob(blob_id, blobs, modeling=None, catalog=None, plotting=0, source_id=N
     return catout
 
 
+# Bricks attached by this process, keyed by shared path and write time
+# Bricks loaded by this worker, most recently used last. Under farm_bricks the blobs of several bricks
+# interleave in one pool, so a worker keeps the last few rather than reloading on every switch.
+_shared_bricks = OrderedDict()
+
+def runblob_shared(blob_id, shared_path, rao_cramer_only=False, **kwargs):
+    """ Runs a blob built locally from a brick written by Brick.share. Only the blob id crosses the pool. """
+
+    key = (shared_path, os.path.getmtime(os.path.join(shared_path, 'brick.pkl')))
+    if key in _shared_bricks:
+        _shared_bricks.move_to_end(key)
+    else:
+        # a brick shared again at the same path is a new brick
+        for old_key in [old_key for old_key in _shared_bricks if old_key[0] == shared_path]:
+            del _shared_bricks[old_key]
+        _shared_bricks[key] = load_shared_brick(shared_path)
+        while len(_shared_bricks) > max(conf.NTHREADS, conf.FARM_BRICKS_IN_FLIGHT, 1):
+            _shared_bricks.popitem(last=False)
+    brick = _shared_bricks[key]
+
+    blob = brick.make_blob(blob_id)
+    if rao_cramer_only:
+        return runblob_rc(blob_id, blob, catalog=brick.catalog, **kwargs)
+    if not kwargs.get('modeling', True):
+        kwargs['catalog'] = brick.catalog
+    return runblob(blob_id, blob, **kwargs)
+
+
+def checkpoint_path(brick_id, stage):
+    """ Append-only file of finished blobs for one brick and stage """
+    return os.path.join(conf.INTERIM_DIR, f'B{brick_id}_{stage}_CHECKPOINT.pkl')
+
+
+def timing_path(brick_id, stage):
+    """ Table of the per-blob timing records for one brick and stage, next to its catalog """
+    return os.path.join(conf.CATALOG_DIR, f'B{brick_id}_{stage}_TIMING.cat')
+
+
+def timing_table(records):
+    """ Table of timing records. The per-level columns are padded with zeros to the deepest blob. """
+    n_levels = max([record['N_LEVELS'] for record in records])
+    for record in records:
+        for colname in ('T_LEVELS', 'N_STEPS_LEVELS'):
+            record[colname] = np.pad(record[colname], (0, n_levels - len(record[colname])))
+    return Table(rows=records)
+
+
+def take_timing(output_rows, timing=None):
+    """ Takes the timing records attached by runblob off the results, and writes them to the timing file if given """
+    records = [rows.meta.pop('timing') for rows in output_rows if hasattr(rows, 'meta') and ('timing' in rows.meta)]
+    if (timing is not None) and (len(records) > 0):
+        timing_table(records).write(timing, format='fits', overwrite=True)
+        logger.info(f'Timing of {len(records)} blobs written to {timing}')
+    return records
+
+
+def read_checkpoint(path, blob_ids, tag):
+    """ Blob results saved so far, as {blob_id: rows}. The checkpoint is only used if it was written for the
+    same blobs and tag (e.g. the bands), and a last record cut short by a crash is dropped. """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb') as f:
+        try:
+            header = pickle.load(f)
+        except Exception:
+            header = None
+        if (header is None) or (header[1] != tag) or (not np.array_equal(header[0], blob_ids)):
+            logger.warning(f'Checkpoint {path} does not match this run and will be replaced.')
+            os.remove(path)
+            return done
+        truncate_at = None
+        while True:
+            offset = f.tell()
+            try:
+                blob_id, rows = pickle.load(f)
+            except EOFError:
+                break
+            except Exception:
+                logger.warning(f'Checkpoint {path} ends with an incomplete record, which is dropped.')
+                truncate_at = offset
+                break
+            done[blob_id] = rows
+    if truncate_at is not None:
+        # so that new records are appended after the last good one
+        with open(path, 'r+b') as f:
+            f.truncate(truncate_at)
+    return done
+
+
+def _tag_result(blob_id, *args, func=None, brick_log=None, **kwargs):
+    if brick_log is None:
+        return blob_id, func(blob_id, *args, **kwargs)
+    with worker_brick_logging(*brick_log):
+        return blob_id, func(blob_id, *args, **kwargs)
+
+
+# Set by farm_bricks, so that every brick in flight feeds the same pool and counts towards the same throughput
+_shared_pool = None
+_survey_stats = None
+
+
+def run_blobs(func, blob_ids, make_blob=None, checkpoint=None, tag='', timing=None, costs=None):
+    """ Runs func(blob_id, blob) (or func(blob_id) if make_blob is None) over the blobs, in a pool if NTHREADS > 1
+    (or in the shared pool of farm_bricks).
+    With costs (one per blob), the blobs are dispatched from the most to the least expensive.
+    With a checkpoint file, finished blobs are skipped and every new result is appended as it arrives.
+    The timing records attached by runblob are taken off the results, and written to the timing file if given.
+    Returns the results in the order of blob_ids. """
+
+    blob_ids = np.array(blob_ids)
+    done = {}
+    if checkpoint is not None:
+        done = read_checkpoint(checkpoint, blob_ids, tag)
+        if len(done) > 0:
+            logger.info(f'Resuming from {checkpoint} -- {len(done)}/{len(blob_ids)} blobs already finished.')
+        if not os.path.exists(checkpoint):
+            with open(checkpoint, 'wb') as f:
+                pickle.dump((blob_ids, tag), f, protocol=pickle.HIGHEST_PROTOCOL)
+    todo = [blob_id for blob_id in blob_ids if blob_id not in done]
+    if costs is not None:
+        # Longest first, so that no big blob starts last and holds up the whole brick
+        cost = dict(zip(blob_ids, costs))
+        todo = sorted(todo, key=lambda blob_id: -cost[blob_id])
+        logger.debug(f'Blobs dispatched by decreasing cost, starting with #{todo[:5]}')
+
+    def record(blob_id, rows):
+        done[blob_id] = rows
+        if checkpoint is not None:
+            with open(checkpoint, 'ab') as f:
+                pickle.dump((blob_id, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+        if _survey_stats is not None:
+            _survey_stats.add(rows)
+
+    # The workers log as the brick that submitted the blobs, to its logfiles
+    brick_log = None
+    if getattr(_brick_logs, 'brick_id', None) is not None:
+        brick_log = (_brick_logs.brick_id, [fh.baseFilename for fh in getattr(_brick_logs, 'handlers', [])])
+
+    def submit(pool):
+        task = partial(_tag_result, func=func, brick_log=brick_log)
+        if make_blob is None:
+            return pool.uimap(task, todo)
+        else:
+            return pool.uimap(task, todo, (make_blob(blob_id) for blob_id in todo))
+
+    if _shared_pool is not None:
+        # Blobs queue up behind those of the other bricks in flight, and fill workers as they free up
+        logger.info(f'Submitting {len(todo)} blobs to the shared processing pool.')
+        for blob_id, rows in submit(_shared_pool):
+            record(blob_id, rows)
+    elif conf.NTHREADS > 1:
+        with pa.pools.ProcessPool(ncpus=conf.NTHREADS) as pool:
+            logger.info(f'Parallel processing pool initalized with {conf.NTHREADS} threads.')
+            for blob_id, rows in submit(pool):
+                record(blob_id, rows)
+            logger.info('Parallel processing complete.')
+    else:
+        logger.info('Serial processing initalized.')
+        for blob_id in todo:
+            if make_blob is None:
+                record(blob_id, func(blob_id))
+            else:
+                record(blob_id, func(blob_id, make_blob(blob_id)))
+
+    output_rows = [done[blob_id] for blob_id in blob_ids]
+    take_timing(output_rows, timing)
+
+    return output_rows
+
+
+@brick_logging
 def detect_sources(brick_id, catalog=None, segmap=None, blobmap=None, use_mask=True):
     """Now we can detect stuff and be rid of it!
 
@@ -784,25 +1211,7 @@ def detect_sources(brick_id, catalog=None, segmap=None, blobmap=None, use_mask=T
     """
 
     if conf.LOGFILE_LOGGING_LEVEL is not None:
-        brick_logging_path = os.path.join(conf.LOGGING_DIR, f"B{brick_id}_logfile.log")
-        logging.info(f'Logging information will be streamed to console and to {brick_logging_path}\n')
-        # If overwrite is on, remove old logger                                                                                                                                                                                 
-        if conf.OVERWRITE & os.path.exists(brick_logging_path):
-            logging.warning('Existing logfile will be overwritten.')
-            os.remove(brick_logging_path)
-
-        # close and remove the old file handler
-        #fh.close()
-        #logger.removeHandler(fh)
-
-        # we will add an additional file handler to keep track of brick_id specific information
-        # set up the new file handler
-        shutil.copy(logging_path, brick_logging_path)
-        new_fh = logging.FileHandler(brick_logging_path,mode='a')
-        new_fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
-        new_fh.setFormatter(formatter)
-            
-        logger.addHandler(new_fh)
+        add_brick_logfile(brick_id, os.path.join(conf.LOGGING_DIR, f"B{brick_id}_logfile.log"))
 
     # Create detection brick
     tstart = time.time()
@@ -916,9 +1325,12 @@ def detect_sources(brick_id, catalog=None, segmap=None, blobmap=None, use_mask=T
     return detbrick
 
 
+@brick_logging
 def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=None, multiband_model=len(conf.MODELING_BANDS)>1, source_only=False):
     """ Stage 2. Detect your sources and determine the best model parameters for them """
 
+    checkpoints = []
+
     if (band is None) & (len(conf.MODELING_BANDS) > 0):
         modband = conf.MODELING_BANDS
         addName = conf.MULTIBAND_NICKNAME
@@ -940,23 +1352,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
 
     # create new logging file
     if conf.LOGFILE_LOGGING_LEVEL is not None:
-        brick_logging_path = os.path.join(conf.LOGGING_DIR, f"B{brick_id}_{addName}_logfile.log")
-        logger.info(f'Logging information will be streamed to console and to {brick_logging_path}\n')
-        # If overwrite is on, remove old logger                                                                                           
-        if conf.OVERWRITE & os.path.exists(brick_logging_path):
-            logger.warning('Existing logfile will be overwritten.')
-            os.remove(brick_logging_path)
-        # close and remove the old file handler                                                                                           
-        #fh.close()                                                                                                         
-        #logger.removeHandler(fh)                                                                                                  
-        
-        # we will add an additional file handler to keep track of brick_id specific information                                                                   
-        # set up the new file handler                                                                                                
-        shutil.copy(logging_path, brick_logging_path)
-        new_fh = logging.FileHandler(brick_logging_path,mode='a')
-        new_fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
-        new_fh.setFormatter(formatter)
-        logger.addHandler(new_fh)
+        add_brick_logfile(brick_id, os.path.join(conf.LOGGING_DIR, f"B{brick_id}_{addName}_logfile.log"))
 
     # Warn user that you cannot plot while running multiprocessing...
     if (source_id is None) & (blob_id is None):
@@ -1138,6 +1534,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                     raise ValueError('Requested source is not in blob!')
 
                 output_rows = runblob(blob_id, modblob, modeling=True, plotting=conf.PLOT, source_id=source_id, source_only=source_only)
+                take_timing([output_rows], timing_path(brick_id, f'MODELING_{addName}_BLOB{blob_id}') if conf.BLOB_TIMING else None)
 
                 output_cat = vstack(output_rows)
                         
@@ -1147,8 +1544,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                         outcatalog.add_column(Column(length=len(outcatalog), dtype=output_cat[colname].dtype, shape=shape, name=colname))
 
                 #outcatalog = join(outcatalog, output_cat, join_type='left', )
-                for row in output_cat:
-                    outcatalog[np.where(outcatalog['source_id'] == row['source_id'])[0]] = row
+                merge_catalog(outcatalog, output_cat)
 
                 # vs = outcatalog['VALID_SOURCE']
                 # scoords = SkyCoord(ra=outcatalog[vs]['RA'], dec=outcatalog[vs]['DEC'], unit='degree')
@@ -1171,26 +1567,31 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                 mosaic_origin = modbrick.mosaic_origin
                 brick_id = modbrick.brick_id
 
-                logger.info('Generating blobs...')
-                astart = time.time()
-                modblobs = (modbrick.make_blob(i) for i in np.arange(1, run_n_blobs+1))
-                logger.info(f'{run_n_blobs} blobs generated ({time.time() - astart:3.3f}s)')
                 #del modbrick
 
                 tstart = time.time()
 
-                if conf.NTHREADS > 1:
-
-                    with pa.pools.ProcessPool(ncpus=conf.NTHREADS) as pool:
-                        logger.info(f'Parallel processing pool initalized with {conf.NTHREADS} threads.')
-                        result = pool.uimap(partial(runblob, modeling=True, plotting=conf.PLOT, source_only=source_only), np.arange(1, run_n_blobs+1), modblobs)
-                        output_rows = list(result)
-                        logger.info('Parallel processing complete.')
-
-
+                blob_ids = np.arange(1, run_n_blobs+1)
+                checkpoint, timing, costs = None, None, None
+                if conf.CHECKPOINT_BLOBS:
+                    # one file per band modelled in series, or the bands would resume from each other
+                    checkpoint = checkpoint_path(brick_id, f'MODELING_{addName}' if len(img_names) == 1 else f'MODELING_{addName}_{mod_band}')
+                    checkpoints.append(checkpoint)
+                if conf.BLOB_TIMING:
+                    timing = timing_path(brick_id, f'MODELING_{addName}')
+                if conf.BLOB_DISPATCH == 'cost':
+                    costs = modbrick.blob_costs(blob_ids)
+
+                if (conf.NTHREADS > 1) & conf.SHARED_BRICK_MEMORY:
+                    shared_path = modbrick.share()
+                    try:
+                        output_rows = run_blobs(partial(runblob_shared, shared_path=shared_path, modeling=True, plotting=conf.PLOT, source_only=source_only),
+                                                blob_ids, checkpoint=checkpoint, tag=addName, timing=timing, costs=costs)
+                    finally:
+                        shutil.rmtree(shared_path)
                 else:
-                    logger.info('Serial processing initalized.')
-                    output_rows = [runblob(kblob_id+1, kblob, modeling=True, plotting=conf.PLOT, source_only=source_only) for kblob_id, kblob in enumerate(modblobs)]
+                    output_rows = run_blobs(partial(runblob, modeling=True, plotting=conf.PLOT, source_only=source_only),
+                                            blob_ids, make_blob=modbrick.make_blob, checkpoint=checkpoint, tag=addName, timing=timing, costs=costs)
 
                 output_cat = vstack(output_rows)
 
@@ -1217,8 +1618,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                         outcatalog.add_column(Column(length=len(outcatalog), dtype=output_cat[colname].dtype, shape=shape, name=colname))
 
                 #outcatalog = join(outcatalog, output_cat, join_type='left', )
-                for row in output_cat:
-                    outcatalog[np.where(outcatalog['source_id'] == row['source_id'])[0]] = row
+                merge_catalog(outcatalog, output_cat)
 
                 # vs = outcatalog['VALID_SOURCE']
                 # scoords = SkyCoord(ra=outcatalog[vs]['RA'], dec=outcatalog[vs]['DEC'], unit='degree')
@@ -1369,6 +1769,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                 raise ValueError('Requested blob is invalid')
 
             output_rows = runblob(blob_id, modblob, modeling=True, plotting=conf.PLOT, source_id=source_id, blob_only=blob_only, source_only=source_only)
+            take_timing([output_rows], timing_path(brick_id, f'MODELING_{addName}_BLOB{blob_id}') if conf.BLOB_TIMING else None)
 
             output_cat = vstack(output_rows)
 
@@ -1386,8 +1787,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                     outcatalog.add_column(Column(length=len(outcatalog), dtype=output_cat[colname].dtype, shape=colshape, name=colname))
 
             #outcatalog = join(outcatalog, output_cat, join_type='left', )
-            for row in output_cat:
-                outcatalog[np.where(outcatalog['source_id'] == row['source_id'])[0]] = row
+            merge_catalog(outcatalog, output_cat)
 
             # vs = outcatalog['VALID_SOURCE']
             # scoords = SkyCoord(ra=outcatalog[vs]['RA'], dec=outcatalog[vs]['DEC'], unit='degree')
@@ -1417,26 +1817,29 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
             mosaic_origin = modbrick.mosaic_origin
             brick_id = modbrick.brick_id
 
-            logger.info('Generating blobs...')
-            astart = time.time()
-            modblobs = (modbrick.make_blob(i) for i in bid_arr)
-            logger.info(f'{run_n_blobs} blobs generated ({time.time() - astart:3.3f}s)')
             #del modbrick
 
             tstart = time.time()
 
-            if conf.NTHREADS > 1:
-
-                with pa.pools.ProcessPool(ncpus=conf.NTHREADS) as pool:
-                    logger.info(f'Parallel processing pool initalized with {conf.NTHREADS} threads.')
-                    result = pool.uimap(partial(runblob, modeling=True, plotting=conf.PLOT), bid_arr, modblobs)
-                    output_rows = list(result)
-                    logger.info('Parallel processing complete.')
-
-
+            checkpoint, timing, costs = None, None, None
+            if conf.CHECKPOINT_BLOBS:
+                checkpoint = checkpoint_path(brick_id, f'MODELING_{addName}')
+                checkpoints.append(checkpoint)
+            if conf.BLOB_TIMING:
+                timing = timing_path(brick_id, f'MODELING_{addName}')
+            if conf.BLOB_DISPATCH == 'cost':
+                costs = modbrick.blob_costs(bid_arr)
+
+            if (conf.NTHREADS > 1) & conf.SHARED_BRICK_MEMORY:
+                shared_path = modbrick.share()
+                try:
+                    output_rows = run_blobs(partial(runblob_shared, shared_path=shared_path, modeling=True, plotting=conf.PLOT),
+                                            bid_arr, checkpoint=checkpoint, tag=addName, timing=timing, costs=costs)
+                finally:
+                    shutil.rmtree(shared_path)
             else:
-                logger.info('Serial processing initalized.')
-                output_rows = [runblob(kblob_id+1, kblob, modeling=True, plotting=conf.PLOT) for kblob_id, kblob in enumerate(modblobs)]
+                output_rows = run_blobs(partial(runblob, modeling=True, plotting=conf.PLOT),
+                                        bid_arr, make_blob=modbrick.make_blob, checkpoint=checkpoint, tag=addName, timing=timing, costs=costs)
                 
             
             output_cat = vstack(output_rows)
@@ -1470,8 +1873,7 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                         colshape = (1,)
                     outcatalog.add_column(Column(length=len(outcatalog), dtype=output_cat[colname].dtype, shape=colshape, name=colname))
             #outcatalog = join(outcatalog, output_cat, join_type='left', )
-            for row in output_cat:
-                outcatalog[np.where(outcatalog['source_id'] == row['source_id'])[0]] = row
+            merge_catalog(outcatalog, output_cat)
 
             # vs = outcatalog['VALID_SOURCE']
             # scoords = SkyCoord(ra=outcatalog[vs]['RA'], dec=outcatalog[vs]['DEC'], unit='degree')
@@ -1547,13 +1949,15 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
                 if band in img_names:
                     eff_area_deg = eff_area[band] * (conf.PIXEL_SCALE / 3600)**2
                     hdr.set(f'AREA{b}', eff_area_deg, f'{conf.MODELING_NICKNAME} {band} EFF_AREA (deg2)')
-        hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-        hdu_table = fits.table_to_hdu(modbrick.catalog)
-        hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
         outpath = os.path.join(conf.CATALOG_DIR, f'B{brick_id}.cat')
-        hdul.writeto(outpath, output_verify='ignore', overwrite=conf.OVERWRITE)
+        write_catalog(outpath, modbrick.catalog, hdr, overwrite=conf.OVERWRITE)
         logger.info(f'Wrote out catalog to {outpath}')
 
+    # The brick is complete, so its blob checkpoints are no longer needed
+    for checkpoint in checkpoints:
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
 
     # If user wants model and/or residual images made:
     if conf.MAKE_RESIDUAL_IMAGE:
@@ -1563,12 +1967,8 @@ def make_models(brick_id, detbrick='auto', band=None, source_id=None, blob_id=No
         cleancatalog = outcatalog[outcatalog[f'VALID_SOURCE_{conf.MODELING_NICKNAME}']]
         modbrick.make_model_image(catalog=cleancatalog, use_band_position=False, modeling=True)
 
-    # close the brick_id specific file handlers         
-    if conf.LOGFILE_LOGGING_LEVEL is not None:                                                                                
-        new_fh.close()
-        logger.removeHandler(new_fh)
-
 
+@brick_logging
 def force_photometry(brick_id, band=None, source_id=None, blob_id=None, insert=False, source_only=False, unfix_bandwise_positions=(not conf.FREEZE_FORCED_POSITION), unfix_bandwise_shapes=(not conf.FREEZE_FORCED_SHAPE), rao_cramer_only=False):
 
     if band is None:
@@ -1586,23 +1986,7 @@ def force_photometry(brick_id, band=None, source_id=None, blob_id=None, insert=F
 
     # create new logging file
     if conf.LOGFILE_LOGGING_LEVEL is not None:
-        brick_logging_path = os.path.join(conf.LOGGING_DIR, f"B{brick_id}_{addName}_logfile.log")
-        logger.info(f'Logging information will be streamed to console and to {brick_logging_path}\n')
-        # If overwrite is on, remove old logger                                                                                           
-        if conf.OVERWRITE & os.path.exists(brick_logging_path):
-            logger.warning('Existing logfile will be overwritten.')
-            os.remove(brick_logging_path)
-        # close and remove the old file handler                                                                                           
-        #fh.close()                                                                                                         
-        #logger.removeHandler(fh)                                                                                                  
-        
-        # we will add an additional file handler to keep track of brick_id specific information                                                                   
-        # set up the new file handler                                                                                                
-        shutil.copy(logging_path, brick_logging_path)
-        new_fh = logging.FileHandler(brick_logging_path,mode='a')
-        new_fh.setLevel(logging.getLevelName(conf.LOGFILE_LOGGING_LEVEL))
-        new_fh.setFormatter(formatter)
-        logger.addHandler(new_fh)
+        add_brick_logfile(brick_id, os.path.join(conf.LOGGING_DIR, f"B{brick_id}_{addName}_logfile.log"))
 
     # TODO Check if the catalog will be too big...
 
@@ -1714,6 +2098,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
     # Create and update multiband brick
     tstart = time.time()
     eff_area = None
+    checkpoint = None
 
     if source_only:
             if source_id is None:
@@ -1863,6 +2248,12 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
             output_rows = runblob_rc(blob_id, fblob, catalog=fbrick.catalog, source_id=source_id)
         else:
             output_rows = runblob(blob_id, fblob, modeling=False, catalog=fbrick.catalog, plotting=conf.PLOT, source_id=source_id)
+        if conf.BLOB_TIMING:
+            stage = 'RAOCRAMER' if rao_cramer_only else 'FORCED'
+            mode = fband[0].replace(' ', '_') if len(fband) == 1 else conf.MULTIBAND_NICKNAME
+            take_timing([output_rows], timing_path(brick_id, f'{stage}_{mode}_BLOB{blob_id}'))
+        else:
+            take_timing([output_rows])
 
         output_cat = vstack(output_rows)
         fbrick.bcatalog = output_cat
@@ -1879,30 +2270,10 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
             
 
             if insert & conf.OVERWRITE & (conf.NBLOBS==0):
-                # open old cat
+                # fill into the old cat, in place
                 path_mastercat = os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}.cat')
                 if os.path.exists(path_mastercat):
-                    mastercat = Table.read(path_mastercat, format='fits')
-
-                    # find new columns
-                    newcols = np.in1d(output_cat.colnames, mastercat.colnames, invert=True)
-                    # make fillers
-                    for colname in np.array(output_cat.colnames)[newcols]:
-                        #mastercat.add_column(output_cat[colname])
-                        if colname not in mastercat.colnames:
-                            if np.ndim(output_cat[colname]) > 1:
-                                shape = np.shape(output_cat[colname][1])
-                            else:
-                                shape = (1,)
-                            mastercat.add_column(Column(length=len(mastercat), dtype=output_cat[colname].dtype, shape=shape, name=colname))
-
-                    for row in output_cat:
-                        mastercat[np.where(mastercat['source_id'] == row['source_id'])[0]] = row
-                    # coordinate correction
-                    # fbrick.catalog['x'] = fbrick.catalog['x'] + fbrick.mosaic_origin[1] - conf.BRICK_BUFFER + 1.
-                    # fbrick.catalog['y'] = fbrick.catalog['y'] + fbrick.mosaic_origin[0] - conf.BRICK_BUFFER + 1.
-                    # save
-                    mastercat.write(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}.cat'), format='fits', overwrite=conf.OVERWRITE)
+                    insert_catalog(path_mastercat, output_cat)
                     logger.info(f'Saving results for brick #{fbrick.brick_id} to existing catalog file.')
             else:
                     
@@ -1915,8 +2286,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                         fbrick.catalog.add_column(Column(length=len(fbrick.catalog), dtype=output_cat[colname].dtype, shape=shape, name=colname))
 
                 #fbrick.catalog = join(fbrick.catalog, output_cat, join_type='left', )
-                for row in output_cat:
-                    fbrick.catalog[np.where(fbrick.catalog['source_id'] == row['source_id'])[0]] = row
+                merge_catalog(fbrick.catalog, output_cat)
 
                 mode_ext = conf.MULTIBAND_NICKNAME
                 if fband is not None:
@@ -1944,27 +2314,33 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
         blob_ids = np.unique(fbrick.catalog['blob_id'].data)
         if conf.NBLOBS > 0:
             blob_ids = blob_ids[:conf.NBLOBS]
-        fblobs = (fbrick.make_blob(i) for i in blob_ids)
 
         assert(fbrick.n_blobs == len(np.unique(fbrick.catalog['blob_id'].data)))
 
-        if conf.NTHREADS > 1:
-
-            with pa.pools.ProcessPool(ncpus=conf.NTHREADS) as pool:
-                logger.info(f'Parallel processing pool initalized with {conf.NTHREADS} threads.')
+        checkpoint, timing, costs = None, None, None
+        tag = '_'.join(fband)
+        stage = 'RAOCRAMER' if rao_cramer_only else 'FORCED'
+        mode = fband[0].replace(' ', '_') if len(fband) == 1 else conf.MULTIBAND_NICKNAME
+        if conf.CHECKPOINT_BLOBS:
+            checkpoint = checkpoint_path(brick_id, f'{stage}_{mode}')
+        if conf.BLOB_TIMING:
+            timing = timing_path(brick_id, f'{stage}_{mode}')
+        if conf.BLOB_DISPATCH == 'cost':
+            costs = fbrick.blob_costs(blob_ids)
+
+        if (conf.NTHREADS > 1) & conf.SHARED_BRICK_MEMORY:
+            shared_path = fbrick.share()
+            try:
                 if rao_cramer_only:
-                    result = pool.uimap(partial(runblob_rc, catalog=fbrick.catalog), blob_ids, fblobs)
+                    output_rows = run_blobs(partial(runblob_shared, shared_path=shared_path, rao_cramer_only=True), blob_ids, checkpoint=checkpoint, tag=tag, timing=timing, costs=costs)
                 else:
-                    result = pool.uimap(partial(runblob, modeling=False, catalog=fbrick.catalog, plotting=conf.PLOT), blob_ids, fblobs)
-                output_rows = list(result)
-                logger.info('Parallel processing complete.')
-
-
+                    output_rows = run_blobs(partial(runblob_shared, shared_path=shared_path, modeling=False, plotting=conf.PLOT), blob_ids, checkpoint=checkpoint, tag=tag, timing=timing, costs=costs)
+            finally:
+                shutil.rmtree(shared_path)
+        elif rao_cramer_only:
+            output_rows = run_blobs(partial(runblob_rc, catalog=fbrick.catalog), blob_ids, make_blob=fbrick.make_blob, checkpoint=checkpoint, tag=tag, timing=timing, costs=costs)
         else:
-            if rao_cramer_only:
-                output_rows = [runblob_rc(kblob_id, fbrick.make_blob(kblob_id), catalog=fbrick.catalog) for kblob_id in blob_ids]
-            else:
-                output_rows = [runblob(kblob_id, fbrick.make_blob(kblob_id), modeling=False, catalog=fbrick.catalog, plotting=conf.PLOT) for kblob_id in blob_ids]
+            output_rows = run_blobs(partial(runblob, modeling=False, catalog=fbrick.catalog, plotting=conf.PLOT), blob_ids, make_blob=fbrick.make_blob, checkpoint=checkpoint, tag=tag, timing=timing, costs=costs)
 
         logger.info(f'Completed {run_n_blobs} blobs in {time.time() - tstart:3.3f}s')
 
@@ -2002,45 +2378,30 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
             logging.warning('OUTPUT is DISABLED! Quitting...')
         else:
             if insert & conf.OVERWRITE & (conf.NBLOBS==0) & (not force_unfixed_pos):
-                # open old cat
+                # fill into the old cat, in place
                 path_mastercat = os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}.cat')
                 if os.path.exists(path_mastercat):
-                    mastercat = Table.read(path_mastercat, format='fits')
-
-                    # find new columns
-                    newcols = np.in1d(output_cat.colnames, mastercat.colnames, invert=True)
-                    # make fillers
-                    for colname in np.array(output_cat.colnames)[newcols]:
-                        if colname not in mastercat.colnames:
-                            if np.ndim(output_cat[colname]) > 1:
-                                colshape = np.shape(output_cat[colname][1])
-                            else:
-                                colshape = (1,)
-                            mastercat.add_column(Column(length=len(mastercat), dtype=output_cat[colname].dtype, shape=colshape, name=colname))
-
-                    for row in output_cat:
-                        mastercat[np.where(mastercat['source_id'] == row['source_id'])[0]] = row
-                    # coordinate correction
-                    # fbrick.catalog['x'] = fbrick.catalog['x'] + fbrick.mosaic_origin[1] - conf.BRICK_BUFFER + 1.
-                    # fbrick.catalog['y'] = fbrick.catalog['y'] + fbrick.mosaic_origin[0] - conf.BRICK_BUFFER + 1.
-                    # save
-                    hdr = fits.open(path_mastercat)['CONFIG'].header
+                    hdr = fits.getheader(path_mastercat, 'CONFIG')
                     lastb = 0
                     for b in np.arange(99):
                         if 'AREA{b}' not in hdr.keys():
                             lastb = b
+                    area_cards = {}
                     if eff_area is not None:
                         for b, band in enumerate(conf.BANDS):
                             if band in fband:
                                 eff_area_deg = eff_area[band]  * (conf.PIXEL_SCALE / 3600)**2
-                                hdr.set(f'AREA{b+lastb}', eff_area_deg, f'{band} EFF_AREA (deg2)')
-                    hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-                    hdu_table = fits.table_to_hdu(mastercat)
-                    hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-                    hdul.writeto(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}.cat'), overwrite=conf.OVERWRITE)
+                                area_cards[f'AREA{b+lastb}'] = (eff_area_deg, f'{band} EFF_AREA (deg2)')
+                    reserve = None
+                    if conf.PREALLOCATE_BAND_COLUMNS:
+                        reserve = reserve_band_columns(output_cat.colnames, fband)
+                    insert_catalog(path_mastercat, output_cat, config_cards=area_cards, reserve=reserve)
                     logger.info(f'Saving results for brick #{fbrick.brick_id} to existing catalog file.')
 
-                    outcatalog = mastercat
+                    # only read back if the images need it
+                    outcatalog = None
+                    if conf.MAKE_RESIDUAL_IMAGE | conf.MAKE_MODEL_IMAGE:
+                        outcatalog = Table.read(path_mastercat, format='fits')
 
                 else:
                     logger.critical(f'Catalog file for brick #{fbrick.brick_id} could not be found!')
@@ -2067,10 +2428,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                                 if band in fband:
                                     eff_area_deg = eff_area[band] * (conf.PIXEL_SCALE / 3600)**2
                                     hdr.set(f'AREA{b+lastb}', eff_area_deg, f'{band} EFF_AREA (deg2)')
-                        hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-                        hdu_table = fits.table_to_hdu(mastercat)
-                        hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-                        hdul.writeto(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}_{conf.MULTIBAND_NICKNAME}.cat'), overwrite=conf.OVERWRITE)
+                        write_catalog(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}_{conf.MULTIBAND_NICKNAME}.cat'), mastercat, hdr, overwrite=conf.OVERWRITE)
                         logger.info(f'Saving results for brick #{fbrick.brick_id} to new catalog file.')
 
                     else:
@@ -2122,10 +2480,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                                 if band in fband:
                                     eff_area_deg = eff_area[band]  * (conf.PIXEL_SCALE / 3600)**2
                                     hdr.set(f'AREA{b+lastb}', eff_area_deg, f'{band} EFF_AREA (deg2)')
-                        hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-                        hdu_table = fits.table_to_hdu(mastercat)
-                        hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-                        hdul.writeto(path_mastercat, overwrite=conf.OVERWRITE)
+                        write_catalog(path_mastercat, mastercat, hdr, overwrite=conf.OVERWRITE)
                         logger.info(f'Saving results for brick #{fbrick.brick_id} to existing catalog file.')
 
                 else:
@@ -2141,10 +2496,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                             if band in fband:
                                 eff_area_deg = eff_area[band] * (conf.PIXEL_SCALE / 3600)**2
                                 hdr.set(f'AREA{b+lastb}', eff_area_deg, f'{band} EFF_AREA (deg2)')
-                    hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-                    hdu_table = fits.table_to_hdu(mastercat)
-                    hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-                    hdul.writeto(path_mastercat, overwrite=conf.OVERWRITE)
+                    write_catalog(path_mastercat, mastercat, hdr, overwrite=conf.OVERWRITE)
                     logger.info(f'Saving results for brick #{fbrick.brick_id} to new catalog file.')
                 
 
@@ -2162,8 +2514,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                             colshape = (1,)
                         fbrick.catalog.add_column(Column(length=len(fbrick.catalog), dtype=output_cat[colname].dtype, shape=colshape, name=colname))
                 #fbrick.catalog = join(fbrick.catalog, output_cat, join_type='left', )
-                for row in output_cat:
-                    fbrick.catalog[np.where(fbrick.catalog['source_id'] == row['source_id'])[0]] = row
+                merge_catalog(fbrick.catalog, output_cat)
 
                 mode_ext = conf.MULTIBAND_NICKNAME
                 if fband is not None:
@@ -2185,10 +2536,7 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                         if band in fband:
                             eff_area_deg = eff_area[band] * (conf.PIXEL_SCALE / 3600)**2
                             hdr.set(f'AREA{b+lastb}', eff_area_deg, f'{band} EFF_AREA (deg2)')
-                hdu_info = fits.ImageHDU(header=hdr, name='CONFIG')
-                hdu_table = fits.table_to_hdu(fbrick.catalog)
-                hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-                hdul.writeto(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}_{mode_ext}.cat'), overwrite=conf.OVERWRITE)
+                write_catalog(os.path.join(conf.CATALOG_DIR, f'B{fbrick.brick_id}_{mode_ext}.cat'), fbrick.catalog, hdr, overwrite=conf.OVERWRITE)
                 logger.info(f'Saving results for brick #{fbrick.brick_id} to new {mode_ext} catalog file.')
 
                 outcatalog = fbrick.catalog
@@ -2199,6 +2547,10 @@ def force_models(brick_id, band=None, source_id=None, blob_id=None, insert=True,
                 fbrick.make_residual_image(catalog=outcatalog, use_band_position=force_unfixed_pos, use_band_shape=use_band_shape, modeling=False)
             elif conf.MAKE_MODEL_IMAGE:
                 fbrick.make_model_image(catalog=outcatalog, use_band_position=force_unfixed_pos, use_band_shape=use_band_shape, modeling=False)
+
+    # The brick is complete, so its blob checkpoint is no longer needed
+    if (checkpoint is not None) and os.path.exists(checkpoint):
+        os.remove(checkpoint)
             
     del fbrick
     return 
@@ -2332,7 +2684,8 @@ def make_residual_image(brick_id, band, catalog=None, use_band_position=(not con
     brick.make_residual_image(brick.catalog, use_band_position=use_band_position, use_band_shape=use_band_shape, modeling=modeling)
 
 
-def estimate_effective_area(brick_id, band, catalog=None, save=False, use_band_position=(not conf.FREEZE_FORCED_POSITION), use_band_shape=(not conf.FREEZE_FORCED_SHAPE), modeling=False):
+def effective_area_band(band, modeling=False):
+    """ Brick file nickname, band within it, and whether band was modelled, for the effective area of band """
     if band.startswith(conf.MODELING_NICKNAME) | ((modeling==True) & (band != conf.MODELING_NICKNAME)):
         nickname = conf.MULTIBAND_NICKNAME
         if band.startswith(conf.MODELING_NICKNAME):
@@ -2348,56 +2701,51 @@ def estimate_effective_area(brick_id, band, catalog=None, save=False, use_band_p
         nickname = conf.MULTIBAND_NICKNAME
         sband = band
         modeling=False
+    return nickname, sband, modeling
 
-    brick = stage_brickfiles(brick_id, nickname=nickname, band=sband)
 
-    if catalog is not None:
-        brick.catalog = catalog[catalog['brick_id']==brick_id]
-        brick.n_sources = len(brick.catalog)
-        brick.n_blobs = brick.catalog['blob_id'].max()
-  
+def effective_area_catalog(brick_id, band, use_band_position=(not conf.FREEZE_FORCED_POSITION), use_band_shape=(not conf.FREEZE_FORCED_SHAPE)):
+    """ Catalog of brick_id written by the pipeline, to judge its sources by """
+    search_fn = os.path.join(conf.CATALOG_DIR, f'B{brick_id}.cat')
+    search_fn2 = os.path.join(conf.CATALOG_DIR, f'B{brick_id}_{conf.MULTIBAND_NICKNAME}.cat') # this means the band was run by itself!
+    search_fn3 = os.path.join(conf.CATALOG_DIR, f'B{brick_id}_{band}.cat')
+    if os.path.exists(search_fn) & ~(use_band_position | use_band_shape):
+        logger.info(f'Adopting catalog from {search_fn}')
+    elif os.path.exists(search_fn2) & (use_band_position | use_band_shape):
+        logger.info(f'Adopting catalog from {search_fn2}')   # Tries to find BXXX_MULTIBAND.fits
+        search_fn = search_fn2
+    elif os.path.exists(search_fn3) & (use_band_position | use_band_shape):
+        logger.info(f'Adopting catalog from {search_fn3}')  # Tries to find BXXX_BAND.fits
+        search_fn = search_fn3
     else:
-        search_fn = os.path.join(conf.CATALOG_DIR, f'B{brick_id}.cat')
-        search_fn2 = os.path.join(conf.CATALOG_DIR, f'B{brick_id}_{conf.MULTIBAND_NICKNAME}.cat') # this means the band was run by itself!
-        search_fn3 = os.path.join(conf.CATALOG_DIR, f'B{brick_id}_{band}.cat')
-        if os.path.exists(search_fn) & ~(use_band_position | use_band_shape):
-            brick.logger.info(f'Adopting catalog from {search_fn}')
-            brick.catalog = Table(fits.open(search_fn)[1].data)
-            brick.n_sources = len(brick.catalog)
-            brick.n_blobs = brick.catalog['blob_id'].max()
-            use_band_position=False
-        elif os.path.exists(search_fn2) & (use_band_position | use_band_shape):
-            brick.logger.info(f'Adopting catalog from {search_fn2}')   # Tries to find BXXX_MULTIBAND.fits
-            brick.catalog = Table(fits.open(search_fn2)[1].data)
-            brick.n_sources = len(brick.catalog)
-            brick.n_blobs = brick.catalog['blob_id'].max()
-            use_band_position=True
-        elif os.path.exists(search_fn3) & (use_band_position | use_band_shape):
-            brick.logger.info(f'Adopting catalog from {search_fn3}')  # Tries to find BXXX_BAND.fits
-            brick.catalog = Table(fits.open(search_fn3)[1].data)
-            brick.n_sources = len(brick.catalog)
-            brick.n_blobs = brick.catalog['blob_id'].max()
-            use_band_position=True
-        else:
-            raise ValueError(f'No valid catalog was found for {brick_id}')
+        raise ValueError(f'No valid catalog was found for {brick_id}')
+    with fits.open(search_fn) as hdul_cat:
+        return Table(hdul_cat[1].data)
+
+
+def brick_effective_area(brick_id, source_ids, band, save=False, modeling=False):
+    """ Effective area (pix) of brick_id in band, where source_ids are the sources to keep (see effective_sources).
+    Only the band mask is read from the brick file, and the segmentation map from the interim SEGMAPS file. """
+    nickname, sband, modeling = effective_area_band(band, modeling)
+
+    path_brickfile = os.path.join(conf.BRICK_DIR, f'B{brick_id}_N{nickname}_W{conf.BRICK_WIDTH}_H{conf.BRICK_HEIGHT}.fits')
+    if os.path.exists(path_brickfile):
+        with fits.open(path_brickfile) as hdul_brick:
+            mask = np.array(hdul_brick[f'{sband}_MASK'].data, dtype=bool)
+    else:
+        raise ValueError(f'Brick file not found for {path_brickfile}')
 
-    import os
     search_fn = os.path.join(conf.INTERIM_DIR, f'B{brick_id}_SEGMAPS.fits')
     if os.path.exists(search_fn):
-        hdul_seg = fits.open(search_fn)
-        brick.segmap = hdul_seg['SEGMAP'].data
-        brick.blobmap = hdul_seg['BLOBMAP'].data
-        brick.segmask = brick.segmap.copy()
-        brick.segmask[brick.segmap>0] = 1
+        with fits.open(search_fn) as hdul_seg:
+            segmap = np.array(hdul_seg['SEGMAP'].data)
     else:
         raise ValueError(f'No valid segmentation map was found for {brick_id}')
 
-    # brick.run_background()
-
-    good_area_pix, inner_area_pix = brick.estimate_effective_area(brick.catalog, sband, modeling=modeling)
+    good_area_pix, inner_area_pix = effective_area_pixels(segmap, mask, source_ids)
+    logger.info(f'Total effective area for brick #{brick_id}: {good_area_pix*(conf.PIXEL_SCALE/3600)**2:4.4f} deg2 ({good_area_pix/inner_area_pix*100:3.3f}%)')
 
     if save:
-        import os
         outF = open(os.path.join(conf.INTERIM_DIR, f"effarea_{band}_{brick_id}.dat"), "w")
         outF.write(f'{good_area_pix}\n{inner_area_pix}')
         outF.close()
@@ -2405,6 +2753,51 @@ def estimate_effective_area(brick_id, band, catalog=None, save=False, use_band_p
     return good_area_pix, inner_area_pix
 
 
+def estimate_effective_area(brick_id, band, catalog=None, save=False, use_band_position=(not conf.FREEZE_FORCED_POSITION), use_band_shape=(not conf.FREEZE_FORCED_SHAPE), modeling=False):
+    nickname, sband, modeling = effective_area_band(band, modeling)
+
+    if catalog is not None:
+        catalog = catalog[catalog['brick_id']==brick_id]
+    else:
+        catalog = effective_area_catalog(brick_id, band, use_band_position, use_band_shape)
+
+    source_ids = catalog['source_id'][effective_sources(catalog, sband, modeling=modeling)]
+    return brick_effective_area(brick_id, source_ids, band, save=save, modeling=modeling)
+
+
+def estimate_effective_areas(brick_ids, band, catalog=None, save=False, use_band_position=(not conf.FREEZE_FORCED_POSITION), use_band_shape=(not conf.FREEZE_FORCED_SHAPE), modeling=False):
+    """ Effective and inner areas (pix) of many bricks in band, with up to EFFAREA_NTHREADS processes.
+    A catalog given for all of them is judged in one go, and only the sources kept are sent to each brick. """
+
+    tstart = time.time()
+    brick_ids = np.atleast_1d(brick_ids)
+    nickname, sband, modeling = effective_area_band(band, modeling)
+
+    if catalog is not None:
+        keep = effective_sources(catalog, sband, modeling=modeling)
+        kept = catalog[keep]
+        order = np.argsort(kept['brick_id'], kind='stable')
+        kept_bids, kept_sids = np.array(kept['brick_id'])[order], np.array(kept['source_id'])[order]
+        bounds = np.searchsorted(kept_bids, brick_ids), np.searchsorted(kept_bids, brick_ids, side='right')
+        source_ids = [kept_sids[i0:i1] for i0, i1 in zip(*bounds)]
+        task = partial(brick_effective_area, band=band, save=save, modeling=modeling)
+        args = (brick_ids, source_ids)
+    else:
+        task = partial(estimate_effective_area, band=band, save=save, use_band_position=use_band_position, use_band_shape=use_band_shape, modeling=modeling)
+        args = (brick_ids,)
+
+    if (conf.EFFAREA_NTHREADS > 1) & (len(brick_ids) > 1):
+        with pa.pools.ProcessPool(ncpus=conf.EFFAREA_NTHREADS) as pool:
+            logger.info(f'Parallel effective area pool initalized with {conf.EFFAREA_NTHREADS} processes.')
+            areas = list(pool.imap(task, *args))
+    else:
+        areas = list(map(task, *args))
+
+    good_area_pix, inner_area_pix = np.array(areas, dtype=float).reshape(len(brick_ids), 2).T
+    logger.info(f'Total effective area for {band} over {len(brick_ids)} bricks: {good_area_pix.sum()*(conf.PIXEL_SCALE/3600)**2:4.4f} deg2 ({time.time() - tstart:3.3f}s)')
+    return good_area_pix, inner_area_pix
+
+
 def stage_brickfiles(brick_id, nickname='MISCBRICK', band=None, modeling=False, is_detection=False):
     """ Essentially a private function. Pre-processes brick files and relevant catalogs """
 
@@ -2705,6 +3098,7 @@ def models_from_catalog(catalog, fblob, unit_flux=False):
     return model_catalog[good_sources], good_sources
 
 
+@record_blob_timing
 def runblob_rc(blob_id, fblob, catalog=None, source_id=None):
     """ Essentially a private function. Runs each individual blob and handles the bulk of the work. """
 
@@ -2844,4 +3238,91 @@ def farm(brick_id):
 
     detect_sources(brick_id)
     make_models(brick_id)
-    # force_photometry(brick_id)
\ No newline at end of file
+    # force_photometry(brick_id)
+
+
+class SurveyStats():
+    """ Blob and source counts over every brick run by farm_bricks """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tstart = time.time()
+        self.n_blobs = 0
+        self.n_sources = 0
+
+    def add(self, rows):
+        with self.lock:
+            self.n_blobs += 1
+            if rows is not None:
+                self.n_sources += len(rows)
+
+    def __str__(self):
+        ttotal = time.time() - self.tstart
+        return f'{self.n_blobs} blobs and {self.n_sources} sources in {ttotal:3.3f}s ({self.n_blobs/ttotal:3.3f} blobs/s, {self.n_sources/ttotal:3.3f} sources/s)'
+
+
+# Stages farm_bricks can run on each brick, in this order
+FARM_STAGES = {'detect_sources': lambda brick_id: detect_sources(brick_id),
+               'make_models': lambda brick_id: make_models(brick_id),
+               'force_models': lambda brick_id: force_models(brick_id, band=None, insert=True)}
+
+
+def farm_brick(brick_id, stages=tuple(FARM_STAGES.keys())):
+    """ Runs the stages on one brick, in order. Returns the wall time (s), or None if a stage failed. """
+    tstart = time.time()
+    try:
+        for stage in stages:
+            logger.info(f'Brick #{brick_id}: starting {stage}')
+            FARM_STAGES[stage](brick_id)
+    except Exception:
+        logger.exception(f'Brick #{brick_id} failed during {stage}!')
+        return None
+    return time.time() - tstart
+
+
+def farm_bricks(brick_ids, stages=tuple(FARM_STAGES.keys()), nthreads=conf.NTHREADS, bricks_in_flight=conf.FARM_BRICKS_IN_FLIGHT):
+    """ Runs the stages over many bricks through one global worker pool.
+
+    Up to bricks_in_flight bricks are driven at a time, each from its own thread, and all of them submit their
+    blobs to the same pool of nthreads processes. While one brick waits on its slowest blobs, the blobs of the
+    next ones keep the rest of the workers busy. Survey-level throughput is reported as bricks finish.
+    """
+    global _shared_pool, _survey_stats
+
+    brick_ids = list(brick_ids)
+    for stage in stages:
+        if stage not in FARM_STAGES:
+            raise ValueError(f'{stage} is not a valid stage (see {list(FARM_STAGES.keys())})')
+    if conf.PLOT > 0:
+        logger.warning('Plotting is not thread-safe -- running one brick at a time.')
+        bricks_in_flight = 1
+
+    logger.info(f'Farming {len(brick_ids)} bricks ({", ".join(stages)}) with {bricks_in_flight} in flight and {nthreads} workers')
+    _survey_stats = SurveyStats()
+    if nthreads > 1:
+        _shared_pool = pa.pools.ProcessPool(ncpus=nthreads)
+        logger.info(f'Shared processing pool initalized with {nthreads} threads.')
+
+    walltimes = {}
+    try:
+        with ThreadPoolExecutor(max_workers=bricks_in_flight) as executor:
+            futures = {executor.submit(farm_brick, brick_id, stages): brick_id for brick_id in brick_ids}
+            for future in as_completed(futures):
+                brick_id = futures[future]
+                walltimes[brick_id] = future.result()
+                status = 'failed' if walltimes[brick_id] is None else f'done in {walltimes[brick_id]:3.3f}s'
+                logger.info(f'Brick #{brick_id} {status} ({len(walltimes)}/{len(brick_ids)}). So far: {_survey_stats}')
+    finally:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool.join()
+            _shared_pool.clear()
+        _shared_pool = None
+        stats, _survey_stats = _survey_stats, None
+
+    failed = [brick_id for brick_id in brick_ids if walltimes.get(brick_id) is None]
+    if len(failed) > 0:
+        logger.warning(f'{len(failed)} bricks failed: {failed}')
+    logger.info(f'Farmed {len(brick_ids) - len(failed)}/{len(brick_ids)} bricks: {stats}')
+
+    return walltimes
@@ -12,7 +12,7 @@ Class to handle mosaics (PSF + bricking)
 
 Known Issues
 ------------
-None
+With memmap=True, images stored with BSCALE/BZERO are still read in full by astropy when accessed.
 
 
 """
@@ -41,7 +41,7 @@ import logging
 class Mosaic(Subimage):
     
     def __init__(self, band, detection=False, modeling=False, psfmodel=None, wcs=None, header=None, mag_zeropoint=None, skip_build=False,
-                ):
+                memmap=False):
 
         self.logger = logging.getLogger('farmer.mosaic')
 
@@ -72,8 +72,12 @@ class Mosaic(Subimage):
                 fname_mask = conf.MULTIBAND_FILENAME.replace('EXT', conf.MASK_EXT).replace('BAND', raw_band)
             self.path_mask = os.path.join(conf.IMAGE_DIR, fname_mask)
 
+        self.memmap = memmap
+
         if skip_build:
             self.logger.warning('Skipping mosaic build!')
+        elif memmap:
+            self._open_memmap()
         else:
             self.logger.info('Building mosaic...')
 
@@ -129,6 +133,61 @@ class Mosaic(Subimage):
         
         super().__init__()
 
+    def _read_memmap(self, path):
+        with fits.open(path, memmap=True) as hdul:
+            if hdul['PRIMARY'].data is not None:
+                return hdul['PRIMARY'].data, hdul['PRIMARY'].header
+            else:
+                return hdul[1].data, hdul[1].header
+
+    def _open_memmap(self):
+        """ Opens the image, weight and mask as read-only memory-maps. Nothing is read until a brick is cut out,
+        so the byte order is only converted, and the zero-weight pixels only masked, one cut-out at a time. """
+        self.logger.info('Opening mosaic as memory-maps...')
+
+        tstart = time()
+        if os.path.exists(self.path_image):
+            image, self.master_head = self._read_memmap(self.path_image)
+        else:
+            raise ValueError(f'No image found at {self.path_image}')
+        if image.ndim != 2:
+            raise ValueError(f'Images found with invalid dimensions (ndim = {image.ndim})')
+        self.ndim = 2
+        self._images = image[None, :, :]
+        self.shape = self._images.shape
+        self.dims = self.shape[1:]
+        self.n_bands = 1
+        self.wcs = WCS(self.master_head)
+
+        if os.path.exists(self.path_weight):
+            self._weights = self._read_memmap(self.path_weight)[0][None, :, :]
+        else:
+            self._weights = np.broadcast_to(np.ones(1), self.shape)
+
+        if os.path.exists(self.path_mask):
+            self._masks = self._read_memmap(self.path_mask)[0][None, :, :]
+        else:
+            self._masks = np.broadcast_to(np.zeros(1, dtype=bool), self.shape)
+
+        for name, array in (('Weights', self._weights), ('Masks', self._masks)):
+            if array.shape != self.shape:
+                raise ValueError(f'{name} found with invalid shape (shape = {array.shape})')
+        self.logger.info(f'Opened memory-maps in {time()-tstart:3.3f}s. ({self.path_image})')
+
+    def _get_subimage(self, x0, y0, w, h, buffer):
+        subinfo = super()._get_subimage(x0, y0, w, h, buffer)
+        if self.memmap:
+            # Zero-weight pixels are masked per cut-out, rather than over the whole mosaic
+            subweights, submasks = subinfo[1], subinfo[2]
+            submasks |= (subweights == 0)
+        return subinfo
+
+    def brick_nbytes(self, brick_width=conf.BRICK_WIDTH, brick_height=conf.BRICK_HEIGHT, brick_buffer=conf.BRICK_BUFFER):
+        """ Rough peak memory (bytes) taken by cutting out and writing one brick of this mosaic """
+        npix = (brick_width + 2*brick_buffer) * (brick_height + 2*brick_buffer)
+        # float image, weight and integer mask, each converted once more on write, plus the boolean mask
+        return int(npix * (2 * 3 * 8 + 1))
+
     def _make_psf(self, xlims, ylims, override=False, sextractor_only=False, psfex_only=False):
 
         # Set filenames
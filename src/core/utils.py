@@ -11,6 +11,7 @@ Possible problems:
 
 """
 import os
+import re
 import numpy as np
 from tractor.galaxy import ExpGalaxy
 from tractor import EllipseE
@@ -54,6 +55,164 @@ def header_from_dict(params):
     logger.debug(f'header_from_dict :: Completed writing header ({time() - tstart:2.3f}s)')
     return hdr
 
+def match_rows(keys, new_keys, key='source_id'):
+    """ Positions of new_keys within keys, and which of new_keys were found at all """
+    # Index the keys once, then look up every new row at the same time
+    keys, new_keys = np.asarray(keys), np.asarray(new_keys)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pos = np.clip(np.searchsorted(sorted_keys, new_keys), 0, max(len(sorted_keys)-1, 0))
+    found = sorted_keys[pos] == new_keys if len(sorted_keys) > 0 else np.zeros(len(new_keys), dtype=bool)
+    if not found.all():
+        logger.warning(f'match_rows :: {np.sum(~found)} rows have no matching {key} and are skipped')
+    return order[pos[found]], found
+
+def _fit_values(values, column):
+    # Scalars stored in (1,)-shaped columns need a trailing axis to broadcast
+    extra_dims = np.ndim(column) - np.ndim(values)
+    if extra_dims > 0:
+        values = np.reshape(values, np.shape(values) + (1,) * extra_dims)
+    return values
+
+def _fill_column(data, colname, idx, values):
+    """ data[colname][idx] = values on a FITS table. Logical columns are written as raw T/F bytes, as astropy
+    would otherwise leave False as NULL in a file that started out zeroed. """
+    if data.columns[colname].format.endswith('L'):
+        field = data.view(np.ndarray)[colname]
+        field[idx] = np.where(_fit_values(values, field), ord('T'), ord('F'))
+    else:
+        field = data[colname]
+        field[idx] = _fit_values(values, field)
+
+def merge_catalog(catalog, newcat, key='source_id'):
+    """ Scatter the rows of newcat into catalog (in place), matched on key. Columns are copied by name
+    as whole arrays; rows of newcat with no match in catalog are skipped. """
+    tstart = time()
+    idx, found = match_rows(catalog[key], newcat[key], key)
+
+    for colname in newcat.colnames:
+        if colname not in catalog.colnames:
+            continue
+        catalog[colname][idx] = _fit_values(newcat[colname][found], catalog[colname])
+
+    logger.debug(f'merge_catalog :: Merged {len(idx)} rows ({time() - tstart:2.3f}s)')
+    return catalog
+
+def _allocate_catalog(path, table_header, config_header=None):
+    """ Writes a catalog file whose table data are reserved on disk (as zeros) but not yet filled """
+    if config_header is None:
+        config_header = fits.Header()
+    n_bytes = table_header['NAXIS1'] * table_header['NAXIS2'] + table_header.get('PCOUNT', 0)
+    with open(path, 'wb') as f:
+        fits.PrimaryHDU().writeto(f)
+        f.write(table_header.tostring().encode('ascii'))
+        # Seeking past the end leaves a hole, which reads back as zeros (i.e. FITS padding)
+        f.seek(int(np.ceil(n_bytes / 2880.)) * 2880, os.SEEK_CUR)
+        f.write(fits.ImageHDU(header=config_header, name='CONFIG').header.tostring().encode('ascii'))
+
+def write_catalog(path, catalog, config_header=None, overwrite=False, chunk_size=conf.CATALOG_CHUNK_SIZE):
+    """ Writes catalog as [PRIMARY, table, CONFIG], the same as table_to_hdu + writeto would, but the table
+    is converted and filled in place chunk_size rows at a time, so no full FITS copy is ever held in memory. """
+    tstart = time()
+    if os.path.exists(path) & (not overwrite):
+        raise OSError(f'File {path} already exists. If you mean to replace it then use the argument "overwrite=True".')
+    table_header = fits.table_to_hdu(catalog[:0]).header
+    table_header['NAXIS2'] = len(catalog)
+    _allocate_catalog(path, table_header, config_header)
+
+    with fits.open(path, mode='update', memmap=True) as hdul:
+        data = hdul[1].data
+        for start in np.arange(0, len(catalog), chunk_size):
+            chunk = fits.table_to_hdu(catalog[start:start+chunk_size]).data
+            for colname in chunk.names:
+                _fill_column(data, colname, slice(start, start+chunk_size), chunk[colname])
+
+    logger.debug(f'write_catalog :: Wrote {len(catalog)} rows to {path} ({time() - tstart:2.3f}s)')
+
+def _extend_catalog(path, columns, chunk_size=conf.CATALOG_CHUNK_SIZE):
+    """ Rewrites the catalog file with the extra (empty) fits.Columns, copying the existing table chunk by chunk """
+    tstart = time()
+    path_tmp = path + '.tmp'
+    with fits.open(path, memmap=True) as hdul:
+        old_data = hdul[1].data
+        n_rows = hdul[1].header['NAXIS2']
+        coldefs = hdul[1].columns + fits.ColDefs(columns)
+        table_header = fits.BinTableHDU.from_columns(coldefs, header=hdul[1].header, nrows=0).header
+        table_header['NAXIS2'] = n_rows
+        config_header = hdul['CONFIG'].header if 'CONFIG' in hdul else None
+        _allocate_catalog(path_tmp, table_header, config_header)
+
+        with fits.open(path_tmp, mode='update', memmap=True) as hdul_new:
+            data = hdul_new[1].data
+            for start in np.arange(0, n_rows, chunk_size):
+                for colname in old_data.names:
+                    _fill_column(data, colname, slice(start, start+chunk_size), old_data[colname][start:start+chunk_size])
+            # New logical columns start out False rather than NULL
+            for column in columns:
+                if column.format.endswith('L'):
+                    _fill_column(data, column.name, slice(None), False)
+    os.replace(path_tmp, path)
+
+    logger.debug(f'_extend_catalog :: Added {len(columns)} columns to {path} ({time() - tstart:2.3f}s)')
+
+def insert_catalog(path, newcat, key='source_id', config_cards=None, reserve=None, chunk_size=conf.CATALOG_CHUNK_SIZE):
+    """ Scatter the rows of newcat into the catalog file at path, in place, matched on key (as merge_catalog).
+    Columns newcat brings for the first time need the table to be rewritten once. Any reserve columns, given as
+    {new name: name of a newcat column to copy the format of}, are added in that same pass and left as zeros,
+    so that later insertions into them are in place too. config_cards are set in the CONFIG header. """
+    tstart = time()
+    with fits.open(path, memmap=True) as hdul:
+        colnames = hdul[1].columns.names
+
+    newcols = [colname for colname in newcat.colnames if colname not in colnames]
+    if len(newcols) > 0:
+        # Scalars get (1,)-shaped columns, as the brick catalogs use
+        template = newcat[:0][newcols]
+        for colname in newcols:
+            if np.ndim(template[colname]) == 1:
+                template[colname] = np.reshape(template[colname], (0, 1))
+        formats = fits.table_to_hdu(template).columns
+        columns = [formats[colname].copy() for colname in newcols]
+        if reserve is not None:
+            for colname, template in reserve.items():
+                if (colname not in colnames) & (colname not in newcols) & (template in newcols):
+                    column = formats[template].copy()
+                    column.name = colname
+                    columns.append(column)
+        logger.info(f'Rewriting {path} once to add {len(columns)} new columns')
+        _extend_catalog(path, columns, chunk_size)
+
+    with fits.open(path, mode='update', memmap=True) as hdul:
+        data = hdul[1].data
+        idx, found = match_rows(data[key], newcat[key], key)
+        values = fits.table_to_hdu(newcat[found]).data
+        for colname in newcat.colnames:
+            _fill_column(data, colname, idx, values[colname])
+        if config_cards is not None:
+            for keyword, card in config_cards.items():
+                hdul['CONFIG'].header.set(keyword, *card)
+
+    logger.debug(f'insert_catalog :: Inserted {len(idx)} rows into {path} ({time() - tstart:2.3f}s)')
+
+def reserve_band_columns(colnames, bands, all_bands=conf.BANDS):
+    """ Columns the other bands of all_bands will need, guessed from the columns written for bands, as
+    {new name: column it is patterned on}. Band names are only matched as whole '_'-separated tokens. """
+    bands = [band.replace(' ', '_') for band in bands]
+    all_bands = [band.replace(' ', '_') for band in all_bands]
+    reserve = {}
+    for colname in colnames:
+        # The longest band that matches wins, so that e.g. 'g' is not found inside 'hsc_g'
+        matches = [(len(band), band, m) for band in all_bands for m in [re.search(rf'(^|_){re.escape(band)}(_|$)', colname)] if m is not None]
+        if len(matches) == 0:
+            continue
+        __, band, m = max(matches, key=lambda match: match[0])
+        if band not in bands:
+            continue
+        for other in all_bands:
+            if other not in bands:
+                reserve[colname[:m.start()] + m.group(1) + other + m.group(2) + colname[m.end():]] = colname
+    return reserve
+
 def create_circular_mask(h, w, center=None, radius=None):
 
     if center is None: # use the middle of the image
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+""" The tests import the pipeline as src.core.*, with config.py found the same way as the pipeline does.
+Run them from the repository root with: python -m pytest src/tests """
+
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'config'))
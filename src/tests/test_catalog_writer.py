@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+""" Tests of the streaming catalog writer (utils.write_catalog, insert_catalog, reserve_band_columns) """
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table, Column
+
+from src.core.utils import write_catalog, insert_catalog, reserve_band_columns
+
+
+def make_catalog(n_sources=25, seed=1234):
+    rng = np.random.RandomState(seed)
+    catalog = Table()
+    catalog['source_id'] = np.arange(n_sources) + 100
+    catalog['SOLMODEL'] = Column(rng.choice(['PointSource', 'ExpGalaxy'], n_sources).astype('S20'))
+    catalog['FLUX_hsc_i'] = Column(rng.normal(size=(n_sources, 1)))
+    catalog['FLUXERR_hsc_i'] = Column(rng.uniform(size=(n_sources, 1)))
+    catalog['APER_hsc_i'] = Column(rng.normal(size=(n_sources, 5)))
+    catalog['VALID_SOURCE_hsc_i'] = Column(rng.uniform(size=(n_sources, 1)) > 0.5)
+    return catalog
+
+
+def assert_same_columns(table, catalog):
+    for colname in catalog.colnames:
+        assert np.array_equal(table[colname], catalog[colname]), colname
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 25, 1000])
+def test_write_catalog_round_trip(tmp_path, chunk_size):
+    catalog = make_catalog()
+    config_header = fits.Header()
+    config_header['BANDS'] = 'hsc_i'
+    path = str(tmp_path / 'B1.cat')
+
+    write_catalog(path, catalog, config_header=config_header, chunk_size=chunk_size)
+
+    with fits.open(path) as hdul:
+        assert [hdu.name for hdu in hdul][2] == 'CONFIG'
+        assert hdul['CONFIG'].header['BANDS'] == 'hsc_i'
+        assert hdul[1].header['NAXIS2'] == len(catalog)
+    table = Table.read(path, hdu=1)
+    assert table.colnames == catalog.colnames
+    assert_same_columns(table, catalog)
+
+
+def test_write_catalog_no_overwrite(tmp_path):
+    path = str(tmp_path / 'B1.cat')
+    write_catalog(path, make_catalog())
+    with pytest.raises(OSError):
+        write_catalog(path, make_catalog())
+    write_catalog(path, make_catalog(seed=1), overwrite=True)
+    assert_same_columns(Table.read(path, hdu=1), make_catalog(seed=1))
+
+
+def forced_catalog(catalog, band, rows, seed=1):
+    rng = np.random.RandomState(seed)
+    newcat = Table()
+    newcat['source_id'] = catalog['source_id'][rows]
+    newcat[f'FLUX_{band}'] = rng.normal(size=len(rows))
+    newcat[f'VALID_SOURCE_{band}'] = np.ones(len(rows), dtype=bool)
+    return newcat
+
+
+def test_insert_catalog_adds_new_band(tmp_path):
+    catalog = make_catalog()
+    path = str(tmp_path / 'B1.cat')
+    write_catalog(path, catalog)
+    rows = np.array([20, 3, 11, 0])
+    newcat = forced_catalog(catalog, 'hsc_z', rows)
+
+    insert_catalog(path, newcat, config_cards={'BANDS': ('hsc_i,hsc_z', 'Bands')}, chunk_size=4)
+
+    with fits.open(path) as hdul:
+        data = hdul[1].data
+        assert hdul['CONFIG'].header['BANDS'] == 'hsc_i,hsc_z'
+        assert data['FLUX_hsc_z'].shape == (len(catalog), 1)
+        assert np.array_equal(data['FLUX_hsc_z'][rows, 0], newcat['FLUX_hsc_z'])
+        others = np.setdiff1d(np.arange(len(catalog)), rows)
+        assert np.all(data['FLUX_hsc_z'][others] == 0)
+        assert data['VALID_SOURCE_hsc_z'][rows].all()
+        # False, not NULL, where no value was inserted
+        assert np.all(data.view(np.ndarray)['VALID_SOURCE_hsc_z'][others] == ord('F'))
+    # The existing columns survive the rewrite
+    assert_same_columns(Table.read(path, hdu=1), catalog)
+
+
+def test_insert_catalog_fills_reserved_columns_in_place(tmp_path):
+    catalog = make_catalog()
+    path = str(tmp_path / 'B1.cat')
+    write_catalog(path, catalog)
+    rows = np.arange(5)
+    first = forced_catalog(catalog, 'hsc_z', rows)
+    reserve = reserve_band_columns(first.colnames, ['hsc_z'], ['hsc_z', 'hsc_y'])
+    insert_catalog(path, first, reserve=reserve)
+
+    with fits.open(path) as hdul:
+        assert 'FLUX_hsc_y' in hdul[1].columns.names
+        n_bytes = hdul[1].header['NAXIS1']
+
+    second = forced_catalog(catalog, 'hsc_y', rows, seed=2)
+    insert_catalog(path, second)
+
+    with fits.open(path) as hdul:
+        data = hdul[1].data
+        assert hdul[1].header['NAXIS1'] == n_bytes
+        assert np.array_equal(data['FLUX_hsc_y'][rows, 0], second['FLUX_hsc_y'])
+        assert np.array_equal(data['FLUX_hsc_z'][rows, 0], first['FLUX_hsc_z'])
+
+
+def test_reserve_band_columns_matches_whole_bands():
+    colnames = ['source_id', 'FLUX_hsc_g', 'MAG_g', 'CHISQ_hsc_g_x', 'gaia_ID']
+    reserve = reserve_band_columns(colnames, ['hsc_g'], ['g', 'hsc_g', 'hsc_r'])
+    assert reserve == {'FLUX_g': 'FLUX_hsc_g', 'FLUX_hsc_r': 'FLUX_hsc_g',
+                       'CHISQ_g_x': 'CHISQ_hsc_g_x', 'CHISQ_hsc_r_x': 'CHISQ_hsc_g_x'}
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+""" Tests of the per-blob checkpoints that let an interrupted brick resume (interface.read_checkpoint, run_blobs) """
+
+import os
+import pickle
+import numpy as np
+import pytest
+
+from src.core import interface
+
+
+@pytest.fixture
+def serial(monkeypatch):
+    monkeypatch.setattr(interface.conf, 'NTHREADS', 0)
+    monkeypatch.setattr(interface, '_shared_pool', None)
+    monkeypatch.setattr(interface, '_survey_stats', None)
+
+
+def write_checkpoint(path, blob_ids, tag, records):
+    with open(path, 'wb') as f:
+        pickle.dump((blob_ids, tag), f, protocol=pickle.HIGHEST_PROTOCOL)
+        for record in records:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def test_read_checkpoint_missing_file(tmp_path):
+    assert interface.read_checkpoint(str(tmp_path / 'none.pkl'), np.arange(3), 'g') == {}
+
+
+def test_read_checkpoint_returns_finished_blobs(tmp_path):
+    path = str(tmp_path / 'B1_MODELING_CHECKPOINT.pkl')
+    write_checkpoint(path, np.arange(1, 5), 'g', [(3, 'rows 3'), (1, 'rows 1')])
+    assert interface.read_checkpoint(path, np.arange(1, 5), 'g') == {3: 'rows 3', 1: 'rows 1'}
+
+
+@pytest.mark.parametrize('blob_ids, tag', [(np.arange(1, 5), 'r'), (np.arange(1, 6), 'g')])
+def test_read_checkpoint_replaces_other_runs(tmp_path, blob_ids, tag):
+    path = str(tmp_path / 'B1_MODELING_CHECKPOINT.pkl')
+    write_checkpoint(path, np.arange(1, 5), 'g', [(3, 'rows 3')])
+    assert interface.read_checkpoint(path, blob_ids, tag) == {}
+    assert not os.path.exists(path)
+
+
+def test_read_checkpoint_drops_incomplete_record(tmp_path):
+    path = str(tmp_path / 'B1_MODELING_CHECKPOINT.pkl')
+    write_checkpoint(path, np.arange(1, 5), 'g', [(1, 'rows 1'), (2, 'rows 2')])
+    good_size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(pickle.dumps((3, 'rows 3'), protocol=pickle.HIGHEST_PROTOCOL)[:-4])
+
+    assert interface.read_checkpoint(path, np.arange(1, 5), 'g') == {1: 'rows 1', 2: 'rows 2'}
+    # Cut back to the last good record, so that the next one appended can be read
+    assert os.path.getsize(path) == good_size
+    with open(path, 'ab') as f:
+        pickle.dump((3, 'rows 3'), f, protocol=pickle.HIGHEST_PROTOCOL)
+    assert interface.read_checkpoint(path, np.arange(1, 5), 'g') == {1: 'rows 1', 2: 'rows 2', 3: 'rows 3'}
+
+
+def test_run_blobs_resumes_from_checkpoint(tmp_path, serial):
+    path = str(tmp_path / 'B1_MODELING_CHECKPOINT.pkl')
+    blob_ids = np.arange(1, 7)
+
+    def dies_at_4(blob_id):
+        if blob_id == 4:
+            raise RuntimeError('Killed')
+        return f'rows {blob_id}'
+
+    with pytest.raises(RuntimeError):
+        interface.run_blobs(dies_at_4, blob_ids, checkpoint=path, tag='g')
+    assert interface.read_checkpoint(path, blob_ids, 'g') == {1: 'rows 1', 2: 'rows 2', 3: 'rows 3'}
+
+    dispatched = []
+
+    def runs(blob_id):
+        dispatched.append(blob_id)
+        return f'rows {blob_id}'
+
+    output_rows = interface.run_blobs(runs, blob_ids, checkpoint=path, tag='g')
+    assert dispatched == [4, 5, 6]
+    assert output_rows == [f'rows {blob_id}' for blob_id in blob_ids]
+
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+""" Tests of the linear flux solve of frozen forced photometry (blob.clip_patch, patch_normal_equations,
+solve_normal_equations) """
+
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+from src.core.blob import clip_patch, patch_normal_equations, solve_normal_equations
+
+
+def gaussian_patch(x, y, sigma=2., half=6):
+    yy, xx = np.mgrid[-half:half+1, -half:half+1]
+    pixels = np.exp(-0.5 * (xx**2 + yy**2) / sigma**2)
+    return SimpleNamespace(patch=pixels / pixels.sum(), x0=x - half, y0=y - half)
+
+
+def full_image(clipped, shape):
+    image = np.zeros(shape)
+    ylo, yhi, xlo, xhi, pixels = clipped
+    image[ylo:yhi, xlo:xhi] = pixels
+    return image
+
+
+def test_clip_patch_edges():
+    patch = gaussian_patch(1, 28)
+    ylo, yhi, xlo, xhi, pixels = clip_patch(patch, (30, 20))
+    assert (ylo, yhi, xlo, xhi) == (22, 30, 0, 8)
+    assert np.array_equal(pixels, patch.patch[:8, 5:])
+    assert clip_patch(gaussian_patch(40, 10), (30, 20)) is None
+    assert clip_patch(None, (30, 20)) is None
+    assert clip_patch(SimpleNamespace(patch=None, x0=0, y0=0), (30, 20)) is None
+
+
+def test_linear_solve_matches_dense_least_squares():
+    shape = (40, 50)
+    rng = np.random.RandomState(1234)
+    # Overlapping sources, one cut by the edge and one off the image
+    patches = [clip_patch(gaussian_patch(x, y), shape) for x, y in [(10, 12), (14, 15), (47, 38), (80, 10)]]
+    truth = np.array([100., 40., 70., 0.])
+    invvar = rng.uniform(0.5, 2., size=shape)
+    models = [np.zeros(shape) if p is None else full_image(p, shape) for p in patches]
+    data = np.sum([f * m for f, m in zip(truth, models)], axis=0) + rng.normal(size=shape) / np.sqrt(invvar)
+
+    fisher, bvec, psum = patch_normal_equations(patches, data, invvar)
+    assert np.allclose(psum[:3], [p[4].sum() for p in patches[:3]])
+    assert psum[3] == 0
+
+    on = [0, 1, 2]
+    flux, covar = solve_normal_equations(fisher[np.ix_(on, on)], bvec[on])
+    design = np.array([models[i].ravel() for i in on]).T * np.sqrt(invvar.ravel())[:, None]
+    expected, *__ = np.linalg.lstsq(design, data.ravel() * np.sqrt(invvar.ravel()), rcond=None)
+    assert np.allclose(flux, expected)
+    assert np.allclose(covar, np.linalg.inv(design.T @ design))
+
+
+def test_solve_normal_equations_singular():
+    # The same source twice cannot be told apart
+    patch = clip_patch(gaussian_patch(10, 10), (20, 20))
+    fisher, bvec, __ = patch_normal_equations([patch, patch], np.ones((20, 20)), np.ones((20, 20)))
+    with pytest.raises(np.linalg.LinAlgError):
+        solve_normal_equations(fisher, bvec)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Tests of the keyed merge of blob results into the brick catalog (utils.match_rows, utils.merge_catalog) """
+
+import numpy as np
+from astropy.table import Table, Column
+
+from src.core.utils import match_rows, merge_catalog
+
+
+def make_catalog(n_sources=20):
+    catalog = Table()
+    catalog['source_id'] = np.arange(n_sources) * 3 + 7
+    catalog['FLUX'] = Column(np.zeros((n_sources, 1)))
+    catalog['MAG'] = np.zeros(n_sources)
+    catalog['VALID'] = np.zeros(n_sources, dtype=bool)
+    return catalog
+
+
+def test_match_rows_finds_shuffled_keys():
+    keys = np.array([40, 10, 30, 20])
+    idx, found = match_rows(keys, np.array([20, 40, 10]))
+    assert found.all()
+    assert np.array_equal(keys[idx], [20, 40, 10])
+
+
+def test_match_rows_skips_missing_keys():
+    keys = np.array([40, 10, 30, 20])
+    idx, found = match_rows(keys, np.array([5, 30, 99, 10, 50]))
+    assert np.array_equal(found, [False, True, False, True, False])
+    assert np.array_equal(keys[idx], [30, 10])
+
+
+def test_match_rows_empty_catalog():
+    idx, found = match_rows(np.array([], dtype=int), np.array([1, 2]))
+    assert len(idx) == 0
+    assert not found.any()
+
+
+def test_merge_catalog_scatters_by_source_id():
+    catalog = make_catalog()
+    rng = np.random.RandomState(1234)
+    rows = rng.permutation(len(catalog))[:12]
+    newcat = Table()
+    newcat['source_id'] = catalog['source_id'][rows]
+    newcat['FLUX'] = rng.normal(size=len(rows))         # scalars into a (1,)-shaped column
+    newcat['MAG'] = rng.normal(size=len(rows))
+    newcat['VALID'] = np.ones(len(rows), dtype=bool)
+    newcat['EXTRA'] = np.ones(len(rows))                # not in the catalog, so ignored
+
+    merge_catalog(catalog, newcat)
+
+    assert 'EXTRA' not in catalog.colnames
+    assert np.array_equal(catalog['FLUX'][rows, 0], newcat['FLUX'])
+    assert np.array_equal(catalog['MAG'][rows], newcat['MAG'])
+    assert catalog['VALID'][rows].all()
+    untouched = np.setdiff1d(np.arange(len(catalog)), rows)
+    assert np.all(catalog['MAG'][untouched] == 0)
+    assert not catalog['VALID'][untouched].any()
+
+
+def test_merge_catalog_skips_unknown_sources():
+    catalog = make_catalog(5)
+    newcat = Table()
+    newcat['source_id'] = [catalog['source_id'][2], 1000]
+    newcat['MAG'] = [1., 2.]
+
+    merge_catalog(catalog, newcat)
+
+    assert np.array_equal(catalog['MAG'], [0, 0, 1., 0, 0])
@@ -6,6 +6,7 @@ sys.path.insert(0, os.path.join('/n07data/weaver/COSMOS2020/config'))
 import config as conf
 
 from src.core import interface
+interface.init()
 
 def walk_through_files(path, file_prefix = 'B', file_extension='.fits'):
     """
@@ -52,8 +53,7 @@ masked_area = dict(zip(bands, [np.zeros(len(brick_id)) for i in np.arange(len(ba
 for band in bands:
     if MODELING:
         band = f'{conf.MODELING_NICKNAME}_{band}'
-    for i, bid in enumerate(brick_id):
-        good_area[band][i], masked_area[band][i] = interface.estimate_effective_area(brick_id=bid,  band=band)
+    good_area[band], masked_area[band] = interface.estimate_effective_areas(brick_id, band=band) # EFFAREA_NTHREADS processes
 
     good_area_deg = good_area[band].sum() * (conf.PIXEL_SCALE/3600)**2
     masked_area_deg = masked_area[band].sum() * (conf.PIXEL_SCALE/3600)**2
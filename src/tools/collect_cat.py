@@ -10,9 +10,17 @@ About
 -----
 Master catalog
 
+The headers of the brick catalogs are read first, to size the master catalog once. Each
+brick catalog is then read (in parallel if asked), rid of duplicate sources and copied into
+its rows, so collecting takes time in proportion to the total number of rows.
+
+Usage:
+    python collect_cat.py <catalog_dir> <catalog_suffix> [nthreads]
+
 Known Issues
 ------------
-None
+Columns missing from some bricks are masked there. The first brick with a column sets its
+type, other than string widths, which are taken as the widest of all the headers.
 
 
 """
@@ -23,9 +31,11 @@ None
 
 import os
 import sys
+import time
 import numpy as np
-from astropy.table import Table, vstack
+from astropy.table import Table, Column, MaskedColumn
 from astropy.io import ascii, fits
+import pathos as pa
 
 
 # ------------------------------------------------------------------------------
@@ -35,6 +45,7 @@ out_dir = sys.argv[1]
 
 cat_prefix = 'B'
 cat_suffix = sys.argv[2]
+nthreads = int(sys.argv[3]) if len(sys.argv) > 3 else 0     # processes reading brick catalogs (0 is serial)
 overwrite = True
 
 import logging
@@ -51,94 +62,133 @@ def walk_through_files(path, file_prefix = 'B', file_extension='.fits'):
     return output
 
 
-nsources = 0
-skip_count = 0
-total_count = 0
-first_stack = True
-for i, fname in enumerate(walk_through_files(out_dir, cat_prefix, cat_suffix)):
+def unique_ids(brick_ids, source_ids):
+    """
+    One integer per source, with the brick id packed above the lower 32 bits and the source id in them
+    """
+    return (np.asarray(brick_ids, dtype=np.int64) << 32) | (np.asarray(source_ids, dtype=np.int64) & 0xFFFFFFFF)
 
-    print('addding {}'.format(fname))
-    # if '/' in fname[2:]:
-    #     print('')
-    #     continue
 
-    
+def read_header(fname):
+    """
+    Number of rows, column names and string widths of a brick catalog, without reading its data
+    """
+    try:
+        with fits.open(fname, memmap=True) as hdul:
+            header, dtype = hdul[1].header, hdul[1].columns.dtype
+            widths = {name: dtype[name].base.itemsize for name in dtype.names if dtype[name].base.kind == 'S'}
+            return header['NAXIS2'], dtype.names, widths
+    except:
+        return None
+
+
+def read_catalog(fname):
+    """
+    Brick catalog rid of its duplicate sources, or None with the reason it cannot be used
+    """
     try:
         cat = Table.read(fname, 1, memmap=True)
-        total_count += 1
     except:
-        print('COULD NOT READ FILE.')
-        continue
-    
-    if i == 0:
-        hdu_info = fits.open(fname)['CONFIG']
+        return fname, None, 'COULD NOT READ FILE.'
 
     if (cat['SOLMODEL_MODELING']=='').all():
-        print('BAD SOL MODEL. SKIPPING.')
-        skip_count += 1
-        continue
+        return fname, None, 'BAD SOL MODEL. SKIPPING.'
 
-    id = np.array([f'{bid}_{sid}' for bid, sid in zip(cat['brick_id'], cat['source_id'])])
+    id = unique_ids(cat['brick_id'], cat['source_id'])
     uniq, idx_unique, counts = np.unique(id,  return_index=True, return_counts=True)
-    print(f'Found {len(uniq)} unique entires. ({len(uniq)/len(cat)*100:3.3f}%)')
-    print(f'removing {np.sum(counts>1)} non-unique sources. ({np.sum(np.isin(id, uniq[counts>1]))} entires!)')
-    cat = cat[idx_unique]
-
-    # for band in conf.BANDS:
-
-    #     cat[f'MAG_{band}'] = cat[f'MAG_{band}'][:, 0]
-    #     cat[f'MAGERR_{band}'] = cat[f'MAGERR_{band}'][:, 0]
-    #     cat[f'FLUX_{band}'] = cat[f'FLUX_{band}'][:, 0]
-    #     cat[f'FLUXERR_{band}'] = cat[f'FLUXERR_{band}'][:, 0]
-    #     cat[f'CHISQ_{band}'] = cat[f'CHISQ_{band}'][:, 0]
-
-        # print(cat[f'MAG_{band}'])
-
-        # for i in np.arange(len(cat)):
-        #     cat[f'MAG_{band}'][i] = cat[f'MAG_{band}'][i][0]
-        #     cat[f'MAGERR_{band}'][i] = cat[f'MAGERR_{band}'][i][0]
-        #     cat[f'FLUX_{band}'][i] = cat[f'FLUX_{band}'][i][0]
-        #     cat[f'FLUXERR_{band}'][i] = cat[f'FLUXERR_{band}'][i][0]
-        #     cat[f'CHISQ_{band}'][i] = cat[f'CHISQ_{band}'][i][0]
-
-        # cat[f'MAG_{band}'].dtype = float
-        # cat[f'MAGERR_{band}'].dtype = float
-        # cat[f'FLUX_{band}'].dtype = float
-        # cat[f'FLUXERR_{band}'].dtype = float
-        # cat[f'CHISQ_{band}'].dtype = float
-
-    # # FIX x AND Y
-    # brick_id = int(fname.split('/')[-1][:-4])
-    # H, W = (2000, 2000)
-    # dim_img = (50000, 50000)
-    # x0 = (((brick_id - 1) * W) % dim_img[0])
-    # y0 = int(((brick_id - 1) * H) / dim_img[1]) * H
-
-    # cat['x'] = cat['x'] + x0 - 74.5
-    # cat['y'] = cat['y']
-
-
-    nsources += len(cat)
-
-    if first_stack:
-        tab = cat
-        print('Stack started.')
-        first_stack = False
+    message = f'Found {len(uniq)} unique entires. ({len(uniq)/len(cat)*100:3.3f}%)\n' \
+              f'removing {np.sum(counts>1)} non-unique sources. ({np.sum(counts[counts>1])} entires!)'
+    return fname, cat[idx_unique], message
+
+
+def fill_rows(tab, cat, start, nrows, widths, partial):
+    """
+    Copies cat into rows start onwards of tab, adding any column seen for the first time with nrows rows
+    """
+    for name in cat.colnames:
+        col = cat[name]
+        if name not in tab.colnames:
+            dtype = col.dtype
+            if dtype.kind in 'SU':
+                dtype = np.dtype((dtype.kind, max(widths.get(name, 0), dtype.itemsize // (4 if dtype.kind == 'U' else 1))))
+            data = np.zeros((nrows,) + col.shape[1:], dtype=dtype)
+            attrs = dict(name=name, unit=col.unit, format=col.format, description=col.description, meta=col.meta)
+            if (name in partial) | isinstance(col, MaskedColumn):
+                tab.add_column(MaskedColumn(data, mask=(name in partial), **attrs))   # masked wherever a brick lacks it
+            else:
+                tab.add_column(Column(data, **attrs))
+        else:
+            dtype = tab[name].dtype
+            if dtype.kind not in 'SU':
+                dtype = np.result_type(dtype, col.dtype)
+            masked = isinstance(col, MaskedColumn) and not isinstance(tab[name], MaskedColumn)
+            if (dtype != tab[name].dtype) | masked:
+                column = MaskedColumn if (masked | isinstance(tab[name], MaskedColumn)) else Column
+                tab.replace_column(name, column(tab[name], dtype=dtype, copy=True))
+        tab[name][start:start+len(cat)] = col
+
+
+def collect(fnames, imap=map):
+    """
+    Master catalog of the brick catalogs in fnames, in one table sized from their headers
+    """
+    tstart = time.time()
+    headers = [header for header in imap(read_header, fnames) if header is not None]
+    nrows = np.sum([header[0] for header in headers], dtype=int)
+    widths, partial = {}, set()
+    allnames = set().union(*[names for __, names, __ in headers])
+    for __, names, header_widths in headers:
+        for name, width in header_widths.items():
+            widths[name] = max(width, widths.get(name, 0))
+        partial |= allnames - set(names)
+    print(f'Sized the master catalog from {len(headers)} headers: up to {nrows} rows. ({time.time() - tstart:3.3f}s)')
+
+    tab = Table()
+    hdu_info = None
+    nsources = 0
+    skip_count = 0
+    total_count = 0
+    for fname, cat, message in imap(read_catalog, fnames):
+
+        print('addding {}'.format(fname))
+        if message == 'COULD NOT READ FILE.':
+            print(message)
+            continue
+        total_count += 1
+
+        if hdu_info is None:
+            hdu_info = fits.open(fname)['CONFIG']
+
+        if cat is None:
+            print(message)
+            skip_count += 1
+            continue
+        print(message)
+
+        fill_rows(tab, cat, nsources, nrows, widths, partial)
+        nsources += len(cat)
+        del cat
+
+    print(f'Collected {nsources} sources. ({time.time() - tstart:3.3f}s)')
+    return tab[:nsources], hdu_info, nsources, skip_count, total_count
+
+
+if __name__ == '__main__':
+
+    fnames = walk_through_files(out_dir, cat_prefix, cat_suffix)
+    if nthreads > 1:
+        with pa.pools.ProcessPool(ncpus=nthreads) as pool:
+            tab, hdu_info, nsources, skip_count, total_count = collect(fnames, pool.imap)
     else:
-        try:
-            tab = vstack((tab, cat))
-            print('stack successful!')
-        except:
-            print('Failed to stack!')
-        
-    del cat
-    
-    
-
-outfname = 'master_catalog.fits'
-print('Writing {} sources to {}'.format(nsources, outfname))
-print(f'Skipped {skip_count}/{total_count} tiles.')
-
-hdu_table = fits.table_to_hdu(tab)
-hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
-hdul.writeto(os.path.join(out_dir, outfname), overwrite=overwrite)
+        tab, hdu_info, nsources, skip_count, total_count = collect(fnames)
+
+    if nsources == 0:
+        raise RuntimeError('No sources found!')
+
+    outfname = 'master_catalog.fits'
+    print('Writing {} sources to {}'.format(nsources, outfname))
+    print(f'Skipped {skip_count}/{total_count} tiles.')
+
+    hdu_table = fits.table_to_hdu(tab)
+    hdul = fits.HDUList([fits.PrimaryHDU(), hdu_table, hdu_info])
+    hdul.writeto(os.path.join(out_dir, outfname), overwrite=overwrite)